@@ -1,13 +1,73 @@
 """Main end-to-end testing script for fuzzing monerod RPC endpoints."""
 
 import argparse
+import json
+import multiprocessing
 import os
 import subprocess
 import signal
 import time
 import shutil
 
+import e2e_coverage
 import e2e_fuzzer
+import e2e_histogram
+import e2e_metrics
+import e2e_profdata
+import e2e_resources
+import e2e_results
+import e2e_scheduler
+import e2e_serialise
+import e2e_summary
+import e2e_timeouts
+import e2e_toolchain
+import e2e_trace
+import e2e_transport
+
+# Ports of monerod instance 0, instance N uses these plus 10 * N.
+MONEROD_P2P_PORT = 38080
+MONEROD_RPC_PORT = 38081
+MONEROD_ZMQ_PORT = 38082
+
+# Seconds to wait for monerod to answer RPC calls before giving up.
+MONEROD_STARTUP_TIMEOUT = 600
+
+# Seconds to give monerod to exit after a failed request, e.g. while ASan
+# writes its report, before treating the failure as a non-crash.
+CRASH_GRACE_PERIOD = 10
+# Number of requests leading up to a crash saved in its crash directory.
+CRASH_LAST_REQUESTS = 50
+
+# Requests per live coverage check, 0 to only collect coverage at the end
+# of the campaign. See e2e_coverage.
+coverage_batch = 0
+# Scheduler of every campaign, one of e2e_scheduler.SCHEDULERS, and the
+# per-generator weight limits of the bandit scheduler.
+scheduler_mode = 'uniform'
+scheduler_limits = {}
+# Picks and weights of the campaign's scheduler, merged over the workers
+# in --jobs mode, for func_call_count.log.
+scheduler_report = {}
+
+# Seconds between samples of monerod's resource usage, 0 for none. See
+# e2e_resources.
+resource_interval = 0
+
+# Port of the metrics endpoint of instance 0, instance N serves on this
+# plus N. None serves no metrics. See e2e_metrics.
+metrics_port = None
+
+# Directory stopped monerods' profraws are moved to, for the background
+# e2e_profdata.ProfileMerger. None leaves them in the workdir.
+finished_profiles_dir = None
+
+# Campaign level stats of this process, written to campaign_stats.json.
+campaign_stats = {
+    'monerod_startup_seconds': [],
+    'monerod_shutdown_seconds': [],
+    'monerod_restarts': 0,
+    'monerod_restart_seconds': [],
+}
 
 END_TO_END_BUILD_ADDITINS = """# End-to-end build script
 cd $SRC/monero/monero
@@ -22,7 +82,7 @@ git submodule update
 # Build monerod
 mkdir -p $SRC/monero/monero/build2
 cd $SRC/monero/monero/build2
-export CXXFLAGS="$CXXFLAGS --coverage -fprofile-instr-generate -fcoverage-mapping"
+export CXXFLAGS="$CXXFLAGS --coverage -fprofile-instr-generate -fcoverage-mapping -mllvm -runtime-counter-relocation"
 cmake -D OSSFUZZ=ON -D STATIC=ON -D BUILD_TESTS=ON -D USE_LTO=OFF -D SANITIZE=ON \
 -D ARCH="default" -DCMAKE_CXX_FLAGS="$CXXFLAGS" -DCMAKE_EXE_LINKER_FLAGS="--coverage" ..
 make -j$(nproc) -C src/daemon
@@ -95,74 +155,147 @@ def build_end_to_end_setup(ossfuzzdir: str, workdir: str, proj: str) -> str:
     return target_monerod_path
 
 
-def generate_coverage_html_report(workdir) -> str:
-    """Run llvm-cov to generate HTML coverage report. This done by
-    running coverage collection from inside the OSS-Fuzz docker build
-    image. As such, the monero docker container must be available."""
-    workdir = os.path.abspath(workdir)
-    coverage_dir = os.path.join(workdir, 'coverage')
+def generate_coverage_html_report(workdir, merged=False,
+                                  toolchain=None) -> str:
+    """Run llvm-cov to generate HTML coverage report. By default this is
+    done from inside the OSS-Fuzz docker build image, which fetches the
+    monero submodules first. As such, the monero docker container must be
+    available. A `toolchain` with a cached source tree works offline, and
+    one with a local LLVM install runs without Docker.
+    With `merged`, monerod.profdata already holds every profile and is
+    used as is, otherwise the profraws are merged into it first."""
+    toolchain = toolchain or e2e_toolchain.Toolchain(workdir)
+    coverage_dir = os.path.join(toolchain.workdir, 'coverage')
     os.makedirs(coverage_dir, exist_ok=True)
 
-    # Get current UID and GID for file ownership adjustment
-    uid = os.getuid()
-    gid = os.getgid()
-
-    # Define the command script that will be run inside the container
-    script = ('cd $SRC/monero/monero && '
-              'git submodule init && '
-              'git submodule update && '
-              'llvm-profdata merge -sparse $(find /data -name "*.profraw") '
-              '-o /data/monerod.profdata && '
-              'llvm-cov show '
-              '-format=html '
-              '-output-dir=/data/coverage '
-              '-Xdemangler c++filt '
-              '-instr-profile=/data/monerod.profdata '
-              '/data/monerod && '
-              f'chown -R {uid}:{gid} /data/coverage')
-
-    # Run coverage generation in docker image
-    command = [
-        'docker', 'run', '--rm', '-it', '-v', f'{workdir}:/data',
-        'gcr.io/oss-fuzz/monero', 'bash', '-c', script
-    ]
-
-    subprocess.check_call(command)
+    if not merged:
+        e2e_profdata.merge_all(toolchain)
+
+    setup = None
+    if toolchain.needs_submodules():
+        setup = (f'cd {e2e_toolchain.IMAGE_SOURCE_ROOT} && '
+                 'git submodule init && '
+                 'git submodule update')
+    demangler = []
+    if not toolchain.native or shutil.which('c++filt'):
+        demangler = ['-Xdemangler', 'c++filt']
+
+    toolchain.run('llvm-cov', [
+        'show', '-format=html', f'-output-dir={toolchain.path("coverage")}',
+        *demangler, f'-instr-profile={toolchain.path(e2e_profdata.PROFDATA)}',
+        *toolchain.coverage_args(),
+        toolchain.path('monerod')
+    ],
+                  setup=setup,
+                  outputs=['coverage'])
 
     return coverage_dir
 
 
-def start_monerod(monerod_path, workdir, index):
-    """Starts the monerod process so it's ready for receiving RPC calls."""
-    # Set LLVM_PROFILE_FILE for coverage output
+def monerod_ports(instance):
+    """Returns the (p2p, rpc, zmq) ports of monerod instance `instance`."""
+    offset = 10 * instance
+    return (MONEROD_P2P_PORT + offset, MONEROD_RPC_PORT + offset,
+            MONEROD_ZMQ_PORT + offset)
+
+
+def fresh_data_dir(workdir, instance) -> str:
+    """Returns the data directory of monerod instance `instance` in a
+    campaign, emptied so the chain starts out like it does for
+    e2e_replay.py and e2e_minimise.py."""
+    data_dir = os.path.join(workdir, f'monerod-data{instance}')
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return data_dir
+
+
+def monerod_profile_path(workdir, index) -> str:
+    """Returns the path of the profraw monerod `index` writes."""
+    return os.path.join(workdir, f'monerod{index}.profraw')
+
+
+def start_monerod(monerod_path, workdir, index, instance=0, data_dir=None):
+    """Starts the monerod process so it's ready for receiving RPC calls.
+    `instance` selects the ports to bind and `data_dir` overrides the
+    default monerod data directory."""
+    # Set LLVM_PROFILE_FILE for coverage output, continuously updated if
+    # the fuzzer reads coverage while running.
     env = os.environ.copy()
-    env['LLVM_PROFILE_FILE'] = os.path.join(workdir, f'monerod{index}.profraw')
+    env['LLVM_PROFILE_FILE'] = monerod_profile_path(workdir, index)
+    if coverage_batch:
+        env['LLVM_PROFILE_FILE'] = e2e_coverage.profile_pattern(workdir, index)
 
     log_path = os.path.join(workdir, f'monerod{index}.log')
     log_file = open(log_path, 'w', encoding='utf-8')
 
+    p2p_port, rpc_port, zmq_port = monerod_ports(instance)
+    command = [
+        monerod_path, '--offline', '--regtest', '--rpc-bind-port',
+        str(rpc_port), '--p2p-bind-port',
+        str(p2p_port), '--zmq-rpc-bind-port',
+        str(zmq_port), '--confirm-external-bind', '--disable-rpc-ban'
+    ]
+    if data_dir:
+        os.makedirs(data_dir, exist_ok=True)
+        command.extend(['--data-dir', data_dir])
+
     # Start monerod in the foreground
-    print('Starting monerod')
-    monerod_proc = subprocess.Popen([
-        monerod_path, '--offline', '--regtest', '--rpc-bind-port', '38081',
-        '--confirm-external-bind', '--disable-rpc-ban'
-    ],
+    print(f'Starting monerod {index} on RPC port {rpc_port}')
+    t0 = time.monotonic()
+    monerod_proc = subprocess.Popen(command,
                                     env=env,
                                     stdout=log_file,
                                     stderr=log_file)
-    print('Sleeping 45 sec')
 
     # Wait for monerod initialise
-    time.sleep(45)
-    print('Done sleeping')
+    try:
+        wait_for_monerod(monerod_proc, rpc_port, log_path)
+    except RuntimeError:
+        stop_monerod(monerod_proc, log_file,
+                     monerod_profile_path(workdir, index))
+        raise
+    startup = time.monotonic() - t0
+    campaign_stats['monerod_startup_seconds'].append(startup)
+    print(f'Monerod ready after {startup:.1f} sec')
 
     return monerod_proc, log_file
 
 
-def stop_monerod(monerod_proc, log_file):
+def wait_for_monerod(monerod_proc, rpc_port, log_path,
+                     timeout=MONEROD_STARTUP_TIMEOUT):
+    """Polls get_info with backoff until monerod answers. Raises
+    RuntimeError if monerod exits first or does not answer in time."""
+    probe = e2e_transport.ConnectionPool('127.0.0.1', rpc_port, maxsize=1)
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    try:
+        while True:
+            returncode = monerod_proc.poll()
+            if returncode is not None:
+                raise RuntimeError(
+                    f'monerod exited with code {returncode} during startup, '
+                    f'see {log_path}')
+            try:
+                response = probe.post('/get_info', json_body={}, timeout=5)
+                if response.status_code == 200:
+                    return
+            except e2e_transport.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(
+                    f'monerod did not answer RPC calls within {timeout} sec, '
+                    f'see {log_path}')
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+    finally:
+        probe.close()
+
+
+def stop_monerod(monerod_proc, log_file, profile_path=None):
     """Stops the monerod process by first sending a SIGINT
-    and if it does not terminate, sending a SIGKILL."""
+    and if it does not terminate, sending a SIGKILL. Its profraw at
+    `profile_path`, if given, is then moved to finished_profiles_dir."""
     print('stopping monerod')
+    t0 = time.monotonic()
     if monerod_proc is not None and monerod_proc.poll() is None:
         print('sending SIGINT signal')
         # Try kill monerod by SIGINT first
@@ -176,14 +309,28 @@ def stop_monerod(monerod_proc, log_file):
             # Monerod failed to terminiate by SIGINT
             # Force killing the monerod
             monerod_proc.kill()
+            monerod_proc.wait()
+        campaign_stats['monerod_shutdown_seconds'].append(time.monotonic() -
+                                                          t0)
+
+    # The profile is complete once monerod has exited.
+    if (finished_profiles_dir and profile_path is not None and
+            os.path.exists(profile_path)):
+        os.replace(
+            profile_path,
+            os.path.join(finished_profiles_dir,
+                         os.path.basename(profile_path)))
 
     if log_file:
         log_file.close()
     print('Monerod stopped')
 
 
-def dump_called_functions(target_dir, results):
-    """Dump the functions called count to a file."""
+def dump_called_functions(target_dir, results, latency_histograms=None,
+                          scheduler_report=None):
+    """Dump the functions called count to a file, along with latency
+    percentiles from `latency_histograms` and scheduler picks and weights
+    from `scheduler_report` when given."""
     # The results is a dictionary where the key is the function name
     # and the value is a tuple of (success_count, fail_count).
     results = dict(
@@ -206,6 +353,394 @@ def dump_called_functions(target_dir, results):
             file.write(f'    Total: {success + fail}\n')
             file.write(f'    Success: {success}\n')
             file.write(f'    Fail: {fail}\n')
+            histogram = (latency_histograms or {}).get(func)
+            if histogram is not None and histogram.count:
+                latency = ' '.join(
+                    f'{name}={value:.6f}s'
+                    for name, value in histogram.summary().items())
+                file.write(f'    Latency: {latency}\n')
+            scheduling = (scheduler_report or {}).get(func)
+            if scheduling is not None:
+                file.write(f'    Scheduler: picks={scheduling["picks"]} '
+                           f'weight={scheduling["weight"]:.4f}\n')
+
+
+def dump_campaign_stats(target_dir, stats):
+    """Dump the campaign level stats, such as monerod startup and shutdown
+    latencies and the share of housekeeping traffic, to
+    campaign_stats.json."""
+    summary = {}
+    for name, values in stats.items():
+        if isinstance(values, list):
+            summary[name] = {
+                'count': len(values),
+                'total': sum(values),
+                'max': max(values, default=0),
+                'values': values,
+            }
+        else:
+            summary[name] = values
+
+    total_traffic = (summary.get('target_requests', 0) +
+                     summary.get('housekeeping_requests', 0))
+    if total_traffic:
+        summary['housekeeping_fraction'] = (summary['housekeeping_requests'] /
+                                            total_traffic)
+
+    if 'coverage_requests' in summary:
+        requests = summary['coverage_requests']
+        new_counters = summary['coverage_new_counters']
+        summary['coverage_requests_per_new_counter'] = {
+            name: count / new_counters[name] if new_counters.get(name) else None
+            for name, count in requests.items()
+        }
+        total_new = sum(new_counters.values())
+        summary['requests_per_new_counter'] = (sum(requests.values()) /
+                                               total_new if total_new else None)
+
+    if 'phase_seconds' in summary:
+        summary['phase_mean_us'] = {
+            phase: 1e6 * seconds / summary['phase_calls'][phase]
+            for phase, seconds in summary['phase_seconds'].items()
+        }
+
+    with open(os.path.join(target_dir, 'campaign_stats.json'),
+              'w',
+              encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+
+def _save_finding(workdir, log_dir, log_file, kind, instance, finding):
+    """Saves the monerod log, and `finding` along with the last requests
+    sent, into workdir/crashes/<kind>-<instance>-<n>. Returns the path."""
+    crashes_dir = os.path.join(workdir, 'crashes')
+    os.makedirs(crashes_dir, exist_ok=True)
+    crash_dir = os.path.join(
+        crashes_dir, f'{kind}-{instance}-{len(os.listdir(crashes_dir))}')
+    os.makedirs(crash_dir)
+
+    log_file.flush()
+    shutil.copy(log_file.name, crash_dir)
+
+    results = e2e_results.ResultsStore(
+        os.path.join(log_dir, e2e_results.RESULTS_DB))
+    last_requests = results.last(CRASH_LAST_REQUESTS)
+    results.close()
+
+    with open(os.path.join(crash_dir, 'crash.json'), 'w',
+              encoding='utf-8') as f:
+        json.dump(
+            {
+                'kind': kind,
+                'instance': instance,
+                'scheduler': e2e_fuzzer.scheduler.name,
+                **finding,
+                'next_iteration': e2e_fuzzer.progress['next_iteration'],
+                'last_requests': last_requests,
+            },
+            f,
+            indent=2)
+    print(f'Monerod {kind} saved to {crash_dir}')
+    return crash_dir
+
+
+def save_crash(workdir, log_dir, monerod_proc, log_file, seed, instance):
+    """Saves the monerod log and the last requests sent before monerod
+    died, or a request failed, into workdir/crashes. Returns the path."""
+    kind = 'crash' if monerod_proc.poll() is not None else 'failure'
+    return _save_finding(workdir, log_dir, log_file, kind, instance, {
+        'returncode': monerod_proc.returncode,
+        'campaign_seed': seed,
+    })
+
+
+def save_hang(workdir, log_dir, log_file, seed, instance, name,
+              request_seed, timeout):
+    """Saves a request that got no answer within `timeout` seconds, with
+    the monerod log and the requests leading up to it, into
+    workdir/crashes. Returns the path."""
+    return _save_finding(
+        workdir, log_dir, log_file, 'hang', instance, {
+            'campaign_seed': seed,
+            'hung_request': {
+                'name': name,
+                'seed': request_seed,
+                'timeout': timeout,
+            },
+        })
+
+
+def follow_coverage(workdir, log_dir, index):
+    """Points the fuzzer's coverage feedback at the profile of monerod
+    `index`, starting the feedback on the first call."""
+    if not coverage_batch:
+        return
+    if e2e_fuzzer.coverage is None:
+        e2e_fuzzer.coverage = e2e_coverage.CoverageFeedback(
+            os.path.join(log_dir, 'corpus'), coverage_batch,
+            e2e_fuzzer.reward_coverage)
+    e2e_fuzzer.coverage.set_profile(monerod_profile_path(workdir, index))
+
+
+def supervise_campaign(monerod_path, workdir, instance, rounds, need_debug,
+                       duration, concurrency, seed, data_dir=None,
+                       log_dir=None) -> dict[str, tuple[int, int]]:
+    """Runs a campaign against one monerod instance until `rounds` or
+    `duration` are used up. Whenever a request fails, the crash is saved
+    and monerod is restarted on a fresh profraw index and an emptied
+    `data_dir` before fuzzing resumes with the next iteration. monerod is
+    also polled between iterations, so a crash is noticed before the next
+    request. Hangs are saved as they happen."""
+    if seed is None:
+        seed = e2e_fuzzer.new_campaign_seed()
+    if log_dir is None:
+        log_dir = workdir
+    rpc_call_stats = {}
+    start_time = time.time()
+    restarts = 0
+    e2e_fuzzer.scheduler = e2e_scheduler.create(scheduler_mode, seed,
+                                                scheduler_limits)
+
+    # Index of the running monerod's log and profraw, bumped on restarts.
+    index = instance
+    monerod_proc, log_file = start_monerod(monerod_path, workdir, index,
+                                           instance, data_dir)
+    e2e_fuzzer.set_rpc_port(monerod_ports(instance)[1])
+    follow_coverage(workdir, log_dir, index)
+
+    def on_hang(name, request_seed, timeout):
+        save_hang(workdir, log_dir, log_file, seed, instance, name,
+                  request_seed, timeout)
+
+    e2e_fuzzer.hang_listener = on_hang
+    # Notices a dead monerod between iterations rather than through the
+    # next request failing. Follows monerod_proc across restarts.
+    e2e_fuzzer.target_alive = lambda: monerod_proc.poll() is None
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = e2e_metrics.MetricsServer(
+            e2e_metrics.CampaignMetrics(instance, rounds, duration,
+                                        campaign_stats),
+            metrics_port + instance)
+        metrics_server.start()
+    if resource_interval:
+        e2e_fuzzer.resources = e2e_resources.ResourceSampler(
+            monerod_proc.pid, data_dir, resource_interval)
+        e2e_fuzzer.resources.start()
+    try:
+        while True:
+            remaining = 0
+            if duration > 0:
+                remaining = duration - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+            rpc_call_stats = e2e_fuzzer.fuzz(
+                rounds,
+                workdir,
+                need_debug,
+                rpc_call_stats,
+                remaining,
+                concurrency,
+                log_dir=log_dir,
+                seed=seed,
+                start_iteration=e2e_fuzzer.progress['next_iteration'])
+            if not e2e_fuzzer.progress['failed']:
+                break
+
+            t0 = time.monotonic()
+            try:
+                monerod_proc.wait(timeout=CRASH_GRACE_PERIOD)
+            except subprocess.TimeoutExpired:
+                pass
+            # Saved even when it ends the campaign, e.g. on the last round.
+            save_crash(workdir, log_dir, monerod_proc, log_file, seed,
+                       instance)
+            if e2e_fuzzer.progress['next_iteration'] >= rounds:
+                break
+            stop_monerod(monerod_proc, log_file,
+                         monerod_profile_path(workdir, index))
+
+            restarts += 1
+            print(f'Restarting monerod {instance} (restart {restarts})')
+            if data_dir is not None:
+                # The crashed monerod's chain may be what crashed it, and a
+                # fresh one lets replays rebuild it from this iteration on.
+                shutil.rmtree(data_dir, ignore_errors=True)
+            # The new monerod has a new chain and no bans.
+            e2e_fuzzer.chain_state.invalidate()
+            e2e_fuzzer.ban_dirty = True
+            index = f'{instance}.{restarts}'
+            monerod_proc, log_file = start_monerod(monerod_path, workdir,
+                                                   index, instance, data_dir)
+            follow_coverage(workdir, log_dir, index)
+            if e2e_fuzzer.resources is not None:
+                e2e_fuzzer.resources.set_process(monerod_proc.pid)
+            campaign_stats['monerod_restarts'] += 1
+            campaign_stats['monerod_restart_seconds'].append(
+                time.monotonic() - t0)
+    finally:
+        e2e_fuzzer.target_alive = None
+        if e2e_fuzzer.resources is not None:
+            e2e_fuzzer.resources.stop()
+            e2e_fuzzer.resources.write(log_dir)
+            e2e_fuzzer.resources = None
+        stop_monerod(monerod_proc, log_file,
+                     monerod_profile_path(workdir, index))
+        if metrics_server is not None:
+            metrics_server.stop()
+    if e2e_trace.events is not None:
+        e2e_trace.write_chrome_trace(os.path.join(log_dir, 'trace.json'))
+    return rpc_call_stats
+
+
+def worker_config() -> dict:
+    """Returns the settings main() applied to this process, for --jobs
+    workers to apply with apply_worker_config. Workers are not
+    necessarily forked from this process, e.g. with the forkserver start
+    method."""
+    return {
+        'coverage_batch': coverage_batch,
+        'scheduler_mode': scheduler_mode,
+        'scheduler_limits': scheduler_limits,
+        'finished_profiles_dir': finished_profiles_dir,
+        'metrics_port': metrics_port,
+        'resource_interval': resource_interval,
+        'serialiser': e2e_serialise.backend,
+        'chain_cache_ttl': e2e_fuzzer.chain_state.ttl,
+        'bootstrap_toggle_rate': e2e_fuzzer.bootstrap_toggle_rate,
+        'timeouts': e2e_fuzzer.timeouts,
+        'check_liveness': e2e_fuzzer.check_liveness,
+        'trace': e2e_trace.enabled,
+        'chrome_trace': e2e_trace.events is not None,
+    }
+
+
+def apply_worker_config(config):
+    """Applies the settings returned by worker_config in a worker."""
+    global coverage_batch, scheduler_mode, scheduler_limits
+    global finished_profiles_dir, metrics_port, resource_interval
+    coverage_batch = config['coverage_batch']
+    scheduler_mode = config['scheduler_mode']
+    scheduler_limits = config['scheduler_limits']
+    finished_profiles_dir = config['finished_profiles_dir']
+    metrics_port = config['metrics_port']
+    resource_interval = config['resource_interval']
+    e2e_serialise.backend = config['serialiser']
+    e2e_fuzzer.chain_state.ttl = config['chain_cache_ttl']
+    e2e_fuzzer.bootstrap_toggle_rate = config['bootstrap_toggle_rate']
+    e2e_fuzzer.timeouts = config['timeouts']
+    e2e_fuzzer.check_liveness = config['check_liveness']
+    if config['trace']:
+        e2e_trace.enable(record_events=config['chrome_trace'])
+
+
+def run_fuzz_worker(worker_args):
+    """Fuzzes a dedicated monerod instance. Used as the per-process entry
+    point in --jobs mode, the results go to workdir/worker<instance>.
+    Returns the worker's call stats, campaign stats, latency histograms,
+    scheduler report and covered counters (an e2e_coverage bitmask, 0
+    without coverage feedback)."""
+    (monerod_path, workdir, instance, rounds, need_debug, duration,
+     concurrency, seed, config) = worker_args
+    apply_worker_config(config)
+
+    worker_dir = os.path.join(workdir, f'worker{instance}')
+    os.makedirs(worker_dir, exist_ok=True)
+    e2e_results.remove_store(os.path.join(worker_dir, e2e_results.RESULTS_DB))
+    data_dir = fresh_data_dir(workdir, instance)
+
+    rpc_call_stats = supervise_campaign(monerod_path, workdir, instance,
+                                        rounds, need_debug, duration,
+                                        concurrency, seed, data_dir,
+                                        worker_dir)
+    campaign_stats.update(e2e_fuzzer.get_campaign_stats())
+    covered = 0
+    if e2e_fuzzer.coverage is not None:
+        covered = e2e_fuzzer.coverage.covered
+    return (rpc_call_stats, campaign_stats, e2e_fuzzer.latency_histograms,
+            e2e_fuzzer.scheduler.report(), covered)
+
+
+def merge_worker_results(workdir, jobs, worker_stats):
+    """Sums the per-worker call stats and merges the per-worker results
+    databases into the one in the workdir. The campaign stats of the
+    workers are folded into this process's campaign_stats, their latency
+    histograms into e2e_fuzzer.latency_histograms and their scheduler
+    reports into scheduler_report. Covered counters are the union over
+    the workers, as several workers hit the same counters. Returns the
+    merged call stats. The resource samples of the workers are written
+    to the workdir too."""
+    global scheduler_report
+    rpc_call_stats = {}
+    scheduler_report = e2e_scheduler.merge_reports(
+        report for *_, report, _ in worker_stats)
+    covered = 0
+    for instance, (stats, worker_campaign_stats, histograms, _,
+                   worker_covered) in enumerate(worker_stats):
+        covered |= worker_covered
+        e2e_histogram.merge_histograms(e2e_fuzzer.latency_histograms,
+                                       histograms)
+        for func, (success, fail) in stats.items():
+            old_success, old_fail = rpc_call_stats.get(func, (0, 0))
+            rpc_call_stats[func] = (old_success + success, old_fail + fail)
+        for name, value in worker_campaign_stats.items():
+            if name == 'coverage_covered_counters':
+                campaign_stats.setdefault(
+                    'coverage_covered_counters_per_worker',
+                    {})[f'worker{instance}'] = value
+            elif isinstance(value, list):
+                campaign_stats.setdefault(name, []).extend(value)
+            elif isinstance(value, dict):
+                merged = campaign_stats.setdefault(name, {})
+                for key, count in value.items():
+                    merged[key] = merged.get(key, 0) + count
+            else:
+                campaign_stats[name] = campaign_stats.get(name, 0) + value
+
+    if 'coverage_covered_counters_per_worker' in campaign_stats:
+        campaign_stats['coverage_covered_counters'] = covered.bit_count()
+
+    results = e2e_results.ResultsStore(
+        os.path.join(workdir, e2e_results.RESULTS_DB))
+    for instance in range(jobs):
+        worker_db = os.path.join(workdir, f'worker{instance}',
+                                 e2e_results.RESULTS_DB)
+        if os.path.isfile(worker_db):
+            results.merge(worker_db, instance)
+    results.dump_slowest(os.path.join(workdir, 'rpc_calls_made_sorted.json'))
+    results.close()
+
+    if resource_interval:
+        e2e_resources.merge_samples([
+            os.path.join(workdir, f'worker{instance}')
+            for instance in range(jobs)
+        ], workdir)
+
+    return rpc_call_stats
+
+
+def fuzz_with_jobs(monerod_path, workdir, args) -> dict[str, tuple[int, int]]:
+    """Runs `args.jobs` workers in parallel, each with its own monerod
+    instance, and merges their results. The rounds are split evenly
+    between the workers, worker i uses campaign seed `args.seed + i`."""
+    seed = args.seed
+    if seed is None:
+        seed = e2e_fuzzer.new_campaign_seed()
+    config = worker_config()
+    worker_args = []
+    for instance in range(args.jobs):
+        rounds = args.round // args.jobs
+        if instance < args.round % args.jobs:
+            rounds += 1
+        worker_args.append(
+            (monerod_path, workdir, instance, rounds, args.debug,
+             args.duration, args.concurrency, (seed + instance) & 0x7FFFFFFF,
+             config))
+
+    with multiprocessing.Pool(args.jobs) as pool:
+        worker_stats = pool.map(run_fuzz_worker, worker_args)
+
+    return merge_worker_results(workdir, args.jobs, worker_stats)
 
 
 def parse_args():
@@ -235,21 +770,152 @@ def parse_args():
                         type=int,
                         default=0,
                         help='Seconds to fuzz in total')
+    parser.add_argument('--concurrency',
+                        type=int,
+                        default=1,
+                        help='Number of RPC requests kept in flight at once')
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help='Number of monerod instances to fuzz in parallel, '
+                        'each with its own worker process')
+    parser.add_argument('--chain-cache-ttl',
+                        type=float,
+                        default=10.0,
+                        help='Seconds the cached chain height and recent '
+                        'block hashes stay valid without a chain changing '
+                        'request')
+    parser.add_argument('--bootstrap-toggle-rate',
+                        type=float,
+                        default=0.1,
+                        help='Probability of setting or clearing the bootstrap '
+                        'daemon before a JSON request')
+    parser.add_argument('--seed',
+                        type=int,
+                        help='Campaign seed (below 2**31), random by default')
+    parser.add_argument('--coverage-feedback',
+                        action='store_true',
+                        help='Read coverage while fuzzing, keep requests that '
+                        'reach new code in a corpus and pick generators that '
+                        'stopped finding new code less often')
+    parser.add_argument('--coverage-batch',
+                        type=int,
+                        default=50,
+                        help='Requests between coverage reads with '
+                        '--coverage-feedback')
+    parser.add_argument('--merge-interval',
+                        type=float,
+                        default=300,
+                        help='Seconds between background merges of finished '
+                        'profraws into monerod.profdata, 0 to merge them all '
+                        'at the end')
+    parser.add_argument('--llvm-bin',
+                        help='Directory with llvm-cov and llvm-profdata to '
+                        'run natively instead of in the OSS-Fuzz image, they '
+                        'must match the clang monerod was built with')
+    parser.add_argument('--source-dir',
+                        help='Local monero checkout, with submodules, for the '
+                        'coverage reports. Avoids fetching the submodules in '
+                        'the OSS-Fuzz image on every report')
+    parser.add_argument('--coverage-sources',
+                        nargs='+',
+                        default=list(e2e_summary.SUMMARY_SOURCES),
+                        help='Source directories of the coverage summary')
+    parser.add_argument('--no-html',
+                        action='store_true',
+                        help='Only write the coverage summary, not the HTML '
+                        'report')
+    parser.add_argument('--scheduler',
+                        choices=e2e_scheduler.SCHEDULERS,
+                        help='How generators are picked: uniformly from the '
+                        'iteration seed, or weighted by coverage yield, '
+                        'failures found and latency (default: bandit with '
+                        '--coverage-feedback, else uniform)')
+    parser.add_argument('--scheduler-limits',
+                        help='JSON file mapping generator names to their '
+                        '[floor, ceiling] weight with --scheduler bandit')
+    parser.add_argument('--timeout-multiplier',
+                        type=float,
+                        default=e2e_timeouts.DEFAULT_MULTIPLIER,
+                        help='A request hangs after this many times the p99 '
+                        'latency of its generator')
+    parser.add_argument('--timeout-floor',
+                        type=float,
+                        default=e2e_timeouts.DEFAULT_FLOOR,
+                        help='Shortest request timeout in seconds')
+    parser.add_argument('--timeout-ceiling',
+                        type=float,
+                        default=e2e_timeouts.DEFAULT_CEILING,
+                        help='Longest request timeout in seconds')
+    parser.add_argument('--no-liveness-check',
+                        action='store_true',
+                        help='Go on after a hang without checking that '
+                        'monerod still answers')
+    parser.add_argument('--resource-interval',
+                        type=float,
+                        default=0,
+                        help='Seconds between samples of monerod\'s memory, '
+                        'CPU, threads, fds and database size (default: 0, '
+                        'not sampled)')
+    parser.add_argument('--metrics-port',
+                        type=int,
+                        help='Serve live campaign metrics in Prometheus '
+                        'format on http://127.0.0.1:PORT/metrics, worker N '
+                        'of --jobs on PORT + N')
+    parser.add_argument('--trace',
+                        action='store_true',
+                        help='Time the phases of every iteration, see '
+                        'e2e_trace')
+    parser.add_argument('--chrome-trace',
+                        action='store_true',
+                        help='Also write every timed phase to trace.json in '
+                        'Chrome trace-event format (implies --trace)')
+    parser.add_argument('--serialiser',
+                        choices=e2e_serialise.BACKENDS,
+                        default='exec',
+                        help='How binary endpoint requests are serialised: '
+                        'in-process, through long-lived monero_rpc_serialiser '
+                        'server processes, or by running it per request '
+                        '(default)')
     args = parser.parse_args()
     return args
 
 
 def main():
     """Main function to run the end-to-end fuzzing."""
+    global coverage_batch, finished_profiles_dir, scheduler_mode
+    global scheduler_limits, scheduler_report, metrics_port
+    global resource_interval
 
     args = parse_args()
 
     # Extract arguments
     abs_workdir = os.path.abspath(args.workdir)
 
+    e2e_serialise.backend = args.serialiser
+    e2e_fuzzer.chain_state.ttl = args.chain_cache_ttl
+    e2e_fuzzer.bootstrap_toggle_rate = args.bootstrap_toggle_rate
+    if args.coverage_feedback:
+        coverage_batch = args.coverage_batch
+    scheduler_mode = args.scheduler or ('bandit' if args.coverage_feedback
+                                        else 'uniform')
+    if args.scheduler_limits:
+        try:
+            scheduler_limits = e2e_scheduler.load_limits(
+                args.scheduler_limits,
+                [call.__name__ for call in e2e_fuzzer.get_rpc_calls()])
+        except ValueError as e:
+            raise SystemExit(f'--scheduler-limits: {e}')
+    e2e_fuzzer.timeouts = e2e_timeouts.TimeoutBudget(args.timeout_multiplier,
+                                                     args.timeout_floor,
+                                                     args.timeout_ceiling)
+    e2e_fuzzer.check_liveness = not args.no_liveness_check
+    metrics_port = args.metrics_port
+    resource_interval = args.resource_interval
+    if args.trace or args.chrome_trace:
+        e2e_trace.enable(record_events=args.chrome_trace)
+
     rpc_call_stats = {}
-    log_file = None
-    monerod_proc = None
 
     # Build and prepare monerod from OSS-Fuzz or reuse built monerod in workdir
     if args.not_rebuild_monerod:
@@ -258,22 +924,50 @@ def main():
         monerod_path = build_end_to_end_setup(os.path.abspath(args.oss_fuzz),
                                               abs_workdir, args.proj)
 
-    # Launch the monero server and start fuzzing.
-    monerod_proc, log_file = start_monerod(monerod_path, abs_workdir, 0)
-
-    # Perform the actual fuzzing.
-    rpc_call_stats = e2e_fuzzer.fuzz(args.round, abs_workdir, args.debug,
-                                     rpc_call_stats, args.duration)
-
-    # Ensure monerod is stopped
-    stop_monerod(monerod_proc, log_file)
+    # Results of an earlier campaign in the same workdir are discarded.
+    e2e_results.remove_store(os.path.join(abs_workdir, e2e_results.RESULTS_DB))
+
+    toolchain = e2e_toolchain.Toolchain(abs_workdir, args.llvm_bin,
+                                        args.source_dir)
+    merger = None
+    if args.merge_interval > 0:
+        e2e_profdata.reset(abs_workdir)
+        merger = e2e_profdata.ProfileMerger(abs_workdir, args.merge_interval,
+                                            toolchain)
+        finished_profiles_dir = merger.pending_dir
+        merger.start()
+
+    if args.jobs > 1:
+        # One monerod instance and worker process per job.
+        rpc_call_stats = fuzz_with_jobs(monerod_path, abs_workdir, args)
+    else:
+        # Launch the monero server and fuzz it, restarting it on crashes.
+        rpc_call_stats = supervise_campaign(monerod_path, abs_workdir, 0,
+                                            args.round, args.debug,
+                                            args.duration, args.concurrency,
+                                            args.seed,
+                                            fresh_data_dir(abs_workdir, 0))
+        campaign_stats.update(e2e_fuzzer.get_campaign_stats())
+        scheduler_report = e2e_fuzzer.scheduler.report()
 
     # Dumping functions called count.
-    dump_called_functions(abs_workdir, rpc_call_stats)
+    results = e2e_results.ResultsStore(
+        os.path.join(abs_workdir, e2e_results.RESULTS_DB))
+    dump_called_functions(abs_workdir, results.call_stats(rpc_call_stats),
+                          e2e_fuzzer.latency_histograms, scheduler_report)
+    results.close()
+    dump_campaign_stats(abs_workdir, campaign_stats)
 
     # Process coverage report
-    coverage_dir = generate_coverage_html_report(abs_workdir)
-    print(f'Coverage report available at: {coverage_dir}')
+    merged = merger is not None and merger.stop()
+    if not args.no_html:
+        coverage_dir = generate_coverage_html_report(abs_workdir, merged,
+                                                     toolchain)
+        print(f'Coverage report available at: {coverage_dir}')
+        merged = True
+    summary_path = e2e_summary.write_summary(toolchain,
+                                             args.coverage_sources, merged)
+    print(f'Coverage summary available at: {summary_path}')
     print('Finished end-to-end fuzzing!')
 
 
@@ -0,0 +1,411 @@
+"""Benchmarks for the fuzzing harness against a local monerod stand-in.
+
+The stand-in answers the JSON, JSON-RPC and .bin endpoints the fuzzer
+uses, after an optional artificial latency, so the harness overhead can be
+measured without building monerod. The suites cover the transport, the
+gen_random_* helpers, every send_* generator one request and one batch at
+a time, e2e_serialise.serialise and end-to-end fuzz() throughput. Results
+can be saved as JSON and compared with an earlier run to catch
+regressions."""
+
+import argparse
+import contextlib
+import http.client
+import http.server
+import io
+import json
+import platform
+import random
+import tempfile
+import threading
+import time
+
+import e2e_fuzzer
+import e2e_portable_storage
+import e2e_serialise
+import e2e_transport
+
+SUITES = ('transport', 'gen_random', 'generators', 'batches', 'serialise',
+          'fuzz')
+# Answer fields covering what the fuzzer reads back, e.g. getheight.
+STAND_IN_RESULT = {
+    'status': 'OK',
+    'height': 1024,
+    'hash': 'ab' * 32,
+    'headers': [{
+        'hash': 'cd' * 32
+    }, {
+        'hash': 'ef' * 32
+    }],
+    'untrusted': False,
+}
+# Portable storage section holding status "OK", for the .bin endpoints.
+STAND_IN_BIN_BODY = (e2e_portable_storage.PORTABLE_STORAGE_HEADER +
+                     e2e_portable_storage.pack_varint(1) + b'\x06status' +
+                     bytes([e2e_portable_storage.SERIALIZE_TYPE_STRING]) +
+                     e2e_portable_storage.pack_varint(2) + b'OK')
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Answers every POST over keep-alive HTTP/1.1 after `latency`
+    seconds: .bin endpoints with a portable storage body, /json_rpc with a
+    JSON-RPC result and every other endpoint with a small JSON body."""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+        content_type = 'application/json'
+        if self.path.endswith('.bin'):
+            body = STAND_IN_BIN_BODY
+            content_type = 'application/octet-stream'
+        elif self.path == '/json_rpc':
+            try:
+                request_id = json.loads(request).get('id', '0')
+            except (ValueError, AttributeError):
+                request_id = '0'
+            body = json.dumps({
+                'jsonrpc': '2.0',
+                'id': request_id,
+                'result': STAND_IN_RESULT
+            }).encode('utf-8')
+        else:
+            body = json.dumps(STAND_IN_RESULT).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in_server(port=0, latency=0.0):
+    """Starts the stand-in server in a background thread, answering after
+    `latency` seconds. Returns the server, use `server.server_address[1]`
+    to get the bound port."""
+    handler = type('StandInHandler', (StandInHandler,), {'latency': latency})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def post_new_connection(port, path, body):
+    """Sends one request on a fresh connection, like a bare requests.post."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('POST',
+                     path,
+                     body=json.dumps(body),
+                     headers={'Content-Type': 'application/json'})
+        return conn.getresponse().read()
+    finally:
+        conn.close()
+
+
+def bench_transport(port, count) -> dict:
+    """Measures requests/sec with and without connection reuse."""
+    body = {'jsonrpc': '2.0', 'id': '1', 'method': 'get_info', 'params': {}}
+    results = {}
+
+    t0 = time.perf_counter()
+    for _ in range(count):
+        post_new_connection(port, '/json_rpc', body)
+    results['new_connection_rps'] = count / (time.perf_counter() - t0)
+
+    try:
+        import requests
+        t0 = time.perf_counter()
+        for _ in range(count):
+            requests.post(f'http://127.0.0.1:{port}/json_rpc',
+                          json=body,
+                          timeout=30)
+        results['requests_post_rps'] = count / (time.perf_counter() - t0)
+    except ImportError:
+        pass
+
+    pool = e2e_transport.ConnectionPool('127.0.0.1', port)
+    t0 = time.perf_counter()
+    for _ in range(count):
+        pool.post('/json_rpc', json_body=body, timeout=30)
+    results['pooled_rps'] = count / (time.perf_counter() - t0)
+    results['pooled_connections'] = pool.stats()
+    pool.close()
+
+    return results
+
+
+def _calls_per_sec(func, count) -> float:
+    t0 = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - t0)
+
+
+def bench_gen_random(count) -> dict:
+    """Measures calls/sec of every gen_random_* helper, drawing from one
+    seeded entropy pool."""
+    e2e_fuzzer.entropy.seed(1)
+    return {
+        name: _calls_per_sec(getattr(e2e_fuzzer, name), count)
+        for name in sorted(dir(e2e_fuzzer)) if name.startswith('gen_random_')
+    }
+
+
+def bench_generators(port, count) -> dict:
+    """Measures requests/sec generated by every send_* generator, reseeded
+    before every request like a campaign. Generators asking for the chain
+    state query the stand-in whenever the cache expires."""
+    e2e_fuzzer.set_rpc_port(port)
+    results = {}
+    for rpc_call in e2e_fuzzer.get_rpc_calls():
+        counter = iter(range(count))
+
+        def generate(rpc_call=rpc_call, counter=counter):
+            e2e_fuzzer.entropy.seed(e2e_fuzzer.iteration_seed(1, next(counter)))
+            rpc_call()
+
+        results[rpc_call.__name__] = _calls_per_sec(generate, count)
+    return results
+
+
+def bench_batches(port, count, batch_size) -> dict:
+    """Measures requests/sec generated by every send_* generator in
+    batches of `batch_size` seeds, see e2e_fuzzer.generate_batch."""
+    e2e_fuzzer.set_rpc_port(port)
+    rpc_calls = e2e_fuzzer.get_rpc_calls()
+    results = {}
+    for rpc_call in rpc_calls:
+        seeds = [e2e_fuzzer.iteration_seed(1, i) for i in range(count)]
+        t0 = time.perf_counter()
+        for start in range(0, count, batch_size):
+            e2e_fuzzer.generate_batch(rpc_calls, rpc_call,
+                                      seeds[start:start + batch_size])
+        results[rpc_call.__name__] = count / (time.perf_counter() - t0)
+    return results
+
+
+def bench_serialise(count, workdir) -> dict:
+    """Measures serialisations/sec of random requests for every binary
+    endpoint with the current e2e_serialise backend."""
+    rng_state = random.getstate()
+    random.seed(1)
+    results = {}
+    for endpoint in e2e_portable_storage.REQUEST_SCHEMAS:
+        requests = [
+            e2e_serialise.random_request(endpoint) for _ in range(count)
+        ]
+        t0 = time.perf_counter()
+        for request in requests:
+            e2e_serialise.serialise(request, endpoint, workdir)
+        results[endpoint] = count / (time.perf_counter() - t0)
+    random.setstate(rng_state)
+    return results
+
+
+def bench_fuzz(port, count, concurrencies) -> dict:
+    """Measures end-to-end fuzz() iterations/sec at every concurrency, with
+    the fuzzer's output discarded."""
+    e2e_fuzzer.set_rpc_port(port)
+    results = {}
+    for concurrency in concurrencies:
+        e2e_fuzzer.chain_state.invalidate()
+        e2e_fuzzer.ban_dirty = True
+        with tempfile.TemporaryDirectory() as workdir:
+            with contextlib.redirect_stdout(io.StringIO()):
+                t0 = time.perf_counter()
+                e2e_fuzzer.fuzz(count, workdir, False, {}, 0, concurrency,
+                                seed=1)
+                elapsed = time.perf_counter() - t0
+        results[f'concurrency_{concurrency}'] = count / elapsed
+    return results
+
+
+def _flatten(results, prefix='') -> dict[str, float]:
+    """Maps the path of every number in nested benchmark results to it."""
+    flat = {}
+    for name, value in results.items():
+        path = f'{prefix}{name}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(old, new, tolerance) -> list[str]:
+    """Prints the change of every rate present in both results, higher is
+    better for all of them. Returns the rates that dropped by more than
+    `tolerance`, a fraction."""
+    old_rates = _flatten(old['benchmarks'])
+    new_rates = _flatten(new['benchmarks'])
+    regressions = []
+    for path in sorted(set(old_rates) & set(new_rates)):
+        if not old_rates[path]:
+            continue
+        change = new_rates[path] / old_rates[path] - 1
+        marker = ''
+        if change < -tolerance:
+            marker = '  REGRESSION'
+            regressions.append(path)
+        print(f'{path}: {old_rates[path]:.1f} -> {new_rates[path]:.1f} '
+              f'({100 * change:+.1f}%){marker}')
+    return regressions
+
+
+def parse_args():
+    """CLI interface for the benchmarks."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the e2e fuzzing harness')
+    parser.add_argument('--count',
+                        type=int,
+                        default=2000,
+                        help='Requests to send per transport benchmark')
+    parser.add_argument('--suites',
+                        nargs='+',
+                        choices=SUITES,
+                        default=list(SUITES),
+                        help='Benchmark suites to run')
+    parser.add_argument('--gen-random-count',
+                        type=int,
+                        default=20000,
+                        help='Calls per gen_random_* helper')
+    parser.add_argument('--generator-count',
+                        type=int,
+                        default=200,
+                        help='Requests generated per send_* generator')
+    parser.add_argument('--batch-size',
+                        type=int,
+                        default=50,
+                        help='Seeds per batch of the batches suite')
+    parser.add_argument('--serialise-count',
+                        type=int,
+                        default=2000,
+                        help='Requests serialised per binary endpoint')
+    parser.add_argument('--fuzz-count',
+                        type=int,
+                        default=2000,
+                        help='fuzz() iterations per concurrency')
+    parser.add_argument('--concurrency',
+                        type=int,
+                        nargs='+',
+                        default=[1, 8],
+                        help='Concurrencies to run fuzz() at')
+    parser.add_argument('--latency',
+                        type=float,
+                        default=0.0,
+                        help='Milliseconds the stand-in waits before every '
+                        'answer')
+    parser.add_argument('--serialiser',
+                        choices=e2e_serialise.BACKENDS,
+                        default='native',
+                        help='e2e_serialise backend to benchmark')
+    parser.add_argument('--workdir',
+                        default='./work',
+                        help='Directory holding monero_rpc_serialiser, for '
+                        'the server and exec backends')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare',
+                        help='Earlier results JSON to compare with, exits '
+                        'non-zero on regressions')
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=0.1,
+                        help='Drop of a rate, as a fraction, counted as a '
+                        'regression')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = start_stand_in_server(latency=args.latency / 1000)
+    port = server.server_address[1]
+    e2e_serialise.backend = args.serialiser
+
+    benchmarks = {}
+    if 'transport' in args.suites:
+        results = bench_transport(port, args.count)
+        for name, value in results.items():
+            if name.endswith('_rps'):
+                print(f'{name}: {value:.1f} requests/sec')
+        for conn_stats in results['pooled_connections']:
+            print('Connection %(id)d: %(requests)d requests, %(reuses)d '
+                  'reused, %(reconnects)d reconnects' % conn_stats)
+        benchmarks['transport'] = results
+    if 'gen_random' in args.suites:
+        benchmarks['gen_random'] = bench_gen_random(args.gen_random_count)
+        for name, rate in benchmarks['gen_random'].items():
+            print(f'{name}: {rate:.0f} calls/sec')
+    if 'generators' in args.suites:
+        benchmarks['generators'] = bench_generators(port,
+                                                    args.generator_count)
+        rates = sorted(benchmarks['generators'].items(),
+                       key=lambda item: item[1])
+        for name, rate in rates[:5]:
+            print(f'{name}: {rate:.0f} requests generated/sec')
+        print(f'... {len(rates)} generators, slowest first')
+    if 'batches' in args.suites:
+        benchmarks['batches'] = bench_batches(port, args.generator_count,
+                                              args.batch_size)
+        rates = sorted(benchmarks['batches'].items(),
+                       key=lambda item: item[1])
+        for name, rate in rates[:5]:
+            print(f'{name}: {rate:.0f} requests generated/sec in batches')
+        print(f'... {len(rates)} generators, slowest first')
+    if 'serialise' in args.suites:
+        benchmarks['serialise'] = bench_serialise(args.serialise_count,
+                                                  args.workdir)
+        for endpoint, rate in benchmarks['serialise'].items():
+            print(f'serialise {endpoint}: {rate:.0f} requests/sec')
+        e2e_serialise.close_pool()
+    if 'fuzz' in args.suites:
+        benchmarks['fuzz'] = bench_fuzz(port, args.fuzz_count,
+                                        args.concurrency)
+        for name, rate in benchmarks['fuzz'].items():
+            print(f'fuzz {name}: {rate:.1f} iterations/sec')
+
+    server.shutdown()
+
+    results = {
+        'config': {
+            'suites': args.suites,
+            'count': args.count,
+            'gen_random_count': args.gen_random_count,
+            'generator_count': args.generator_count,
+            'batch_size': args.batch_size,
+            'serialise_count': args.serialise_count,
+            'fuzz_count': args.fuzz_count,
+            'latency_ms': args.latency,
+            'serialiser': args.serialiser,
+            'python': platform.python_version(),
+            'time': time.time(),
+        },
+        'benchmarks': benchmarks,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results written to {args.output}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        for key in ('latency_ms', 'serialiser'):
+            if old['config'].get(key) != results['config'][key]:
+                print(f'Warning: {key} differs from the earlier run, '
+                      f'{old["config"].get(key)} vs {results["config"][key]}')
+        regressions = compare(old, results, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} rates regressed by more than '
+                  f'{100 * args.tolerance:g}%')
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Live coverage feedback read from monerod's continuous-mode profile.
+
+With `%c` in LLVM_PROFILE_FILE, the profile runtime maps the counter
+section of the .profraw file into monerod's memory, so the file always
+holds the current counters. After every batch of requests the counters are
+read back, the counters hit for the first time are credited to the
+generators of the batch and the batch is saved to the corpus. The credit
+is fed to the scheduler, see e2e_scheduler.BanditScheduler."""
+
+import json
+import os
+import struct
+
+# Magic of a 64-bit raw profile, followed by the version in the low bits
+# of the next header field.
+RAW_PROFILE_MAGIC = 0xff6c70726f667281
+# Number of uint64 header fields and size of one per-function data record
+# for the raw profile versions written by clang 14 to 19.
+_HEADER_FIELDS = {8: 11, 9: 14, 10: 16}
+_DATA_RECORD_SIZE = {8: 48, 9: 64, 10: 64}
+# Set in the version field for -fprofile-instr-generate's single byte
+# coverage mode, which is not supported.
+_BYTE_COVERAGE_FLAG = 1 << 60
+
+# Maps every non-zero byte to 1.
+_NONZERO = bytes([0] + [1] * 255)
+# Lane masks of read_covered, by number of counters.
+_lane_masks = {}
+
+
+def profile_pattern(workdir, index) -> str:
+    """LLVM_PROFILE_FILE for monerod `index` with continuous mode on. The
+    runtime drops the %c, so the profile is still monerod<index>.profraw."""
+    return os.path.join(workdir, f'monerod{index}%c.profraw')
+
+
+def _lane_mask(num_counters) -> int:
+    return int.from_bytes(b'\x01\x00\x00\x00\x00\x00\x00\x00' * num_counters,
+                          'little')
+
+
+def read_covered(path) -> tuple[int, int]:
+    """Returns (bitmask, num_counters) for the raw profile at `path`, where
+    bit 64 * i of the bitmask is set if counter i is non-zero. Raises
+    ValueError if the file is not a raw profile that can be read."""
+    with open(path, 'rb') as f:
+        header = f.read(8 * max(_HEADER_FIELDS.values()))
+        if len(header) < 16:
+            raise ValueError(f'{path}: truncated profile')
+        magic, version = struct.unpack_from('<QQ', header)
+        if magic != RAW_PROFILE_MAGIC:
+            raise ValueError(f'{path}: not a raw profile')
+        if version & _BYTE_COVERAGE_FLAG:
+            raise ValueError(f'{path}: single byte coverage is not supported')
+        version &= 0xFFFFFFFF
+        if version not in _HEADER_FIELDS:
+            raise ValueError(f'{path}: raw profile version {version} is not '
+                             'supported')
+        fields = struct.unpack_from(f'<{_HEADER_FIELDS[version]}Q', header)
+        (binary_ids_size, num_data, padding_before_counters,
+         num_counters) = fields[2:6]
+        f.seek(8 * len(fields) + binary_ids_size +
+               num_data * _DATA_RECORD_SIZE[version] + padding_before_counters)
+        counters = f.read(8 * num_counters)
+    if len(counters) != 8 * num_counters:
+        raise ValueError(f'{path}: truncated profile')
+
+    # Fold every 8-byte counter into the lowest bit of its lane.
+    bits = int.from_bytes(counters.translate(_NONZERO), 'little')
+    bits |= bits >> 32
+    bits |= bits >> 16
+    bits |= bits >> 8
+    if num_counters not in _lane_masks:
+        _lane_masks[num_counters] = _lane_mask(num_counters)
+    return bits & _lane_masks[num_counters], num_counters
+
+
+class CoverageFeedback:
+    """Tracks the counters covered so far and credits new ones to the
+    requests that hit them.
+
+    Requests are credited in batches of `batch_size`: each request of a
+    batch gets an equal share of the counters the batch hit first, which
+    is passed to `listener(name, new_counters)`. Batches that hit new
+    counters are written to `corpus_dir` as a file e2e_replay.py can
+    replay."""
+
+    def __init__(self, corpus_dir, batch_size=50, listener=None):
+        self.corpus_dir = corpus_dir
+        self.batch_size = batch_size
+        self.listener = listener
+        self.profile_path = None
+        self.covered = 0
+        self.num_counters = 0
+        self.batch = []
+        # Per generator: requests sent and counters credited.
+        self.requests = {}
+        self.new_counters = {}
+        self.corpus_entries = 0
+        self.read_errors = 0
+        os.makedirs(corpus_dir, exist_ok=True)
+
+    def set_profile(self, path):
+        """Follows the profile of a newly started monerod. What it covered
+        while starting up is not credited to any request."""
+        self.flush()
+        self.profile_path = path
+        self.batch = []
+        self._read_new()
+
+    def _read_new(self) -> int:
+        """Folds the current counters into the covered set and returns the
+        number of counters covered for the first time."""
+        try:
+            bits, num_counters = read_covered(self.profile_path)
+        except (OSError, ValueError) as e:
+            self.read_errors += 1
+            if self.read_errors == 1:
+                print(f'Cannot read coverage: {e}')
+            return 0
+        new = bits & ~self.covered
+        self.covered |= bits
+        self.num_counters = num_counters
+        return new.bit_count()
+
+    def record(self, name, seed):
+        """Adds a finished request to the current batch."""
+        self.batch.append((name, seed))
+        self.requests[name] = self.requests.get(name, 0) + 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Credits the new coverage of the current batch, if any."""
+        if not self.batch or self.profile_path is None:
+            return
+        new = self._read_new()
+        share = new / len(self.batch)
+        for name, _ in self.batch:
+            self.new_counters[name] = self.new_counters.get(name, 0) + share
+            if self.listener is not None:
+                self.listener(name, share)
+        if new:
+            self._save(new)
+        self.batch = []
+
+    def _save(self, new):
+        path = os.path.join(self.corpus_dir,
+                            f'entry-{self.corpus_entries}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {
+                    'requests': [{
+                        'name': name,
+                        'seed': seed
+                    } for name, seed in self.batch],
+                    'new_counters': new,
+                    'covered_counters': self.covered.bit_count(),
+                },
+                f,
+                indent=2)
+        self.corpus_entries += 1
+
+    def stats(self) -> dict:
+        return {
+            'coverage_covered_counters': self.covered.bit_count(),
+            'coverage_corpus_entries': self.corpus_entries,
+            'coverage_requests': dict(self.requests),
+            'coverage_new_counters': dict(self.new_counters),
+        }
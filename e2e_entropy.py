@@ -0,0 +1,78 @@
+"""Bulk random byte pool backing the gen_random_* request field generators."""
+
+import os
+import random
+import string
+
+# Maps a random byte to a printable character. Bytes 200-255 are dropped
+# first so every printable character is equally likely.
+_PRINTABLE_TABLE = bytes(
+    ord(string.printable[i % len(string.printable)]) for i in range(256))
+_PRINTABLE_REJECT = bytes(range(2 * len(string.printable), 256))
+
+
+class EntropyPool:
+    """Hands out random bytes, strings and integers by slicing a buffer
+    that is refilled `block_size` bytes at a time.
+
+    Without a seed the buffer is filled from os.urandom. With a seed it is
+    filled from a random.Random seeded with it, so the same seed always
+    produces the same values."""
+
+    def __init__(self, seed=None, block_size=1 << 16):
+        self.block_size = block_size
+        self.refills = 0
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """Discards the buffered bytes and restarts from `seed`."""
+        self._rng = random.Random(seed) if seed is not None else None
+        self._buffer = b''
+        self._pos = 0
+
+    def _refill(self, need):
+        size = max(self.block_size, need)
+        if self._rng is not None:
+            fresh = self._rng.randbytes(size)
+        else:
+            fresh = os.urandom(size)
+        self._buffer = self._buffer[self._pos:] + fresh
+        self._pos = 0
+        self.refills += 1
+
+    def take(self, n) -> bytes:
+        """Returns `n` random bytes."""
+        if self._pos + n > len(self._buffer):
+            self._refill(n)
+        chunk = self._buffer[self._pos:self._pos + n]
+        self._pos += n
+        return chunk
+
+    def randint(self, start, end) -> int:
+        """Returns an integer in [start, end], like random.randint."""
+        span = end - start + 1
+        if span <= 1:
+            return start
+        # Four spare bytes keep the modulo bias below 2**-32.
+        nbytes = (span.bit_length() + 7) // 8 + 4
+        return start + int.from_bytes(self.take(nbytes), 'little') % span
+
+    def random(self) -> float:
+        """Returns a float in [0, 1), like random.random."""
+        return (int.from_bytes(self.take(7), 'little') >> 3) / (1 << 53)
+
+    def bool(self) -> bool:
+        return bool(self.take(1)[0] & 1)
+
+    def hex(self, length) -> str:
+        """Returns `length` random hex digits, `length` must be even."""
+        return self.take(length // 2).hex()
+
+    def printable(self, length) -> str:
+        """Returns `length` random characters of string.printable."""
+        out = b''
+        while len(out) < length:
+            missing = length - len(out)
+            out += self.take(missing + missing // 4 + 8).translate(
+                _PRINTABLE_TABLE, _PRINTABLE_REJECT)
+        return out[:length].decode('ascii')
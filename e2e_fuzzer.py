@@ -1,25 +1,91 @@
 """utilities for fuzzing monerod RPC endpoints."""
 
+import asyncio
 import os
 import time
-import random
 import json
-import string
-import base64
-from operator import itemgetter
-
-import requests
 
+import e2e_entropy
+import e2e_histogram
+import e2e_results
+import e2e_schema
+import e2e_scheduler
 import e2e_serialise
+import e2e_timeouts
+import e2e_trace
+import e2e_transport
 
 debug = False
 WORKDIR = '.'
+RPC_HOST = '127.0.0.1'
+RPC_PORT = 38081
+
+# Source of the random request field values, see e2e_schema and the
+# gen_random_* helpers. Reseeded before every iteration, so small refills
+# keep reseeding cheap.
+entropy = e2e_entropy.EntropyPool(block_size=4096)
+
+# Persistent keep-alive connections to monerod shared by all requests.
+transport = e2e_transport.ConnectionPool(RPC_HOST, RPC_PORT)
+# Set while an async campaign is running, see _fuzz_async.
+async_transport = None
+
+# Probability that a JSON request is preceded by a bootstrap daemon toggle.
+bootstrap_toggle_rate = 0.1
+# Newest blocks whose hashes the chain state cache holds, for the
+# block_ids fields.
+RECENT_BLOCKS = 10
+# Set when localhost may be banned, the next request unbans it first.
+ban_dirty = True
+# Headers of the binary endpoint requests.
+BIN_HEADERS = {"Content-Type": "application/octet-stream"}
+# Generators whose requests may ban localhost.
+BAN_AFFECTING_CALLS = {'send_set_bans', 'send_banned'}
+# Requests sent to fuzz targets and housekeeping requests (unbanning,
+# bootstrap toggling, chain state queries, teardown).
+traffic_stats = {'target': 0, 'housekeeping': 0}
+# Latency histogram of every request generator, keyed by its name.
+latency_histograms = {}
+# Success and fail counts of the running fuzz() call's generators, see
+# e2e_metrics.
+call_stats = {}
+# Progress of the last fuzz() call: the counter of the next iteration to
+# run and whether it stopped because a request failed.
+progress = {'next_iteration': 0, 'failed': False}
+# e2e_coverage.CoverageFeedback of a campaign with coverage feedback.
+coverage = None
+# e2e_resources.ResourceSampler of a campaign sampling monerod's usage.
+resources = None
+# Picks the generator of every iteration, see e2e_scheduler.
+scheduler = e2e_scheduler.UniformScheduler()
+# Timeout of every request, derived from its generator's latencies.
+timeouts = e2e_timeouts.TimeoutBudget()
+# Requests that got no answer within their timeout.
+hang_stats = {'hangs': 0}
+# Called with (generator name, seed, timeout) after a request hung, once
+# the results database holds it, see e2e.supervise_campaign.
+hang_listener = None
+# Called between iterations when set, returns False once monerod has
+# exited, which stops fuzz() like a failed request, see
+# e2e.supervise_campaign.
+target_alive = None
+# Whether monerod has to answer a liveness check after a hang for the
+# campaign to go on, otherwise the hang is handled like a failure.
+check_liveness = True
+
+
+def set_rpc_port(port):
+    """Points all following requests at the monerod RPC server on `port`."""
+    global RPC_PORT, transport
+    transport.close()
+    RPC_PORT = port
+    transport = e2e_transport.ConnectionPool(RPC_HOST, RPC_PORT)
 
 
 def gen_random_string(max_length=1024) -> str:
     if gen_random_bool():
-        length = random.randint(1, max_length)
-        return ''.join(random.choices(string.printable, k=length))
+        length = entropy.randint(1, max_length)
+        return entropy.printable(length)
     return ''
 
 
@@ -27,774 +93,758 @@ def gen_random_hex_string(max_length=64, exact=False) -> str:
     if exact:
         length = max_length
     else:
-        length = random.randint(2, max(2, max_length))
+        length = entropy.randint(2, max(2, max_length))
     if length % 2 == 1:
         length += 1
-    return ''.join(random.choices('0123456789abcdef', k=length))
+    return entropy.hex(length)
 
 
 def gen_random_blob(max_bytes=1024) -> str:
-    blob_bytes = bytes(
-        random.getrandbits(8) for _ in range(random.randint(1, max_bytes)))
-    return blob_bytes.hex()
+    return entropy.take(entropy.randint(1, max_bytes)).hex()
 
 
 def gen_random_int(start: int = 0, end: int = 99999999999) -> int:
-    return random.randint(start, end)
+    return entropy.randint(start, end)
 
 
 def gen_random_bool() -> bool:
-    return random.choice([True, False])
-
+    return entropy.bool()
+
+
+def get_block_ids() -> bytes:
+    """Returns the known block hashes as raw 32-byte blobs, newest first,
+    the way the block_ids blob of a binary request holds them."""
+    return b''.join(bytes.fromhex(bid) for bid in get_valid_hashes())
+
+
+def _housekeeping_requests(toggle_bootstrap) -> list:
+    """Returns the (request, endpoint) pairs to send before the next target
+    request. Localhost is only unbanned when it may have been banned, and
+    the bootstrap daemon is toggled at `bootstrap_toggle_rate`. The toggle
+    draws from the iteration's entropy so replays toggle the same way."""
+    global ban_dirty
+    requests = []
+    if ban_dirty:
+        # Unbanned localhost
+        requests.append(clear_localhost_ban())
+        ban_dirty = False
+    if toggle_bootstrap and entropy.random() < bootstrap_toggle_rate:
+        # Randomly choose if bootstrap is to be cleared
+        if gen_random_bool():
+            requests.append(clear_boostrap_daemon())
+        else:
+            requests.append(send_set_bootstrap_daemon())
+    traffic_stats['housekeeping'] += len(requests)
+    return requests
 
-def get_block_ids() -> str:
-    block_ids = get_valid_hashes()
 
-    joined_bytes = b''.join(bytes.fromhex(bid) for bid in block_ids)
+def _housekeeping_failed(req):
+    global ban_dirty
+    if req.get('method') == 'set_bans':
+        ban_dirty = True
 
-    return base64.b64encode(joined_bytes).decode()
 
+def _count_target(housekeeping):
+    traffic_stats['housekeeping' if housekeeping else 'target'] += 1
 
-def generate_request(method, params):
-    request = {'jsonrpc': '2.0', 'id': '1', 'method': method, 'params': params}
-    return request
 
+def _check_rejection(response):
+    # Monerod answers banned clients with 403, unban before the next call.
+    global ban_dirty
+    if response.status_code == 403:
+        ban_dirty = True
 
-def send_request(request, endpoint) -> tuple[bool, str]:
-    # Unbanned localhost
-    req, end = clear_localhost_ban()
 
-    try:
-        x = requests.post('http://127.0.0.1:38081/%s' % (end),
-                          json=req,
-                          timeout=30)
-    except:
-        pass
+def _send_housekeeping(toggle_bootstrap):
+    for req, end in _housekeeping_requests(toggle_bootstrap):
+        try:
+            transport.post(end,
+                           json_body=req,
+                           timeout=e2e_timeouts.DEFAULT_TIMEOUT)
+        except e2e_transport.TransportError:
+            _housekeeping_failed(req)
 
-    # Randomly choose if bootstrap is to be cleared
-    if gen_random_bool():
-        req, end = clear_boostrap_daemon()
-    else:
-        req, end = send_set_bootstrap_daemon()
 
-    try:
-        x = requests.post('http://127.0.0.1:38081/%s' % (end),
-                          json=req,
-                          timeout=30)
-    except:
-        pass
+async def _send_housekeeping_async(toggle_bootstrap):
+    for req, end in _housekeeping_requests(toggle_bootstrap):
+        try:
+            await async_transport.post(end,
+                                       json_body=req,
+                                       timeout=e2e_timeouts.DEFAULT_TIMEOUT)
+        except e2e_transport.TransportError:
+            _housekeeping_failed(req)
 
-    ex = None
 
-    # Fuzz the chosen target
+def _target_started(endpoint, request=None, housekeeping=False):
+    """Counts a request about to be sent, `request` is None for binary
+    ones."""
+    _count_target(housekeeping)
     if debug:
         print('------------------------------------')
         print('Sending to endpoint: %s' % endpoint)
-        print('Parameters: %s ' % json.dumps(request))
-    try:
-        x = requests.post('http://127.0.0.1:38081/%s' % (endpoint),
-                          json=request,
-                          timeout=30)
-        if debug:
-            print('Response: %s ' % x.text)
-        return True, x.text
-    except requests.exceptions.Timeout:
-        # Retry with longer timeout because sometimes some requests may take much longer after some stale calls
-        try:
-            x = requests.post('http://127.0.0.1:38081/%s' % (endpoint),
-                              json=request,
-                              timeout=600)
-            if debug:
-                print('Response: %s ' % x.text)
-            return True, x.text
-        except Exception as e:
-            ex = e
-    except Exception as e:
-        ex = e
+        if request is not None:
+            print('Parameters: %s ' % json.dumps(request))
 
-    print(f'FAILED!!!!{str(ex)}')
-    return False, ''
-
-
-def send_bin_request(data, endpoint) -> tuple[bool, str]:
-    # Unbanned localhost
-    req, end = clear_localhost_ban()
-
-    try:
-        x = requests.post('http://127.0.0.1:38081/%s' % (end),
-                          json=req,
-                          timeout=30)
-    except:
-        pass
-
-    endpoint = f"http://127.0.0.1:38081/{endpoint}"
 
-    headers = {"Content-Type": "application/octet-stream"}
-
-    if debug:
-        print('------------------------------------')
-        print('Sending to endpoint: %s' % endpoint)
-    try:
-        x = requests.post(endpoint, data=data, headers=headers)
+def _target_answered(response, binary) -> tuple[bool, str]:
+    """Returns what the send functions return for an answered request: the
+    body, or the headers of a binary request."""
+    _check_rejection(response)
+    if binary:
         if debug:
-            print("Response Status Code:", x.status_code)
-            print("Response Headers:", x.headers)
-        return True, x.headers
-    except:
-        pass
-
+            print("Response Status Code:", response.status_code)
+            print("Response Headers:", response.headers)
+        return True, response.headers
+    if debug:
+        print('Response: %s ' % response.text)
+    return True, response.text
+
+
+def _target_failed(error, timeout, binary) -> tuple[bool, str]:
+    """Returns what the send functions return for a request that raised
+    `error`, None as the response if it hung."""
+    global ban_dirty
+    ban_dirty = True
+    if isinstance(error, e2e_transport.Timeout):
+        print(f'HUNG!!!! No response within {timeout:.1f} sec')
+        return False, None
+    if not binary:
+        print(f'FAILED!!!!{str(error)}')
     return False, ''
 
 
-def get_height():
-    _, result = send_request({}, 'getheight')
-    result_dict = {}
-
+def send_request(request,
+                 endpoint,
+                 housekeeping=False,
+                 timeout=e2e_timeouts.DEFAULT_TIMEOUT) -> tuple[bool, str]:
+    """Sends a JSON request after any housekeeping requests that are due.
+    `housekeeping` counts the request itself as housekeeping traffic.
+    Returns whether it succeeded and the response body, which is None if
+    monerod did not answer within `timeout` seconds."""
+    # Requests made while generating (e.g. getheight) must not draw from
+    # the entropy pool, or iterations would not replay the same.
+    with e2e_trace.span('send_request.housekeeping'):
+        _send_housekeeping(toggle_bootstrap=not housekeeping)
+    _target_started(endpoint, request, housekeeping)
     try:
-        result_dict = json.loads(result)
-    except:
-        # Ignore error from failed getheight
-        pass
-
-    return result_dict.get('height', 1024)
-
-
-def get_valid_hashes():
-    _, result = send_request({}, 'getheight')
-    ids = []
-
+        with e2e_trace.span('send_request.target'):
+            response = transport.post(endpoint,
+                                      json_body=request,
+                                      timeout=timeout)
+    except Exception as e:
+        return _target_failed(e, timeout, binary=False)
+    return _target_answered(response, binary=False)
+
+
+def send_bin_request(data,
+                     endpoint,
+                     timeout=e2e_timeouts.DEFAULT_TIMEOUT) -> tuple[bool, str]:
+    """Sends a binary request, see send_request. The response is the
+    headers, None if monerod did not answer within `timeout` seconds."""
+    with e2e_trace.span('send_bin_request.housekeeping'):
+        _send_housekeeping(toggle_bootstrap=False)
+    _target_started(endpoint)
     try:
-        result_dict = json.loads(result)
-        hash = result_dict.get('hash')
-        if hash:
-            ids.append(hash)
-    except:
-        # Ignore error from failed call
-        pass
-
-    if not ids:
-        ids.append(
-            '0000000000000000000000000000000000000000000000000000000000000000')
-
-    return ids
-
-
-def send_get_blocks():
-    height = get_height()
-    params = {
-        'block_ids': get_block_ids(),
-        'prune': gen_random_bool(),
-        'start_height': gen_random_int(0, height),
-        'no_miner_tx': gen_random_bool(),
-        'high_height_ok': gen_random_bool(),
-        'pool_info_since': gen_random_int(0, height),
-        'max_block_count': gen_random_int(0, height),
-        'requested_info': gen_random_int(0, 2),
-    }
-
-    bin = e2e_serialise.serialise(params, '/get_blocks.bin', WORKDIR)
-
-    return bin, 'get_blocks.bin'
-
-
-def send_get_blocks_by_height():
-    params = {
-        'heights':
-        [gen_random_int(0, get_height()) for _ in range(gen_random_int(1, 8))],
-    }
-
-    bin = e2e_serialise.serialise(params, '/get_blocks_by_height.bin', WORKDIR)
-
-    return bin, 'get_blocks_by_height.bin'
-
-
-def send_get_hashes():
-    params = {
-        'block_ids': get_block_ids(),
-        'start_height': gen_random_int(0, get_height()),
-    }
-
-    serialised_bin = e2e_serialise.serialise(params, '/get_hashes.bin',
-                                             WORKDIR)
-
-    return serialised_bin, 'get_hashes.bin'
-
-
-def send_get_indexes():
-    params = {
-        'txs_hashes':
-        [gen_random_hex_string(64, True) for _ in range(gen_random_int(1, 8))],
-    }
-
-    serialised_bin = e2e_serialise.serialise(params, '/get_o_indexes.bin',
-                                             WORKDIR)
-
-    return serialised_bin, 'get_o_indexes.bin'
-
-
-def send_get_outs_bin():
-    params = {
-        'outputs': [{
-            'amount': gen_random_int(),
-            'index': gen_random_int()
-        } for _ in range(gen_random_int(1, 8))],
-        'get_txid':
-        gen_random_bool(),
-    }
-
-    serialised_bin = e2e_serialise.serialise(params, '/get_outs.bin', WORKDIR)
-
-    return serialised_bin, 'get_outs.bin'
-
-
-def send_get_transactions():
-    params = {
-        'txs_hashes':
-        [gen_random_hex_string(64, True) for _ in range(gen_random_int(1, 8))],
-        'decode_as_json':
-        gen_random_bool(),
-        'prune':
-        gen_random_bool(),
-    }
-    return params, 'gettransactions'
-
-
-def send_get_alt_blocks_hashes():
-    params = {}
-    return params, 'get_alt_blocks_hashes'
-
-
-def send_is_key_image_spent():
-    params = {
-        'key_images':
-        [gen_random_hex_string(64, True) for _ in range(gen_random_int(1, 8))],
-    }
-    return params, 'is_key_image_spent'
-
-
-def send_send_raw_tx():
-    params = {
-        'tx_as_hex': gen_random_hex_string(128),
-        'do_not_relay': gen_random_bool(),
-        'do_sanity_checks': gen_random_bool(),
-    }
-    return params, 'send_raw_transaction'
-
-
-def send_start_mining():
-    params = {
-        'miner_address': gen_random_string(128),
-        'threads_count': gen_random_int(),
-        'do_background_mining': gen_random_bool(),
-        'ignore_battery': gen_random_bool(),
-    }
-    return params, 'start_mining'
-
-
-def send_stop_mining():
-    params = {}
-    return params, 'stop_mining'
-
-
-def send_mining_status():
-    params = {}
-    return params, 'mining_status'
-
-
-def send_save_bc():
-    params = {}
-    return params, 'save_bc'
-
-
-def send_get_peer_list():
-    params = {}
-    return params, 'get_peer_list'
-
-
-def send_get_public_nodes():
-    params = {}
-    return params, 'get_public_nodes'
-
-
-def send_set_log_hash_rate():
-    params = {
-        'visible': gen_random_bool(),
-    }
-    return params, 'set_log_hash_rate'
-
-
-def send_set_log_level():
-    params = {
-        'level': gen_random_int(),
-    }
-    return params, 'set_log_level'
-
-
-def send_set_log_categories():
-    params = {
-        'categories': gen_random_string(64),
-    }
-    return params, 'set_log_categories'
-
-
-def send_get_transaction_pool():
-    params = {}
-    return params, 'get_transaction_pool'
-
-
-def send_get_transaction_pool_hashes_bin():
-    params = {}
-    return params, 'get_transaction_pool_hashes.bin'
-
-
-def send_get_transaction_pool_hashes():
-    params = {}
-    return params, 'get_transaction_pool_hashes'
-
-
-def send_get_transaction_pool_stats():
-    params = {}
-    return params, 'get_transaction_pool_stats'
-
-
-def send_set_bootstrap_daemon():
-    params = {
-        'address': 'auto',
-        'username': gen_random_string(64),
-        'password': gen_random_string(64),
-        'proxy': gen_random_string(32),
-    }
-    return params, 'set_bootstrap_daemon'
-
+        with e2e_trace.span('send_bin_request.target'):
+            response = transport.post(endpoint,
+                                      data=data,
+                                      headers=BIN_HEADERS,
+                                      timeout=timeout)
+    except Exception as e:
+        return _target_failed(e, timeout, binary=True)
+    return _target_answered(response, binary=True)
 
-def clear_boostrap_daemon():
-    params = {
-        'address': '',
-        'username': '',
-        'password': '',
-        'proxy': '',
-    }
-    return params, 'set_bootstrap_daemon'
 
+async def send_request_async(
+        request, endpoint,
+        timeout=e2e_timeouts.DEFAULT_TIMEOUT) -> tuple[bool, str]:
+    """Same as send_request but sent over the asyncio transport."""
+    with e2e_trace.span('send_request.housekeeping'):
+        await _send_housekeeping_async(toggle_bootstrap=True)
+    _target_started(endpoint, request)
+    try:
+        with e2e_trace.span('send_request.target'):
+            response = await async_transport.post(endpoint,
+                                                  json_body=request,
+                                                  timeout=timeout)
+    except Exception as e:
+        return _target_failed(e, timeout, binary=False)
+    return _target_answered(response, binary=False)
 
-def send_stop_daemon():
-    params = {}
-    return params, 'stop_daemon'
 
+async def send_bin_request_async(
+        data, endpoint,
+        timeout=e2e_timeouts.DEFAULT_TIMEOUT) -> tuple[bool, str]:
+    """Same as send_bin_request but sent over the asyncio transport."""
+    with e2e_trace.span('send_bin_request.housekeeping'):
+        await _send_housekeeping_async(toggle_bootstrap=False)
+    _target_started(endpoint)
+    try:
+        with e2e_trace.span('send_bin_request.target'):
+            response = await async_transport.post(endpoint,
+                                                  data=data,
+                                                  headers=BIN_HEADERS,
+                                                  timeout=timeout)
+    except Exception as e:
+        return _target_failed(e, timeout, binary=True)
+    return _target_answered(response, binary=True)
 
-def send_get_info():
-    params = {}
-    return params, 'get_info'
 
+def monerod_alive() -> bool:
+    """Whether monerod still answers a cheap request, e.g. after a hang."""
+    traffic_stats['housekeeping'] += 1
+    try:
+        response = transport.post('/getheight',
+                                  json_body={},
+                                  timeout=e2e_timeouts.LIVENESS_TIMEOUT)
+    except e2e_transport.TransportError:
+        return False
+    return response.status_code == 200
+
+
+class ChainStateCache:
+    """Caches the chain height learnt from getheight and the hashes of the
+    `recent` newest blocks, newest first, learnt from
+    get_block_headers_range.
+
+    Entries expire after `ttl` seconds and are dropped as soon as a request
+    that changes the chain has been sent, see CHAIN_MUTATING_CALLS."""
+
+    def __init__(self, ttl, recent=RECENT_BLOCKS):
+        self.ttl = ttl
+        self.recent = recent
+        self.height = None
+        self.hashes = []
+        self.fetched_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _fresh(self) -> bool:
+        return (self.height is not None and
+                time.monotonic() - self.fetched_at < self.ttl)
+
+    def _fetch(self):
+        with e2e_trace.span('chain_state.fetch'):
+            _, result = send_request({}, 'getheight', housekeeping=True)
+        try:
+            result_dict = json.loads(result)
+        except:
+            # Ignore error from failed getheight, it is retried next time.
+            return
+        if 'height' not in result_dict:
+            return
+        self.height = result_dict['height']
+        self.hashes = [result_dict['hash']] if result_dict.get('hash') else []
+        self.hashes.extend(
+            block_hash for block_hash in self._fetch_recent(self.height)
+            if block_hash not in self.hashes)
+        self.fetched_at = time.monotonic()
+
+    def _fetch_recent(self, height) -> list[str]:
+        """Returns the hashes of the blocks below the top one, newest first,
+        empty if monerod could not be asked."""
+        if height < 2 or self.recent < 2:
+            return []
+        request = {
+            'jsonrpc': '2.0',
+            'id': '1',
+            'method': 'get_block_headers_range',
+            'params': {
+                'start_height': max(0, height - self.recent),
+                'end_height': height - 2,
+            },
+        }
+        with e2e_trace.span('chain_state.fetch'):
+            _, result = send_request(request, 'json_rpc', housekeeping=True)
+        try:
+            headers = json.loads(result)['result']['headers']
+            return [header['hash'] for header in reversed(headers)]
+        except (TypeError, ValueError, KeyError):
+            return []
+
+    def get(self):
+        """Returns the (height, hashes) of the chain, either of which is
+        None or empty if monerod could not be asked."""
+        if self._fresh():
+            self.hits += 1
+        else:
+            self.misses += 1
+            self._fetch()
+        return self.height, self.hashes
 
-def send_get_net_stats():
-    params = {}
-    return params, 'get_net_stats'
+    def invalidate(self):
+        if self.height is not None:
+            self.invalidations += 1
+        self.height = None
+        self.hashes = []
 
+    def stats(self) -> dict:
+        return {
+            'chain_state_cache_hits': self.hits,
+            'chain_state_cache_misses': self.misses,
+            'chain_state_cache_invalidations': self.invalidations,
+        }
 
-def send_get_limit():
-    params = {}
-    return params, 'get_limit'
 
+# Generators whose requests change the chain, sending one of them
+# invalidates the cached chain state.
+CHAIN_MUTATING_CALLS = {
+    'send_pop_blocks',
+    'send_generateblocks',
+    'send_submitblock',
+    'send_flush_cache',
+}
 
-def send_set_limit():
-    params = {
-        'limit_down': gen_random_int(),
-        'limit_up': gen_random_int(),
-    }
-    return params, 'set_limit'
+chain_state = ChainStateCache(ttl=10.0)
 
 
-def send_out_peers():
-    params = {
-        'white': gen_random_bool(),
-        'gray': gen_random_bool(),
-    }
-    return params, 'out_peers'
+def get_height():
+    height, _ = chain_state.get()
+    if height is None:
+        return 1024
+    return height
 
 
-def send_in_peers():
-    params = {
-        'white': gen_random_bool(),
-        'gray': gen_random_bool(),
-    }
-    return params, 'in_peers'
+def get_valid_hashes():
+    _, hashes = chain_state.get()
+    ids = list(hashes)
 
+    if not ids:
+        ids.append(
+            '0000000000000000000000000000000000000000000000000000000000000000')
 
-def send_get_outs():
-    params = {
-        'outputs': [{
-            'amount': gen_random_int(),
-            'index': gen_random_int()
-        } for _ in range(gen_random_int(1, 8))],
-    }
-    return params, 'get_outs'
+    return ids
 
 
-def send_update():
-    params = {
-        'command': gen_random_string(128),
-    }
-    return params, 'update'
+def _serialise(params, endpoint):
+    return e2e_serialise.serialise(params, endpoint, WORKDIR)
 
 
-def send_get_output_distribution_bin():
-    params = {
-        'amounts': [gen_random_int() for _ in range(gen_random_int(1, 8))],
-        'cumulative': gen_random_bool(),
-        'from_height': gen_random_int(0, get_height()),
-        'to_height': gen_random_int(0, get_height()),
-    }
+def _serialise_many(items):
+    return e2e_serialise.serialise_many(items, WORKDIR)
 
-    serialised_bin = e2e_serialise.serialise(params,
-                                             '/get_output_distribution.bin',
-                                             WORKDIR)
 
-    return serialised_bin, 'get_output_distribution.bin'
+# Request generators compiled from e2e_schema.ENDPOINTS, keyed by name.
+generators = e2e_schema.compile_endpoints(entropy, get_height, get_block_ids,
+                                          _serialise, _serialise_many)
+# Generators also used for housekeeping and teardown.
+send_set_bootstrap_daemon = generators['send_set_bootstrap_daemon']
+clear_boostrap_daemon = generators['clear_boostrap_daemon']
+clear_localhost_ban = generators['clear_localhost_ban']
+send_stop_daemon = generators['send_stop_daemon']
+send_prune_blockchain = generators['send_prune_blockchain']
 
 
-def send_pop_blocks():
-    params = {
-        'nblocks': gen_random_int(),
-    }
-    return params, 'pop_blocks'
+def get_rpc_calls() -> list:
+    """Returns the request generators the fuzzer picks from. Their order
+    maps iteration seeds to generators, so it must not change."""
+    rpc_calls = [
+        'send_get_transactions',
+        'send_get_alt_blocks_hashes',
+        'send_is_key_image_spent',
+        'send_send_raw_tx',
+        'send_start_mining',
+        'send_stop_mining',
+        'send_mining_status',
+        'send_save_bc',
+        'send_get_peer_list',
+        'send_get_public_nodes',
+        'send_set_log_hash_rate',
+        'send_set_log_categories',
+        'send_get_transaction_pool',
+        'send_get_transaction_pool_hashes_bin',
+        'send_get_transaction_pool_hashes',
+        'send_get_transaction_pool_stats',
+        'send_get_info',
+        'send_get_net_stats',
+        'send_get_limit',
+        'send_set_limit',
+        'send_out_peers',
+        'send_in_peers',
+        'send_get_outs',
+        'send_update',
+        'send_pop_blocks',
+        'send_getblockcount',
+        'send_getblockhash',
+        'send_add_aux_pow',
+        'send_calc_pow',
+        'send_get_block_header_by_hash',
+        'send_get_block_header_by_height',
+        'send_get_block_headers_range',
+        'send_get_block',
+        'send_get_connections',
+        'send_get_info_json',
+        'send_hard_fork_info',
+        'send_get_bans',
+        'send_banned',
+        'send_set_bans',
+        'send_flush_txpool',
+        'send_get_output_histogram',
+        'send_get_version',
+        'send_get_coinbase_tx_sum',
+        'send_get_base_fee_estimate',
+        'send_get_alternate_chains',
+        'send_relay_tx',
+        'send_sync_info',
+        'send_get_txpool_backlog',
+        'send_get_output_distribution',
+        'send_flush_cache',
+        'send_get_txids_loose',
+        'send_rpc_access_tracking',
+    ]
 
+    rpc_calls_need_core = [
+        'send_getblocktemplate',
+        'send_getminerdata',
+        'send_submitblock',
+        'send_generateblocks',
+        'send_get_last_block_header',
+    ]
 
-def send_getblockcount():
-    request = generate_request(method='getblockcount', params={})
-    return request, 'json_rpc'
+    rpc_calls_need_payment = [
+        'send_rpc_access_info',
+        'send_rpc_access_submit_nonce',
+        'send_rpc_access_pay',
+        'send_rpc_access_data',
+        'send_rpc_access_account',
+    ]
 
+    rpc_calls_with_binary = [
+        'send_get_blocks',
+        'send_get_blocks_by_height',
+        'send_get_hashes',
+        'send_get_indexes',
+        'send_get_outs_bin',
+        'send_get_output_distribution_bin',
+    ]
 
-def send_getblockhash():
-    request = generate_request(method='on_get_block_hash',
-                               params=[gen_random_int()])
-    return request, 'json_rpc'
-
-
-def send_getblocktemplate():
-    request = generate_request(method='getblocktemplate',
-                               params={
-                                   'wallet_address':
-                                   gen_random_hex_string(128),
-                                   'reserve_size': gen_random_int(0, 512),
-                               })
-    return request, 'json_rpc'
-
-
-def send_getminerdata():
-    request = generate_request(method='get_miner_data', params={})
-    return request, 'json_rpc'
-
-
-def send_calc_pow():
-    request = generate_request(method='calc_pow',
-                               params={
-                                   'major_version': gen_random_int(0, 255),
-                                   'height': gen_random_int(0, get_height()),
-                                   'block_blob': gen_random_blob(),
-                                   'seed_hash': gen_random_hex_string(64),
-                               })
-    return request, 'json_rpc'
-
-
-def send_add_aux_pow():
-    request = generate_request(method='add_aux_pow',
-                               params={
-                                   'blocktemplate_blob':
-                                   gen_random_string(128),
-                                   'aux_pow': [{
-                                       'id':
-                                       gen_random_hex_string(64, True),
-                                       'hash':
-                                       gen_random_hex_string(64, True)
-                                   }],
-                               })
-    return request, 'json_rpc'
-
-
-def send_submitblock():
-    request = generate_request(method='submitblock',
-                               params=[gen_random_hex_string(64, True)])
-    return request, 'json_rpc'
-
-
-def send_generateblocks():
-    request = generate_request(method='generateblocks',
-                               params={
-                                   'amount_of_blocks':
-                                   gen_random_int(0, get_height()),
-                                   'wallet_address':
-                                   gen_random_hex_string(64),
-                                   'prev_block':
-                                   gen_random_hex_string(64, True),
-                                   'starting_nonce':
-                                   gen_random_int(0, get_height()),
-                               })
-    return request, 'json_rpc'
-
-
-def send_get_last_block_header():
-    request = generate_request(method='get_last_block_header',
-                               params={
-                                   'fill_pow_hash': gen_random_bool(),
-                               })
-    return request, 'json_rpc'
-
-
-def send_get_block_header_by_hash():
-    request = generate_request(method='get_block_header_by_hash',
-                               params={
-                                   'hash': gen_random_hex_string(64, True),
-                                   'fill_pow_hash': gen_random_bool(),
-                               })
-    return request, 'json_rpc'
-
-
-def send_get_block_header_by_height():
-    request = generate_request(method='get_block_header_by_height',
-                               params={
-                                   'height': gen_random_int(0, get_height()),
-                                   'fill_pow_hash': gen_random_bool(),
-                               })
-    return request, 'json_rpc'
-
-
-def send_get_block_headers_range():
-    start_height = gen_random_int(0, get_height() - 1)
-    end_height = gen_random_int(start_height,
-                                max(get_height() - 1, start_height))
-    request = generate_request(method='get_block_headers_range',
-                               params={
-                                   'start_height': start_height,
-                                   'end_height': end_height,
-                                   'fill_pow_hash': gen_random_bool(),
-                               })
-    return request, 'json_rpc'
-
-
-def send_get_block():
-    request = generate_request(method='get_block',
-                               params={
-                                   'height': gen_random_int(0, get_height()),
-                                   'hash': gen_random_hex_string(64, True),
-                                   'fill_pow_hash': gen_random_bool(),
-                               })
-    return request, 'json_rpc'
-
-
-def send_get_connections():
-    request = generate_request(method='get_connections', params={})
-    return request, 'json_rpc'
-
-
-def send_get_info_json():
-    request = generate_request(method='get_info', params={})
-    return request, 'json_rpc'
-
-
-def send_hard_fork_info():
-    request = generate_request(method='hard_fork_info', params={})
-    return request, 'json_rpc'
-
-
-def clear_localhost_ban():
-    request = generate_request(method='set_bans',
-                               params={
-                                   'bans': [{
-                                       'host': '127.0.0.1',
-                                       'ip': 0,
-                                       'ban': False,
-                                       'seconds': 0
-                                   }],
-                               })
-    return request, 'json_rpc'
-
-
-def send_set_bans():
-    request = generate_request(method='set_bans',
-                               params={
-                                   'bans': [{
-                                       'host': gen_random_string(128),
-                                       'ip': gen_random_int(0, 0xFFFFFFFF),
-                                       'ban': gen_random_bool(),
-                                       'seconds': gen_random_int(0, 72000)
-                                   }, {
-                                       'host': gen_random_string(128),
-                                       'ip': gen_random_int(0, 0xFFFFFFFF),
-                                       'ban': gen_random_bool(),
-                                       'seconds': gen_random_int(0, 72000)
-                                   }],
-                               })
-    return request, 'json_rpc'
-
-
-def send_get_bans():
-    request = generate_request(method='get_bans', params={})
-    return request, 'json_rpc'
-
-
-def send_banned():
-    request = generate_request(method='banned',
-                               params={
-                                   'bans': gen_random_string(128),
-                               })
-    return request, 'json_rpc'
-
-
-def send_flush_txpool():
-    request = generate_request(method='flush_txpool',
-                               params={
-                                   'txids': [
-                                       gen_random_hex_string(64, True)
-                                       for _ in range(gen_random_int(1, 8))
-                                   ],
-                               })
-    return request, 'json_rpc'
-
-
-def send_get_output_histogram():
-    request = generate_request(
-        method='get_output_histogram',
-        params={
-            'amounts': [gen_random_int() for _ in range(gen_random_int(1, 8))],
-            'min_count': gen_random_int(),
-            'max_count': gen_random_int(),
-            'unlocked': gen_random_bool(),
-            'recent_cutoff': gen_random_int(),
-        })
-    return request, 'json_rpc'
-
-
-def send_get_version():
-    request = generate_request(method='get_version', params={})
-    return request, 'json_rpc'
+    rpc_calls.extend(rpc_calls_need_core)
+    rpc_calls.extend(rpc_calls_need_payment)
+    rpc_calls.extend(rpc_calls_with_binary)
+    return [generators[name] for name in rpc_calls]
 
 
-def send_get_coinbase_tx_sum():
-    request = generate_request(method='get_coinbase_tx_sum',
-                               params={
-                                   'height': gen_random_int(0, get_height()),
-                                   'count': gen_random_int(0, get_height()),
-                               })
-    return request, 'json_rpc'
+def response_size(response) -> int:
+    """Size of a response as returned by send_request (the body) or
+    send_bin_request (the headers)."""
+    if isinstance(response, str):
+        return len(response)
+    if isinstance(response, dict):
+        return int(response.get('Content-Length', 0))
+    return 0
 
 
-def send_get_base_fee_estimate():
-    request = generate_request(method='get_fee_estimate',
-                               params={
-                                   'grace_blocks': gen_random_int(),
-                               })
-    return request, 'json_rpc'
+def iteration_seed(seed, counter) -> int:
+    """Compact seed of one iteration, logged with its result: the campaign
+    seed in the high bits and the iteration counter in the low 32 bits."""
+    return (seed << 32) | (counter & 0xFFFFFFFF)
 
 
-def send_get_alternate_chains():
-    request = generate_request(method='get_alternate_chains', params={})
-    return request, 'json_rpc'
-
-
-def send_relay_tx():
-    request = generate_request(method='relay_tx',
-                               params={
-                                   'txids': [
-                                       gen_random_hex_string(64, True)
-                                       for _ in range(gen_random_int(1, 8))
-                                   ],
-                               })
-    return request, 'json_rpc'
-
-
-def send_sync_info():
-    request = generate_request(method='sync_info', params={})
-    return request, 'json_rpc'
+def new_campaign_seed() -> int:
+    return int.from_bytes(os.urandom(4), 'little') >> 1
 
 
-def send_get_txpool_backlog():
-    request = generate_request(method='get_txpool_backlog', params={})
-    return request, 'json_rpc'
-
-
-def send_get_output_distribution():
-    request = generate_request(
-        method='get_output_distribution',
-        params={
-            'amounts': [gen_random_int() for _ in range(gen_random_int(1, 8))],
-            'cumulative': gen_random_bool(),
-            'from_height': gen_random_int(0, get_height()),
-            'to_height': gen_random_int(0, get_height()),
-        })
-    return request, 'json_rpc'
+def generate_iteration(rpc_calls, seed, rpc_call_to_do=None):
+    """Reseeds the entropy pool with an iteration seed and generates that
+    iteration's request. The generator is picked from the seed unless
+    `rpc_call_to_do` is given, the request fields come out the same either
+    way. Returns (rpc_call_to_do, request, endpoint)."""
+    entropy.seed(seed)
+    index = entropy.randint(0, len(rpc_calls) - 1)
+    if rpc_call_to_do is None:
+        rpc_call_to_do = rpc_calls[index]
+    request, endpoint = rpc_call_to_do()
+    return rpc_call_to_do, request, endpoint
 
 
-def send_prune_blockchain():
-    request = generate_request(method='prune_blockchain',
-                               params={
-                                   'check': gen_random_bool(),
-                               })
-    return request, 'json_rpc'
+def generate_batch(rpc_calls, rpc_call_to_do, seeds) -> list:
+    """Generates the requests of `rpc_call_to_do` for many iteration seeds
+    at once, the same as generate_iteration would for each of them.
+    Returns a list of (request, endpoint)."""
 
+    def prepare(seed):
+        entropy.seed(seed)
+        entropy.randint(0, len(rpc_calls) - 1)
 
-def send_flush_cache():
-    request = generate_request(method='flush_cache',
-                               params={
-                                   'bad_txs': gen_random_bool(),
-                                   'bad_blocks': gen_random_bool(),
-                               })
-    return request, 'json_rpc'
+    return rpc_call_to_do.batch(seeds, prepare)
 
 
-def send_get_txids_loose():
-    request = generate_request(method='get_txids_loose', params={})
-    return request, 'json_rpc'
+def request_timeout(rpc_call_to_do) -> float:
+    """Seconds the next request of `rpc_call_to_do` may take."""
+    return timeouts.timeout(latency_histograms.get(rpc_call_to_do.__name__))
 
 
-def send_rpc_access_info():
-    request = generate_request(method='rpc_access_info', params={})
-    return request, 'json_rpc'
+def record_call(results, rpc_call_stats, rpc_call_to_do, endpoint, success,
+                elapsed, size=0, seed=None, hung=False):
+    """Adds a finished request to the results store, the success/fail
+    stats and the latency histograms. A request that `hung` is stored with
+    the 'hang' status and left out of the histograms, which would
+    otherwise stretch the timeouts derived from them."""
+    results.add(rpc_call_to_do.__name__, endpoint, success, elapsed, size,
+                seed, 'hang' if hung else None)
+    if rpc_call_to_do.__name__ not in latency_histograms:
+        latency_histograms[rpc_call_to_do.__name__] = (
+            e2e_histogram.LatencyHistogram())
+    if not hung:
+        latency_histograms[rpc_call_to_do.__name__].add(elapsed)
+    if debug:
+        print('Request %s took %f seconds' %
+              (rpc_call_to_do.__name__, elapsed))
+    old_success, old_fail = rpc_call_stats[rpc_call_to_do.__name__]
+    if success:
+        old_success += 1
+    else:
+        old_fail += 1
+    rpc_call_stats[rpc_call_to_do.__name__] = (old_success, old_fail)
+    scheduler.record(rpc_call_to_do.__name__, success, elapsed)
+    if coverage is not None:
+        coverage.record(rpc_call_to_do.__name__, seed)
+    if resources is not None:
+        resources.record(rpc_call_to_do.__name__)
+    _after_call(rpc_call_to_do)
+
+
+def handle_hang(results, rpc_call_to_do, seed, timeout) -> bool:
+    """Reports a request that hung and checks whether monerod still
+    answers. Returns whether the campaign can go on."""
+    hang_stats['hangs'] += 1
+    print('Request %s (seed %d) hung for more than %.1f seconds' %
+          (rpc_call_to_do.__name__, seed, timeout))
+    if hang_listener is not None:
+        results.flush()
+        hang_listener(rpc_call_to_do.__name__, seed, timeout)
+    if not check_liveness:
+        return True
+    if monerod_alive():
+        return True
+    print('Monerod does not answer after the hang')
+    return False
+
+
+def reward_coverage(name, new_counters):
+    """Passes the coverage credited to a request on to the scheduler."""
+    scheduler.reward_coverage(name, new_counters)
+
+
+def _after_call(rpc_call_to_do):
+    """Updates the harness state a sent request may have made stale."""
+    global ban_dirty
+    if rpc_call_to_do.__name__ in CHAIN_MUTATING_CALLS:
+        chain_state.invalidate()
+    if rpc_call_to_do.__name__ in BAN_AFFECTING_CALLS:
+        ban_dirty = True
+
+
+def replay(requests, workdir, need_debug=False, stop_on_failure=False) -> list:
+    """Regenerates and re-sends iterations, in order and without pauses.
+    `requests` are (generator name, seed) pairs, a None name picks the
+    generator from the seed. Returns the seeds whose request failed."""
+    global debug
+    debug = need_debug
 
+    global WORKDIR
+    WORKDIR = workdir
 
-def send_rpc_access_submit_nonce():
-    request = generate_request(method='rpc_access_submit_nonce',
-                               params=[gen_random_string(64)])
-    return request, 'json_rpc'
+    rpc_calls = get_rpc_calls()
+    rpc_calls_by_name = {call.__name__: call for call in rpc_calls}
+    failed = []
+    for name, request_seed in requests:
+        rpc_call_to_do, request, endpoint = generate_iteration(
+            rpc_calls, request_seed, rpc_calls_by_name.get(name))
+        timeout = request_timeout(rpc_call_to_do)
+        if isinstance(request, bytes):
+            success, _ = send_bin_request(request, endpoint, timeout)
+        else:
+            success, _ = send_request(request, endpoint, timeout=timeout)
+        _after_call(rpc_call_to_do)
+        if not success:
+            print('Iteration %d (seed %d, %s) failed' %
+                  (request_seed & 0xFFFFFFFF, request_seed,
+                   rpc_call_to_do.__name__))
+            failed.append(request_seed)
+            if stop_on_failure:
+                break
+    return failed
+
+
+def get_campaign_stats() -> dict:
+    """Returns the fuzzer's counters to add to the campaign stats."""
+    stats = chain_state.stats()
+    stats['target_requests'] = traffic_stats['target']
+    stats['housekeeping_requests'] = traffic_stats['housekeeping']
+    stats['hangs'] = hang_stats['hangs']
+    if coverage is not None:
+        stats.update(coverage.stats())
+    if e2e_trace.enabled:
+        stats.update(e2e_trace.stats())
+    return stats
+
+
+def _target_exited() -> bool:
+    """Whether monerod has exited, in which case fuzz() stops as if a
+    request had failed."""
+    if target_alive is None or target_alive():
+        return False
+    print('monerod exited, stopping fuzzing.')
+    progress['failed'] = True
+    return True
+
+
+def _fuzz_serial(rpc_calls, max_rpc_requests_to_send, rpc_call_stats,
+                 results, duration, start_time, seed):
+    """Sends one request at a time, stopping at the first failure. A hang
+    only stops it if monerod no longer answers afterwards."""
+    for rpc_request_counter in range(progress['next_iteration'],
+                                     max(max_rpc_requests_to_send, 1)):
+        if debug:
+            print('Fuzzing request %d of %d' %
+                  (rpc_request_counter + 1, max_rpc_requests_to_send))
+        if rpc_request_counter % 1000 == 0:
+            print('Package: %d' % (rpc_request_counter))
 
+        t0 = time.time()
 
-def send_rpc_access_pay():
-    request = generate_request(method='rpc_access_pay',
-                               params={
-                                   'payment': gen_random_int(),
-                                   'paying_for': gen_random_string(64),
-                               })
-    return request, 'json_rpc'
+        if duration > 0 and (time.time() - start_time) > duration:
+            print('Fuzzing duration reached, stopping fuzzing.')
+            break
+        if _target_exited():
+            break
 
+        request_seed = iteration_seed(seed, rpc_request_counter)
+        with e2e_trace.span('fuzz.generate'):
+            rpc_call_to_do, request, endpoint = generate_iteration(
+                rpc_calls, request_seed, scheduler.choose(rpc_calls))
+        timeout = request_timeout(rpc_call_to_do)
+        with e2e_trace.span('fuzz.send'):
+            if isinstance(request, bytes):
+                success, response = send_bin_request(request, endpoint,
+                                                     timeout)
+            else:
+                success, response = send_request(request,
+                                                 endpoint,
+                                                 timeout=timeout)
+
+        hung = response is None
+        with e2e_trace.span('fuzz.record'):
+            record_call(results, rpc_call_stats, rpc_call_to_do, endpoint,
+                        success,
+                        time.time() - t0, response_size(response),
+                        request_seed, hung)
+        progress['next_iteration'] = rpc_request_counter + 1
+        if hung and handle_hang(results, rpc_call_to_do, request_seed,
+                                timeout):
+            continue
+        if not success:
+            progress['failed'] = True
+            break
 
-def send_rpc_access_tracking():
-    request = generate_request(method='rpc_access_tracking',
-                               params={
-                                   'client': gen_random_string(64),
-                               })
-    return request, 'json_rpc'
 
+async def _fuzz_async(rpc_calls, max_rpc_requests_to_send, rpc_call_stats,
+                      results, duration, start_time, concurrency, seed):
+    """Keeps up to `concurrency` requests in flight against monerod.
 
-def send_rpc_access_data():
-    request = generate_request(method='rpc_access_data',
-                               params={
-                                   'client': gen_random_string(64),
-                               })
-    return request, 'json_rpc'
+    Requests are still generated one at a time on the event loop, only
+    sending them and waiting for the replies overlaps. No new requests are
+    issued after the first failure, but those in flight are still
+    recorded. Hangs are handled as in _fuzz_serial."""
+    global async_transport
+    async_transport = e2e_transport.AsyncConnectionPool(RPC_HOST,
+                                                        RPC_PORT,
+                                                        maxsize=concurrency)
 
+    async def send_one(rpc_call_to_do, request, endpoint, t0, request_seed):
+        timeout = request_timeout(rpc_call_to_do)
+        if isinstance(request, bytes):
+            success, response = await send_bin_request_async(
+                request, endpoint, timeout)
+        else:
+            success, response = await send_request_async(
+                request, endpoint, timeout)
+        return (rpc_call_to_do, endpoint, success, time.time() - t0,
+                response_size(response), request_seed, response is None,
+                timeout)
+
+    in_flight = set()
+    failed = False
+
+    def collect(done):
+        nonlocal failed
+        for task in done:
+            (rpc_call_to_do, endpoint, success, elapsed, size, request_seed,
+             hung, timeout) = task.result()
+            with e2e_trace.span('fuzz.record'):
+                record_call(results, rpc_call_stats, rpc_call_to_do, endpoint,
+                            success, elapsed, size, request_seed, hung)
+            if hung and handle_hang(results, rpc_call_to_do, request_seed,
+                                    timeout):
+                continue
+            if not success:
+                failed = True
+                progress['failed'] = True
+
+    for rpc_request_counter in range(progress['next_iteration'],
+                                     max(max_rpc_requests_to_send, 1)):
+        if debug:
+            print('Fuzzing request %d of %d' %
+                  (rpc_request_counter + 1, max_rpc_requests_to_send))
+        if rpc_request_counter % 1000 == 0:
+            print('Package: %d' % (rpc_request_counter))
 
-def send_rpc_access_account():
-    request = generate_request(method='rpc_access_account',
-                               params={
-                                   'client': gen_random_string(64),
-                               })
-    return request, 'json_rpc'
+        if duration > 0 and (time.time() - start_time) > duration:
+            print('Fuzzing duration reached, stopping fuzzing.')
+            break
 
+        # Wait for a free slot in the in-flight window.
+        while len(in_flight) >= concurrency:
+            with e2e_trace.span('fuzz.wait'):
+                done, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED)
+            collect(done)
+        if failed or _target_exited():
+            break
 
-def fuzz(max_rpc_requests_to_send: int, workdir: str, need_debug: bool,
+        t0 = time.time()
+        request_seed = iteration_seed(seed, rpc_request_counter)
+        with e2e_trace.span('fuzz.generate'):
+            rpc_call_to_do, request, endpoint = generate_iteration(
+                rpc_calls, request_seed, scheduler.choose(rpc_calls))
+        in_flight.add(
+            asyncio.ensure_future(
+                send_one(rpc_call_to_do, request, endpoint, t0,
+                         request_seed)))
+        progress['next_iteration'] = rpc_request_counter + 1
+        # Let the new request start sending before generating the next one.
+        await asyncio.sleep(0)
+
+    if in_flight:
+        done, _ = await asyncio.wait(in_flight)
+        collect(done)
+
+    for conn_stats in async_transport.stats():
+        print('Async connection %(id)d: %(requests)d requests, '
+              '%(reuses)d reused, %(reconnects)d reconnects' % conn_stats)
+    async_transport.close()
+
+
+def fuzz(max_rpc_requests_to_send: int,
+         workdir: str,
+         need_debug: bool,
          rpc_call_stats: dict[str, tuple[int, int]],
-         duration: int) -> dict[str, tuple[int, int]]:
-    """Launch a fuzzing campaign for the Monero RPC endpoints."""
+         duration: int,
+         concurrency: int = 1,
+         log_dir: str = None,
+         seed: int = None,
+         start_iteration: int = 0) -> dict[str, tuple[int, int]]:
+    """Launch a fuzzing campaign for the Monero RPC endpoints. With a
+    `concurrency` above 1, up to that many requests are kept in flight.
+    Results are appended to the results database in `log_dir`, which
+    defaults to `workdir`. Every iteration is generated from `seed`, a
+    random one if None, and its counter so it can be replayed.
+
+    Iterations `start_iteration` to `max_rpc_requests_to_send` are run,
+    stopping early at the first failed request. `progress` tells where
+    the campaign stopped so a supervisor can resume it."""
     print('Fuzzing launching with max of %d rpc requests.' %
           max_rpc_requests_to_send)
     global debug
@@ -802,160 +852,75 @@ def fuzz(max_rpc_requests_to_send: int, workdir: str, need_debug: bool,
 
     global WORKDIR
     WORKDIR = workdir
+    if log_dir is None:
+        log_dir = workdir
 
-    rpc_calls = [
-        send_get_transactions,
-        send_get_alt_blocks_hashes,
-        send_is_key_image_spent,
-        send_send_raw_tx,
-        send_start_mining,
-        send_stop_mining,
-        send_mining_status,
-        send_save_bc,
-        send_get_peer_list,
-        send_get_public_nodes,
-        send_set_log_hash_rate,
-        send_set_log_categories,
-        send_get_transaction_pool,
-        send_get_transaction_pool_hashes_bin,
-        send_get_transaction_pool_hashes,
-        send_get_transaction_pool_stats,
-        send_get_info,
-        send_get_net_stats,
-        send_get_limit,
-        send_set_limit,
-        send_out_peers,
-        send_in_peers,
-        send_get_outs,
-        send_update,
-        send_pop_blocks,
-        send_getblockcount,
-        send_getblockhash,
-        send_add_aux_pow,
-        send_calc_pow,
-        send_get_block_header_by_hash,
-        send_get_block_header_by_height,
-        send_get_block_headers_range,
-        send_get_block,
-        send_get_connections,
-        send_get_info_json,
-        send_hard_fork_info,
-        send_get_bans,
-        send_banned,
-        send_set_bans,
-        send_flush_txpool,
-        send_get_output_histogram,
-        send_get_version,
-        send_get_coinbase_tx_sum,
-        send_get_base_fee_estimate,
-        send_get_alternate_chains,
-        send_relay_tx,
-        send_sync_info,
-        send_get_txpool_backlog,
-        send_get_output_distribution,
-        send_flush_cache,
-        send_get_txids_loose,
-        send_rpc_access_tracking,
-    ]
-
-    rpc_calls_need_core = [
-        send_getblocktemplate,
-        send_getminerdata,
-        send_submitblock,
-        send_generateblocks,
-        send_get_last_block_header,
-    ]
-
-    rpc_calls_need_payment = [
-        send_rpc_access_info,
-        send_rpc_access_submit_nonce,
-        send_rpc_access_pay,
-        send_rpc_access_data,
-        send_rpc_access_account,
-    ]
-
-    rpc_calls_with_binary = [
-        send_get_blocks,
-        send_get_blocks_by_height,
-        send_get_hashes,
-        send_get_indexes,
-        send_get_outs_bin,
-        send_get_output_distribution_bin,
-    ]
-
-    rpc_calls.extend(rpc_calls_need_core)
-    rpc_calls.extend(rpc_calls_need_payment)
-    rpc_calls.extend(rpc_calls_with_binary)
+    rpc_calls = get_rpc_calls()
 
     # Initialise a statistics tracker where we keep note of
     # the number of successful and failed calls.
     if not rpc_call_stats:
         rpc_call_stats = {call.__name__: (0, 0) for call in rpc_calls}
+    global call_stats
+    call_stats = rpc_call_stats
 
-    start_time = time.time()
-    rpc_calls_made = []
-    for rpc_request_counter in range(max(max_rpc_requests_to_send, 1)):
-        if debug:
-            print('Fuzzing request %d of %d' %
-                  (rpc_request_counter + 1, max_rpc_requests_to_send))
-        if rpc_request_counter % 1000 == 0:
-            print('Package: %d' % (rpc_request_counter))
-
-        rpc_index = random.randint(0, len(rpc_calls) - 1)
-
-        t0 = time.time()
-
-        if duration > 0 and (time.time() - start_time) > duration:
-            print('Fuzzing duration reached, stopping fuzzing.')
-            break
-
-        # rpc_call_to_do = send_getblocktemplate# rpc_calls[rpc_index]
-        rpc_call_to_do = rpc_calls[rpc_index]
-        request, endpoint = rpc_call_to_do()
-        if isinstance(request, bytes):
-            success, _ = send_bin_request(request, endpoint)
-        else:
-            success, _ = send_request(request, endpoint)
-
-        t1 = time.time()
-        rpc_calls_made.append({
-            'name': rpc_call_to_do.__name__,
-            'endpoint': endpoint,
-            #'request': request,
-            'success': success,
-            'time': t1 - t0,
-        })
-        print('Request %s took %f seconds' %
-              (rpc_call_to_do.__name__, t1 - t0))
-        old_success, old_fail = rpc_call_stats[rpc_calls[rpc_index].__name__]
-        if success:
-            old_success += 1
-        else:
-            old_fail += 1
-        rpc_call_stats[rpc_calls[rpc_index].__name__] = (old_success, old_fail)
-        if not success:
-            break
-
-    # Write stats files
-    with open(os.path.join(workdir, 'rpc_calls_made.json'),
-              'w',
-              encoding='utf-8') as f:
-        json.dump(rpc_calls_made, f, indent=2)
+    if seed is None:
+        seed = new_campaign_seed()
+    print('Campaign seed: %d' % seed)
+    progress['next_iteration'] = start_iteration
+    progress['failed'] = False
 
-    sorted_rpc_calls = sorted(rpc_calls_made,
-                              key=itemgetter('time'),
-                              reverse=True)
-    with open(os.path.join(workdir, 'rpc_calls_made_sorted.json'),
-              'w',
-              encoding='utf-8') as f:
-        json.dump(sorted_rpc_calls, f, indent=2)
+    start_time = time.time()
+    results = e2e_results.ResultsStore(
+        os.path.join(log_dir, e2e_results.RESULTS_DB))
+    # Replays need to know whether the seeds alone give the generators.
+    results.set_info('scheduler', scheduler.name)
+    if concurrency > 1:
+        asyncio.run(
+            _fuzz_async(rpc_calls, max_rpc_requests_to_send, rpc_call_stats,
+                        results, duration, start_time, concurrency, seed))
+    else:
+        _fuzz_serial(rpc_calls, max_rpc_requests_to_send, rpc_call_stats,
+                     results, duration, start_time, seed)
+
+    # Write the slowest requests next to the results database.
+    results.dump_slowest(os.path.join(log_dir, 'rpc_calls_made_sorted.json'))
+    results.close()
+    if coverage is not None:
+        coverage.flush()
+        print('Coverage: %d of %d counters, %d corpus entries' %
+              (coverage.covered.bit_count(), coverage.num_counters,
+               coverage.corpus_entries))
 
     # Log high level stats.
-    print('Fuzzing finished with %d requests.' % max_rpc_requests_to_send)
-    print('Sending prune request')
-    send_request(*send_prune_blockchain())
-    print('Sending stop daemon request')
-    send_request(*send_stop_daemon())
+    print('Fuzzing finished at iteration %d of %d.' %
+          (progress['next_iteration'], max_rpc_requests_to_send))
+    if not progress['failed']:
+        # After a failure monerod may be dead, the supervisor deals with it.
+        print('Sending prune request')
+        send_request(*send_prune_blockchain(),
+                     housekeeping=True,
+                     timeout=e2e_timeouts.TEARDOWN_TIMEOUT)
+        print('Sending stop daemon request')
+        send_request(*send_stop_daemon(),
+                     housekeeping=True,
+                     timeout=e2e_timeouts.TEARDOWN_TIMEOUT)
+    for conn_stats in transport.stats():
+        print('Connection %(id)d: %(requests)d requests, %(reuses)d reused, '
+              '%(reconnects)d reconnects' % conn_stats)
+    e2e_serialise.close_pool()
+    print('Chain state cache: %(chain_state_cache_hits)d hits, '
+          '%(chain_state_cache_misses)d misses, '
+          '%(chain_state_cache_invalidations)d invalidations' %
+          chain_state.stats())
+    total_traffic = traffic_stats['target'] + traffic_stats['housekeeping']
+    print('Traffic: %d target requests, %d housekeeping requests (%.1f%%)' %
+          (traffic_stats['target'], traffic_stats['housekeeping'],
+           100.0 * traffic_stats['housekeeping'] / max(total_traffic, 1)))
+    if hang_stats['hangs']:
+        print('Hangs: %d requests got no answer in time' % hang_stats['hangs'])
+    if e2e_trace.enabled:
+        e2e_trace.print_phases()
     print('Fuzzing step finished')
     print('Fuzzed for a total of %d seconds.' % (time.time() - start_time))
     return rpc_call_stats
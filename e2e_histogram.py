@@ -0,0 +1,79 @@
+"""Constant-size, mergeable latency histograms with log-spaced buckets."""
+
+import array
+import math
+
+# Buckets cover MIN_LATENCY to MIN_LATENCY * 10**DECADES seconds with
+# BUCKETS_PER_DECADE buckets per decade, so a reported percentile is at most
+# about 7.5% above the true value. Bucket 0 holds everything faster and
+# the last bucket everything slower.
+MIN_LATENCY = 1e-5
+DECADES = 9
+BUCKETS_PER_DECADE = 32
+NUM_BUCKETS = DECADES * BUCKETS_PER_DECADE + 2
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(latency: float) -> int:
+    if latency < MIN_LATENCY:
+        return 0
+    index = 1 + int(math.log10(latency / MIN_LATENCY) * BUCKETS_PER_DECADE)
+    return min(index, NUM_BUCKETS - 1)
+
+
+def bucket_upper_bound(index: int) -> float:
+    return MIN_LATENCY * 10**(index / BUCKETS_PER_DECADE)
+
+
+class LatencyHistogram:
+    """Counts latencies (in seconds) into log-spaced buckets. Memory use is
+    fixed no matter how many latencies are added."""
+
+    def __init__(self):
+        self.buckets = array.array('Q', bytes(8 * NUM_BUCKETS))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency: float):
+        self.buckets[bucket_index(latency)] += 1
+        self.count += 1
+        self.total += latency
+        if latency > self.max:
+            self.max = latency
+
+    def merge(self, other):
+        """Adds the counts of another histogram to this one."""
+        for index, value in enumerate(other.buckets):
+            if value:
+                self.buckets[index] += value
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> float:
+        """Returns the upper bound of the bucket holding the given
+        percentile, capped at the largest latency seen."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100.0)
+        seen = 0
+        for index, value in enumerate(self.buckets):
+            seen += value
+            if seen >= rank:
+                return min(bucket_upper_bound(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        summary = {f'p{percent:g}': self.percentile(percent)
+                   for percent in PERCENTILES}
+        summary['max'] = self.max
+        summary['mean'] = self.total / self.count if self.count else 0.0
+        return summary
+
+
+def merge_histograms(target: dict, source: dict):
+    """Merges a {name: LatencyHistogram} dict into another one."""
+    for name, histogram in source.items():
+        target.setdefault(name, LatencyHistogram()).merge(histogram)
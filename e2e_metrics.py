@@ -0,0 +1,180 @@
+"""Live metrics of a running campaign in Prometheus text format.
+
+A MetricsServer answers GET /metrics from a background thread of the
+fuzzing process, reading the fuzzer's counters as they are. Every metric
+is labelled with the monerod instance, so the workers of a --jobs campaign,
+each serving on its own port, can be scraped side by side."""
+
+import collections
+import http.server
+import threading
+import time
+
+import e2e_fuzzer
+import e2e_histogram
+
+PREFIX = 'monero_fuzz'
+# Upper bounds, in seconds, of the exported latency buckets. The finer
+# e2e_histogram buckets are folded into them.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Seconds the per-generator request rates are averaged over.
+RATE_WINDOW = 60.0
+# Least seconds between two request count samples for the rates.
+RATE_SAMPLE_INTERVAL = 1.0
+
+
+def _cumulative_buckets(histogram) -> list[int]:
+    """Counts of `histogram` at or below every LATENCY_BUCKETS bound, to
+    the resolution of the e2e_histogram buckets."""
+    counts = []
+    index = 0
+    seen = 0
+    for bound in LATENCY_BUCKETS:
+        while (index < e2e_histogram.NUM_BUCKETS and
+               e2e_histogram.bucket_upper_bound(index) <= bound):
+            seen += histogram.buckets[index]
+            index += 1
+        counts.append(seen)
+    return counts
+
+
+class CampaignMetrics:
+    """Renders the metrics of the campaign against monerod `instance`,
+    aiming for `rounds` requests in `duration` seconds (0 for no limit).
+    `campaign_stats` is e2e.campaign_stats, read for the restarts."""
+
+    def __init__(self, instance, rounds, duration, campaign_stats):
+        self.instance = instance
+        self.rounds = rounds
+        self.duration = duration
+        self.campaign_stats = campaign_stats
+        self.start = time.monotonic()
+        self._samples = collections.deque()
+        self._lock = threading.Lock()
+
+    def _rates(self, now, totals) -> dict[str, float]:
+        """Requests per second of every generator over the last
+        RATE_WINDOW seconds, from samples of the totals taken at most every
+        RATE_SAMPLE_INTERVAL seconds whenever metrics are rendered."""
+        with self._lock:
+            if (not self._samples or
+                    now - self._samples[-1][0] >= RATE_SAMPLE_INTERVAL):
+                self._samples.append((now, totals))
+            while len(self._samples) > 1 and now - self._samples[0][0] > (
+                    RATE_WINDOW):
+                self._samples.popleft()
+            then, old_totals = self._samples[0]
+        if now - then <= 0:
+            then, old_totals = self.start, {}
+        elapsed = max(now - then, 1e-9)
+        return {
+            name: (total - old_totals.get(name, 0)) / elapsed
+            for name, total in totals.items()
+        }
+
+    def render(self) -> str:
+        now = time.monotonic()
+        label = f'instance="{self.instance}"'
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+            for labels, value in samples:
+                labels = f'{label},{labels}' if labels else label
+                lines.append(f'{PREFIX}_{name}{{{labels}}} {value}')
+
+        call_stats = dict(e2e_fuzzer.call_stats)
+        totals = {
+            name: success + fail
+            for name, (success, fail) in call_stats.items()
+        }
+        metric('requests_total', 'counter',
+               'Requests sent by every generator, by outcome.',
+               [(f'generator="{name}",status="{status}"', count)
+                for name, (success, fail) in sorted(call_stats.items())
+                for status, count in (('success', success), ('fail', fail))])
+        metric('requests_per_second', 'gauge',
+               f'Requests per second of every generator over the last '
+               f'{RATE_WINDOW:g} seconds.',
+               [(f'generator="{name}"', f'{rate:.3f}')
+                for name, rate in sorted(self._rates(now, totals).items())])
+        metric('traffic_requests_total', 'counter',
+               'Requests sent to fuzz targets and for housekeeping.',
+               [(f'kind="{kind}"', count)
+                for kind, count in dict(e2e_fuzzer.traffic_stats).items()])
+        metric('hangs_total', 'counter',
+               'Requests that got no answer within their timeout.',
+               [('', e2e_fuzzer.hang_stats['hangs'])])
+        metric('monerod_restarts_total', 'counter',
+               'Times monerod was restarted after a crash or failure.',
+               [('', self.campaign_stats.get('monerod_restarts', 0))])
+        metric('iteration', 'gauge', 'Counter of the next iteration to run.',
+               [('', e2e_fuzzer.progress['next_iteration'])])
+        metric('rounds', 'gauge', 'Iterations the campaign runs at most.',
+               [('', self.rounds)])
+        metric('elapsed_seconds', 'gauge',
+               'Seconds since the campaign started.',
+               [('', f'{now - self.start:.3f}')])
+        metric('duration_seconds', 'gauge',
+               'Seconds the campaign runs at most, 0 for no limit.',
+               [('', self.duration)])
+
+        lines.append(f'# HELP {PREFIX}_latency_seconds Latency of the '
+                     f'requests of every generator.')
+        lines.append(f'# TYPE {PREFIX}_latency_seconds histogram')
+        for name, histogram in sorted(
+                dict(e2e_fuzzer.latency_histograms).items()):
+            generator = f'{label},generator="{name}"'
+            for bound, count in zip(LATENCY_BUCKETS,
+                                    _cumulative_buckets(histogram)):
+                lines.append(f'{PREFIX}_latency_seconds_bucket'
+                             f'{{{generator},le="{bound:g}"}} {count}')
+            lines.append(f'{PREFIX}_latency_seconds_bucket'
+                         f'{{{generator},le="+Inf"}} {histogram.count}')
+            lines.append(f'{PREFIX}_latency_seconds_sum{{{generator}}} '
+                         f'{histogram.total:.6f}')
+            lines.append(f'{PREFIX}_latency_seconds_count{{{generator}}} '
+                         f'{histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """Serves `metrics`, a CampaignMetrics, on http://host:port/metrics
+    from a daemon thread."""
+
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        handler = type('MetricsHandler', (_MetricsHandler,),
+                       {'metrics': metrics})
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+        host, port = self.server.server_address[:2]
+        print(f'Serving metrics on http://{host}:{port}/metrics')
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,245 @@
+"""Shrinks the request sequence leading up to a monerod crash with ddmin.
+
+Candidate subsequences are replayed in parallel, each on a scratch monerod
+with its own ports and data directory that is wiped before every test. The
+smallest sequence that still reproduces is written as a file that
+e2e_replay.py --seeds-file can replay."""
+
+import argparse
+import fcntl
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+
+import e2e
+import e2e_fuzzer
+import e2e_replay
+import e2e_timeouts
+
+# Scratch monerods use instances FIRST_INSTANCE and up, so their ports do
+# not clash with a campaign running on the same host.
+FIRST_INSTANCE = 100
+
+# Set in every pool process by _init_worker.
+_worker = {}
+
+
+def _claim_instance(workdir, count) -> int:
+    """Returns the first of the `count` scratch instances that no other
+    process holds, and holds it until this process exits. The lock goes
+    away with the process however it exits, so a pool process replacing
+    a dead one gets the dead one's instance."""
+    locks_dir = os.path.join(workdir, 'minimise')
+    os.makedirs(locks_dir, exist_ok=True)
+    for instance in range(FIRST_INSTANCE, FIRST_INSTANCE + count):
+        lock_file = open(os.path.join(locks_dir, f'{instance}.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        _worker['lock_file'] = lock_file
+        return instance
+    raise RuntimeError(f'all {count} scratch monerod instances are taken')
+
+
+def _init_worker(count, monerod_path, workdir, kind, timeouts):
+    instance = _claim_instance(workdir, count)
+    # Passed explicitly, pool processes are not necessarily forked.
+    e2e_fuzzer.timeouts = timeouts
+    scratch_dir = os.path.join(workdir, 'minimise', str(instance))
+    os.makedirs(scratch_dir, exist_ok=True)
+    _worker.update(instance=instance,
+                   monerod_path=monerod_path,
+                   workdir=workdir,
+                   scratch_dir=scratch_dir,
+                   kind=kind)
+
+
+def reproduces(requests) -> bool:
+    """Replays the (generator name, seed) pairs in `requests` on this
+    process' scratch monerod, started afresh. A 'crash' reproduces if
+    monerod exits with a non-zero code, a 'failure' if any request fails."""
+    instance = _worker['instance']
+    data_dir = os.path.join(_worker['scratch_dir'], 'data')
+    shutil.rmtree(data_dir, ignore_errors=True)
+    try:
+        monerod_proc, log_file = e2e.start_monerod(_worker['monerod_path'],
+                                                   _worker['scratch_dir'],
+                                                   instance, instance,
+                                                   data_dir)
+    except RuntimeError as e:
+        print(f'Scratch monerod {instance} did not start: {e}')
+        return False
+
+    e2e_fuzzer.set_rpc_port(e2e.monerod_ports(instance)[1])
+    e2e_fuzzer.chain_state.invalidate()
+    e2e_fuzzer.ban_dirty = True
+    try:
+        failed = e2e_fuzzer.replay(requests, _worker['workdir'],
+                                   stop_on_failure=True)
+        if failed:
+            try:
+                monerod_proc.wait(timeout=e2e.CRASH_GRACE_PERIOD)
+            except subprocess.TimeoutExpired:
+                pass
+        returncode = monerod_proc.poll()
+    finally:
+        e2e.stop_monerod(monerod_proc, log_file)
+
+    if _worker['kind'] == 'crash':
+        return returncode not in (None, 0)
+    return bool(failed)
+
+
+def _split(requests, n) -> list[list]:
+    """Splits `requests` into `n` contiguous chunks of nearly equal size."""
+    chunks = []
+    start = 0
+    for i in range(n):
+        end = start + (len(requests) - start) // (n - i)
+        chunks.append(requests[start:end])
+        start = end
+    return chunks
+
+
+class Minimiser:
+    """Runs ddmin over a list of requests. Every round tests the
+    chunks and their complements in batches of `parallel`, stopping at the
+    first batch that holds a reproducer."""
+
+    def __init__(self, pool, parallel):
+        self.pool = pool
+        self.parallel = parallel
+        self.tested = {}
+        self.tests = 0
+
+    def _first_reproducer(self, candidates):
+        pending = []
+        for candidate in candidates:
+            key = tuple(candidate)
+            if key in self.tested:
+                if self.tested[key]:
+                    return candidate
+            elif key not in pending:
+                pending.append(key)
+        for i in range(0, len(pending), self.parallel):
+            batch = pending[i:i + self.parallel]
+            results = self.pool.map(reproduces, [list(key) for key in batch])
+            self.tests += len(batch)
+            for key, result in zip(batch, results):
+                self.tested[key] = result
+            for key, result in zip(batch, results):
+                if result:
+                    return list(key)
+        return None
+
+    def run(self, requests) -> list:
+        n = 2
+        while len(requests) >= 2:
+            n = min(n, len(requests))
+            chunks = _split(requests, n)
+            complements = [[
+                request for j, chunk in enumerate(chunks) if j != i
+                for request in chunk
+            ] for i in range(n)]
+            reproducer = self._first_reproducer(chunks)
+            if reproducer is not None:
+                requests, n = reproducer, 2
+            else:
+                reproducer = self._first_reproducer(
+                    complements if n > 2 else [])
+                if reproducer is not None:
+                    requests, n = reproducer, max(n - 1, 2)
+                elif n >= len(requests):
+                    break
+                else:
+                    n = min(2 * n, len(requests))
+            print(f'{len(requests)} requests left after {self.tests} tests')
+        return requests
+
+
+def parse_args():
+    """CLI interface for the minimiser."""
+    parser = argparse.ArgumentParser(
+        description='Minimise the requests leading up to a monerod crash')
+    parser.add_argument('--workdir',
+                        default='./work',
+                        help='Directory holding monerod and the serialiser')
+    parser.add_argument('--seeds-file',
+                        required=True,
+                        help='crash.json of a saved crash, or an earlier '
+                        'reproducer')
+    parser.add_argument('--kind',
+                        choices=('crash', 'failure', 'hang'),
+                        help='What has to be reproduced, a hang reproduces '
+                        'like a failure (default: the kind recorded in the '
+                        'crash.json, else crash)')
+    parser.add_argument('--parallel',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='Number of scratch monerods to test on')
+    parser.add_argument('--output',
+                        help='Reproducer to write (default: minimised.json '
+                        'next to the seeds file)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = os.path.abspath(args.workdir)
+    try:
+        requests = e2e_replay.load_requests(args.seeds_file)
+    except ValueError as e:
+        raise SystemExit(f'Cannot minimise the seeds: {e}')
+    with open(args.seeds_file, encoding='utf-8') as f:
+        source = json.load(f)
+    kind = args.kind or source.get('kind', 'crash')
+    timeouts = e2e_timeouts.TimeoutBudget()
+    if 'hung_request' in source:
+        # A hang reproduces as a failure, given the timeout it hung on.
+        timeouts = e2e_timeouts.TimeoutBudget(
+            ceiling=source['hung_request']['timeout'])
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(args.seeds_file)), 'minimised.json')
+
+    t0 = time.monotonic()
+    with multiprocessing.Pool(args.parallel,
+                              initializer=_init_worker,
+                              initargs=(args.parallel,
+                                        os.path.join(workdir, 'monerod'),
+                                        workdir, kind, timeouts)) as pool:
+        if not pool.apply(reproduces, (requests,)):
+            print(f'The {len(requests)} requests do not reproduce the {kind}')
+            raise SystemExit(1)
+        minimiser = Minimiser(pool, args.parallel)
+        minimised = minimiser.run(requests)
+    elapsed = time.monotonic() - t0
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(
+            {
+                'kind': kind,
+                'campaign_seed': source.get('campaign_seed'),
+                'scheduler': source.get('scheduler'),
+                'requests': [{
+                    'name': name,
+                    'seed': seed
+                } for name, seed in minimised],
+                'iterations': [seed & 0xFFFFFFFF for _, seed in minimised],
+                'original_length': len(requests),
+                'tests': minimiser.tests + 1,
+                'seconds': elapsed,
+            },
+            f,
+            indent=2)
+    print(f'Minimised {len(requests)} requests to {len(minimised)} in '
+          f'{minimiser.tests + 1} tests and {elapsed:.0f} sec, '
+          f'written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""In-process encoder for epee's portable storage binary format.
+
+Produces the same bytes as monero_rpc_serialiser for the request types in
+its `binary_serialisers` table: the JSON object is read the way
+epee::serialization::load_t_from_json reads it into the request struct,
+and the struct is written the way store_t_to_binary writes it. Blob
+fields may also be given as bytes, or as hex strings of whole hashes,
+which both encoders decode before loading."""
+
+import struct
+
+# storage_block_header: signature A, signature B and format version.
+PORTABLE_STORAGE_HEADER = struct.pack('<IIB', 0x01011101, 0x01020101, 1)
+
+SERIALIZE_TYPE_UINT64 = 5
+SERIALIZE_TYPE_UINT8 = 8
+SERIALIZE_TYPE_STRING = 10
+SERIALIZE_TYPE_BOOL = 11
+SERIALIZE_TYPE_OBJECT = 12
+SERIALIZE_FLAG_ARRAY = 0x80
+
+HASH_SIZE = 32
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+# Field kinds used in the request schemas below.
+UINT64 = 'uint64'
+UINT8 = 'uint8'
+BOOL = 'bool'
+STRING = 'string'
+UINT64_LIST = 'uint64_list'
+HASH_LIST_BLOB = 'hash_list_blob'  # KV_SERIALIZE_CONTAINER_POD_AS_BLOB
+HASH_BLOB = 'hash_blob'  # KV_SERIALIZE_VAL_POD_AS_BLOB
+OUTPUTS_LIST = 'outputs_list'  # std::vector<get_outputs_out>
+
+# Every request derives from rpc_access_request_base, which adds `client`.
+# Defaults are those of KV_SERIALIZE_OPT. Fields serialised with plain
+# KV_SERIALIZE have no default and are left zeroed when the JSON lacks them.
+_ACCESS_BASE = [('client', STRING, '')]
+
+REQUEST_SCHEMAS = {
+    '/get_blocks.bin':
+    _ACCESS_BASE + [
+        ('requested_info', UINT8, 0),
+        ('block_ids', HASH_LIST_BLOB, None),
+        ('start_height', UINT64, None),
+        ('prune', BOOL, None),
+        ('no_miner_tx', BOOL, False),
+        ('high_height_ok', BOOL, False),
+        ('pool_info_since', UINT64, 0),
+        ('max_block_count', UINT64, 0),
+    ],
+    '/get_blocks_by_height.bin':
+    _ACCESS_BASE + [
+        ('heights', UINT64_LIST, None),
+    ],
+    '/get_hashes.bin':
+    _ACCESS_BASE + [
+        ('block_ids', HASH_LIST_BLOB, None),
+        ('start_height', UINT64, None),
+    ],
+    '/get_o_indexes.bin':
+    _ACCESS_BASE + [
+        ('txid', HASH_BLOB, None),
+    ],
+    '/get_outs.bin':
+    _ACCESS_BASE + [
+        ('outputs', OUTPUTS_LIST, None),
+        ('get_txid', BOOL, True),
+    ],
+    '/get_output_distribution.bin':
+    _ACCESS_BASE + [
+        ('amounts', UINT64_LIST, None),
+        ('from_height', UINT64, 0),
+        ('to_height', UINT64, 0),
+        ('cumulative', BOOL, False),
+        ('binary', BOOL, True),
+        ('compress', BOOL, False),
+    ],
+}
+
+_GET_OUTPUTS_OUT_SCHEMA = [('amount', UINT64, None), ('index', UINT64, None)]
+
+_ZERO_VALUES = {
+    UINT64: 0,
+    UINT8: 0,
+    BOOL: False,
+    STRING: '',
+    UINT64_LIST: [],
+    HASH_LIST_BLOB: b'',
+    HASH_BLOB: bytes(HASH_SIZE),
+    OUTPUTS_LIST: [],
+}
+
+
+def pack_varint(value: int) -> bytes:
+    """Encodes a size the way epee's pack_varint does, the two low bits
+    hold the width of the encoded integer."""
+    if value <= 63:
+        return struct.pack('<B', value << 2)
+    if value <= 16383:
+        return struct.pack('<H', (value << 2) | 1)
+    if value <= 1073741823:
+        return struct.pack('<I', (value << 2) | 2)
+    if value <= 4611686018427387903:
+        return struct.pack('<Q', (value << 2) | 3)
+    raise ValueError(f'value too large for a varint: {value}')
+
+
+def _load_uint(value, bits):
+    # JSON integers outside the field range fail to load, as do floats and
+    # booleans, in which case the field keeps its default.
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    if value < 0 or value >= 1 << bits:
+        return None
+    return value
+
+
+def _is_hash_hex(value: str) -> bool:
+    return (value != '' and len(value) % (2 * HASH_SIZE) == 0 and
+            all(c in _HEX_DIGITS for c in value))
+
+
+def _load_blob(value) -> bytes | None:
+    """Returns the bytes of a blob field. Hex strings of whole hashes are
+    decoded, matching the hex decoding in monero_rpc_serialiser, and bytes
+    are loaded like their hex, which is how they reach the C++ tool. Other
+    strings are taken as raw bytes, the way epee loads them."""
+    if isinstance(value, bytes):
+        if len(value) % HASH_SIZE == 0:
+            return value
+        value = value.hex()
+    elif not isinstance(value, str):
+        return None
+    if _is_hash_hex(value):
+        return bytes.fromhex(value)
+    return value.encode('utf-8')
+
+
+def _load_field(kind, value):
+    """Converts a JSON value to the field value, or None if epee would
+    reject it."""
+    if kind == UINT64:
+        return _load_uint(value, 64)
+    if kind == UINT8:
+        return _load_uint(value, 8)
+    if kind == BOOL:
+        return value if isinstance(value, bool) else None
+    if kind == STRING:
+        return value if isinstance(value, str) else None
+    if kind == UINT64_LIST:
+        if not isinstance(value, list):
+            return None
+        values = [_load_uint(item, 64) for item in value]
+        return None if None in values else values
+    if kind == HASH_LIST_BLOB:
+        blob = _load_blob(value)
+        return blob if blob is not None and len(blob) % HASH_SIZE == 0 else None
+    if kind == HASH_BLOB:
+        blob = _load_blob(value)
+        return blob if blob is not None and len(blob) == HASH_SIZE else None
+    if kind == OUTPUTS_LIST:
+        if not isinstance(value, list):
+            return None
+        outputs = []
+        for item in value:
+            if not isinstance(item, dict):
+                return None
+            outputs.append(_load_struct(_GET_OUTPUTS_OUT_SCHEMA, item))
+        return outputs
+    raise ValueError(f'unknown field kind: {kind}')
+
+
+def _load_struct(schema, json_obj) -> dict:
+    fields = {}
+    for name, kind, default in schema:
+        value = None
+        if name in json_obj:
+            value = _load_field(kind, json_obj[name])
+        if value is None:
+            value = default if default is not None else _ZERO_VALUES[kind]
+        fields[name] = value
+    return fields
+
+
+def _encode_entry(kind, value) -> bytes | None:
+    """Encodes one storage entry including its type byte. Returns None for
+    empty containers, which epee does not store."""
+    if kind == UINT64:
+        return struct.pack('<BQ', SERIALIZE_TYPE_UINT64, value)
+    if kind == UINT8:
+        return struct.pack('<BB', SERIALIZE_TYPE_UINT8, value)
+    if kind == BOOL:
+        return struct.pack('<BB', SERIALIZE_TYPE_BOOL, int(value))
+    if kind == STRING:
+        raw = value.encode('utf-8')
+        return bytes([SERIALIZE_TYPE_STRING]) + pack_varint(len(raw)) + raw
+    if kind in (HASH_LIST_BLOB, HASH_BLOB):
+        if not value:
+            return None
+        return bytes([SERIALIZE_TYPE_STRING]) + pack_varint(len(value)) + value
+    if kind == UINT64_LIST:
+        if not value:
+            return None
+        return (bytes([SERIALIZE_TYPE_UINT64 | SERIALIZE_FLAG_ARRAY]) +
+                pack_varint(len(value)) +
+                struct.pack(f'<{len(value)}Q', *value))
+    if kind == OUTPUTS_LIST:
+        if not value:
+            return None
+        return (bytes([SERIALIZE_TYPE_OBJECT | SERIALIZE_FLAG_ARRAY]) +
+                pack_varint(len(value)) + b''.join(
+                    _encode_section(_GET_OUTPUTS_OUT_SCHEMA, item)
+                    for item in value))
+    raise ValueError(f'unknown field kind: {kind}')
+
+
+def _encode_section(schema, fields) -> bytes:
+    # Sections keep their entries in a std::map, so they are written in
+    # name order rather than declaration order.
+    entries = []
+    for name, kind, _ in sorted(schema, key=lambda field: field[0]):
+        encoded = _encode_entry(kind, fields[name])
+        if encoded is not None:
+            raw_name = name.encode('ascii')
+            entries.append(bytes([len(raw_name)]) + raw_name + encoded)
+    return pack_varint(len(entries)) + b''.join(entries)
+
+
+def encode_request(json_obj: dict, endpoint: str) -> bytes:
+    """Serialises the JSON request for a binary endpoint such as
+    '/get_blocks.bin'. Raises KeyError for endpoints without a schema."""
+    schema = REQUEST_SCHEMAS[endpoint]
+    fields = _load_struct(schema, json_obj)
+    return PORTABLE_STORAGE_HEADER + _encode_section(schema, fields)
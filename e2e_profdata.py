@@ -0,0 +1,155 @@
+"""Background merging of monerod profraw files into a running profdata.
+
+monerod profiles are moved to a pending directory once their process has
+stopped. A ProfileMerger folds them into workdir/monerod.profdata at
+intervals, deletes the merged profraws, and appends a point to the
+coverage-over-time series in coverage_over_time.json. With continuous
+mode on (--coverage-feedback), the profiles of the running monerods are
+read at every interval as well, so the series also grows while no
+monerod stops."""
+
+import glob
+import json
+import os
+import subprocess
+import threading
+import time
+
+import e2e_coverage
+import e2e_toolchain
+
+# Finished profraws waiting to be merged, relative to the workdir.
+PENDING_DIR = 'profraw'
+PROFDATA = 'monerod.profdata'
+SERIES = 'coverage_over_time.json'
+
+
+def merge(toolchain, inputs):
+    """Merges the workdir files `inputs` into monerod.profdata, replacing
+    it. Unreadable profraws, e.g. from a monerod that was killed while
+    writing it, are skipped instead of failing the whole merge."""
+    toolchain.run('llvm-profdata', [
+        'merge', '-sparse', '-failure-mode=all',
+        *[toolchain.path(name) for name in inputs], '-o',
+        toolchain.path(PROFDATA + '.new')
+    ],
+                  stdout=subprocess.DEVNULL,
+                  outputs=[PROFDATA + '.new'])
+    os.replace(os.path.join(toolchain.workdir, PROFDATA + '.new'),
+               os.path.join(toolchain.workdir, PROFDATA))
+
+
+def merge_all(toolchain):
+    """Merges every profraw under the workdir, and the merged profile if
+    there is one, into monerod.profdata."""
+    inputs = []
+    for root, _, files in os.walk(toolchain.workdir):
+        inputs.extend(
+            os.path.relpath(os.path.join(root, name), toolchain.workdir)
+            for name in files if name.endswith('.profraw'))
+    if os.path.exists(os.path.join(toolchain.workdir, PROFDATA)):
+        inputs.append(PROFDATA)
+    merge(toolchain, inputs)
+
+
+def reset(workdir):
+    """Deletes the merged profile, series and pending profraws of an
+    earlier campaign in the same workdir."""
+    for name in (PROFDATA, SERIES):
+        if os.path.exists(os.path.join(workdir, name)):
+            os.remove(os.path.join(workdir, name))
+    for path in glob.glob(os.path.join(workdir, PENDING_DIR, '*.profraw')):
+        os.remove(path)
+
+
+class ProfileMerger:
+    """Merges the profraws in workdir/profraw into workdir/monerod.profdata
+    every `interval` seconds from a background thread."""
+
+    def __init__(self, workdir, interval, toolchain=None):
+        self.workdir = workdir
+        self.interval = interval
+        self.toolchain = toolchain or e2e_toolchain.Toolchain(workdir)
+        self.pending_dir = os.path.join(workdir, PENDING_DIR)
+        self.covered = 0
+        self.merged = 0
+        self.series = []
+        self.start_time = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(self.pending_dir, exist_ok=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.merge_pending(read_live=True)
+
+    def stop(self) -> bool:
+        """Stops the background thread and merges what is left. Returns
+        whether every profraw made it into the merged profile."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.merge_pending()
+
+    def read_live(self) -> int:
+        """Adds the counters covered so far by the running monerods, whose
+        workdir/monerod*.profraw is kept up to date in continuous mode.
+        Without continuous mode the profiles only appear once monerod
+        exits, and are then read when merged. Returns the number of
+        profiles read."""
+        read = 0
+        for path in glob.glob(os.path.join(self.workdir, 'monerod*.profraw')):
+            try:
+                # Left over from an earlier campaign.
+                if os.path.getmtime(path) < self.start_time:
+                    continue
+                bits, _ = e2e_coverage.read_covered(path)
+            except (OSError, ValueError):
+                continue
+            self.covered |= bits
+            read += 1
+        return read
+
+    def merge_pending(self, read_live=False) -> bool:
+        """Merges the pending profraws and deletes them, and with
+        `read_live` reads the profiles of the running monerods too, adding
+        a point to the series if there was any profile. Returns False if
+        llvm-profdata failed, the profraws are then kept for the next try."""
+        paths = sorted(glob.glob(os.path.join(self.pending_dir, '*.profraw')))
+        t0 = time.monotonic()
+        if paths:
+            inputs = [os.path.relpath(path, self.workdir) for path in paths]
+            if os.path.exists(os.path.join(self.workdir, PROFDATA)):
+                inputs.append(PROFDATA)
+            try:
+                merge(self.toolchain, inputs)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f'Merging {len(paths)} profiles failed: {e}')
+                return False
+
+        for path in paths:
+            try:
+                bits, _ = e2e_coverage.read_covered(path)
+                self.covered |= bits
+            except (OSError, ValueError):
+                pass
+            os.remove(path)
+        self.merged += len(paths)
+        live = self.read_live() if read_live else 0
+        if not paths and not live:
+            return True
+        self.series.append({
+            'seconds': time.time() - self.start_time,
+            'profiles_merged': self.merged,
+            'live_profiles': live,
+            'covered_counters': self.covered.bit_count(),
+            'merge_seconds': time.monotonic() - t0,
+        })
+        with open(os.path.join(self.workdir, SERIES), 'w',
+                  encoding='utf-8') as f:
+            json.dump(self.series, f, indent=2)
+        return True
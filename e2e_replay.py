@@ -0,0 +1,167 @@
+"""Replays fuzzing iterations from their seeds against a fresh monerod."""
+
+import argparse
+import json
+import os
+import shutil
+
+import e2e
+import e2e_fuzzer
+import e2e_results
+import e2e_scheduler
+
+
+def parse_iterations(text) -> range:
+    """Parses 'N' or 'A-B' (inclusive) into a range of iteration counters."""
+    first, _, last = text.partition('-')
+    first = int(first)
+    last = int(last) if last else first
+    if last < first:
+        raise argparse.ArgumentTypeError(f'empty iteration range: {text}')
+    return range(first, last + 1)
+
+
+def load_requests(path) -> list[tuple[str, int]]:
+    """Reads the (generator name, seed) pairs of a reproducer written by
+    e2e_minimise.py, a corpus entry, or the last requests of a
+    crash.json. Requests without a name get None, to be picked from the
+    seed, which raises ValueError unless the file records a scheduler
+    that picks generators from the seed."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    requests = [(request.get('name'), request['seed'])
+                for request in data.get('requests', data.get('last_requests'))
+                if request['seed'] is not None]
+    scheduler = data.get('scheduler')
+    if (any(name is None for name, _ in requests) and
+            scheduler not in e2e_scheduler.SEED_PICKED_SCHEDULERS):
+        raise ValueError(f'{path} has requests without a generator name, '
+                         f'which a {scheduler or "unrecorded"} scheduler '
+                         'does not pick from the seed')
+    return requests
+
+
+def lookup_names(results_path, seeds) -> dict[int, str]:
+    """Returns {seed: generator name} for every seed in `seeds`, with the
+    name recorded in the results database at `results_path`. The
+    generator cannot be told from the seed alone, schedulers other than
+    the uniform one pick it from their own state. Raises ValueError for
+    seeds without a recorded request."""
+    if not os.path.isfile(results_path):
+        raise ValueError(f'{results_path} not found')
+    results = e2e_results.ResultsStore(results_path)
+    try:
+        names = results.names(seeds)
+    finally:
+        results.close()
+    missing = [seed for seed in seeds if seed not in names]
+    if missing:
+        raise ValueError(f'{len(missing)} seeds have no request in '
+                         f'{results_path}, first {missing[0]}')
+    return names
+
+
+def parse_args():
+    """CLI interface for the replay."""
+    parser = argparse.ArgumentParser(
+        description='Replay fuzzing iterations of a campaign')
+    parser.add_argument('--workdir',
+                        default='./work',
+                        help='Directory holding monerod and the serialiser')
+    parser.add_argument('--campaign-seed',
+                        type=int,
+                        help='Campaign seed printed by the fuzzer')
+    parser.add_argument('--iterations',
+                        type=parse_iterations,
+                        help='Iteration, or inclusive range A-B, to replay')
+    parser.add_argument('--seed',
+                        type=int,
+                        action='append',
+                        default=[],
+                        help='Iteration seed from results.sqlite, can be '
+                        'given several times')
+    parser.add_argument('--results',
+                        help='Results database to look up the generators of '
+                        '--seed and --iterations in (default: '
+                        'results.sqlite in the workdir)')
+    parser.add_argument('--seeds-file',
+                        help='Replay the requests of a minimised reproducer, '
+                        'a corpus entry or a crash.json')
+    parser.add_argument('--rpc-port',
+                        type=int,
+                        help='Replay against a monerod already listening on '
+                        'this port instead of starting a fresh one')
+    parser.add_argument('--stop-on-failure',
+                        action='store_true',
+                        help='Stop at the first failing request')
+    parser.add_argument('--debug',
+                        action='store_true',
+                        help='Enable debug mode')
+    args = parser.parse_args()
+    if args.iterations is not None and args.campaign_seed is None:
+        parser.error('--iterations requires --campaign-seed')
+    if args.iterations is None and not args.seed and not args.seeds_file:
+        parser.error('give --campaign-seed and --iterations, --seed or '
+                     '--seeds-file')
+    return args
+
+
+def main():
+    args = parse_args()
+    workdir = os.path.abspath(args.workdir)
+
+    iteration_seeds = []
+    if args.iterations is not None:
+        iteration_seeds = [
+            e2e_fuzzer.iteration_seed(args.campaign_seed, counter)
+            for counter in args.iterations
+        ]
+    named = {}
+    if args.seed or iteration_seeds:
+        # Plain seeds replay the generator the campaign recorded for them.
+        try:
+            named = lookup_names(
+                args.results or os.path.join(workdir, e2e_results.RESULTS_DB),
+                args.seed + iteration_seeds)
+        except ValueError as e:
+            raise SystemExit(f'Cannot replay the seeds: {e}')
+    requests = [(named[seed], seed) for seed in args.seed]
+    if args.seeds_file:
+        try:
+            requests.extend(load_requests(args.seeds_file))
+        except ValueError as e:
+            raise SystemExit(f'Cannot replay the seeds: {e}')
+    requests.extend((named[seed], seed) for seed in iteration_seeds)
+    known = {call.__name__ for call in e2e_fuzzer.get_rpc_calls()}
+    unknown = sorted({name for name, _ in requests if name is not None} -
+                     known)
+    if unknown:
+        raise SystemExit(f'Unknown generators: {", ".join(unknown)}')
+
+    monerod_proc = None
+    log_file = None
+    if args.rpc_port:
+        e2e_fuzzer.set_rpc_port(args.rpc_port)
+    else:
+        # A fresh data dir, so the chain starts out like the campaign's.
+        data_dir = os.path.join(workdir, 'replay-data')
+        shutil.rmtree(data_dir, ignore_errors=True)
+        monerod_proc, log_file = e2e.start_monerod(
+            os.path.join(workdir, 'monerod'), workdir, 'replay', 0, data_dir)
+        e2e_fuzzer.set_rpc_port(e2e.monerod_ports(0)[1])
+
+    print(f'Replaying {len(requests)} iterations')
+    failed = e2e_fuzzer.replay(requests, workdir, args.debug,
+                               args.stop_on_failure)
+
+    crashed = monerod_proc is not None and monerod_proc.poll() is not None
+    if crashed:
+        print(f'monerod exited with code {monerod_proc.returncode}, see '
+              f'{os.path.join(workdir, "monerodreplay.log")}')
+    e2e.stop_monerod(monerod_proc, log_file)
+    print(f'Replay finished, {len(failed)} failed requests')
+    raise SystemExit(1 if failed or crashed else 0)
+
+
+if __name__ == '__main__':
+    main()
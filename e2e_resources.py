@@ -0,0 +1,214 @@
+"""Samples monerod's resource usage and ties its growth to the endpoints
+fuzzed meanwhile.
+
+A ResourceSampler reads /proc/<pid> (RSS, CPU time, threads, open fds)
+and the size of the LMDB database every `interval` seconds from a
+background thread. Every sample also holds the requests of each generator
+since the previous one. leak_suspects() then looks for metrics that keep
+growing and for the generators most often sent while they grew."""
+
+import json
+import os
+import threading
+import time
+
+SERIES = 'resource_usage.json'
+SUSPECTS = 'leak_suspects.json'
+METRICS = ('rss_bytes', 'open_fds', 'threads', 'lmdb_bytes')
+# A generator is a suspect if the metric grew in at least this share of
+# the windows it was sent in.
+MIN_GROWTH_SHARE = 0.6
+# Windows a generator has to be sent in before it can be a suspect.
+MIN_WINDOWS = 5
+# Suspects listed per metric.
+MAX_SUSPECTS = 20
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def lmdb_paths(data_dir) -> list[str]:
+    """LMDB files of a monerod data directory, None for the default one.
+    A --regtest monerod keeps its database under fake/."""
+    data_dir = data_dir or os.path.expanduser('~/.bitmonero')
+    return [
+        os.path.join(data_dir, 'lmdb', 'data.mdb'),
+        os.path.join(data_dir, 'fake', 'lmdb', 'data.mdb')
+    ]
+
+
+def read_usage(pid, lmdb=()) -> dict:
+    """Returns the resource usage of process `pid`, plus the disk space
+    used by the files in `lmdb`. Raises OSError once the process is gone."""
+    with open(f'/proc/{pid}/stat', encoding='utf-8') as f:
+        # The command name may contain spaces, fields follow its ')'.
+        fields = f.read().rsplit(')', 1)[1].split()
+    with open(f'/proc/{pid}/statm', encoding='utf-8') as f:
+        rss_pages = int(f.read().split()[1])
+    lmdb_bytes = 0
+    for path in lmdb:
+        try:
+            # Allocated size, LMDB files are sparse.
+            lmdb_bytes += os.stat(path).st_blocks * 512
+        except OSError:
+            pass
+    return {
+        'rss_bytes': rss_pages * _PAGE_SIZE,
+        'cpu_seconds': (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS,
+        'threads': int(fields[17]),
+        'open_fds': len(os.listdir(f'/proc/{pid}/fd')),
+        'lmdb_bytes': lmdb_bytes,
+    }
+
+
+class ResourceSampler:
+    """Samples the usage of the monerod with `pid` every `interval`
+    seconds. The fuzzer reports every request with record()."""
+
+    def __init__(self, pid, data_dir, interval):
+        self.pid = pid
+        self.lmdb = lmdb_paths(data_dir)
+        self.interval = interval
+        self.samples = []
+        self.start_time = time.monotonic()
+        # Requests since the last sample, counted on the fuzzing thread and
+        # taken by the sampler thread.
+        self._requests = {}
+        self._requests_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, name):
+        with self._requests_lock:
+            self._requests[name] = self._requests.get(name, 0) + 1
+
+    def set_process(self, pid):
+        """Follows a restarted monerod. Growth is not compared across
+        samples of different processes."""
+        self.pid = pid
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        pid = self.pid
+        try:
+            usage = read_usage(pid, self.lmdb)
+        except (OSError, ValueError, IndexError):
+            # monerod is restarting, its requests go to the next sample.
+            return
+        with self._requests_lock:
+            requests, self._requests = self._requests, {}
+        self.samples.append({
+            'seconds': time.monotonic() - self.start_time,
+            'pid': pid,
+            **usage,
+            'requests': requests,
+        })
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+
+    def write(self, target_dir):
+        """Writes the samples and the leak suspects to target_dir."""
+        write_samples(self.samples, target_dir)
+
+
+def write_samples(samples, target_dir):
+    """Writes `samples` and their leak suspects to target_dir."""
+    with open(os.path.join(target_dir, SERIES), 'w', encoding='utf-8') as f:
+        json.dump(samples, f, indent=1)
+    with open(os.path.join(target_dir, SUSPECTS), 'w',
+              encoding='utf-8') as f:
+        json.dump(leak_suspects(samples), f, indent=2)
+
+
+def merge_samples(source_dirs, target_dir):
+    """Writes the samples written to each of `source_dirs`, tagged with the
+    index of their directory as 'worker', and their leak suspects to
+    target_dir. Windows never span two processes, so the samples of
+    different workers are not compared with each other."""
+    samples = []
+    for worker, source_dir in enumerate(source_dirs):
+        path = os.path.join(source_dir, SERIES)
+        if not os.path.isfile(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            samples.extend({
+                'worker': worker,
+                **sample
+            } for sample in json.load(f))
+    write_samples(samples, target_dir)
+
+
+def leak_suspects(samples) -> dict:
+    """Finds the generators associated with the growth of every metric.
+
+    Each pair of consecutive samples of one process is a window, holding
+    the metric's change and the requests sent meanwhile. A window's change
+    is shared between its generators by their number of requests. A
+    generator is a suspect for a metric if that metric grew in at least
+    MIN_GROWTH_SHARE of its windows and its windows grew more on average
+    than those without it. Suspects are ranked by the growth shared to
+    them per request."""
+    windows = [(before, after) for before, after in zip(samples, samples[1:])
+               if before['pid'] == after['pid']]
+    result = {}
+    for metric in METRICS:
+        deltas = [(after[metric] - before[metric], after['requests'])
+                  for before, after in windows]
+        stats = {}
+        for delta, requests in deltas:
+            total = sum(requests.values())
+            for name, count in requests.items():
+                entry = stats.setdefault(name, {
+                    'requests': 0,
+                    'windows': 0,
+                    'growing_windows': 0,
+                    'growth_with': 0,
+                    'attributed': 0.0,
+                })
+                entry['requests'] += count
+                entry['windows'] += 1
+                entry['growing_windows'] += delta > 0
+                entry['growth_with'] += delta
+                entry['attributed'] += delta * count / total
+
+        suspects = []
+        for name, entry in stats.items():
+            without = [
+                delta for delta, requests in deltas if name not in requests
+            ]
+            mean_with = entry['growth_with'] / entry['windows']
+            mean_without = sum(without) / len(without) if without else 0.0
+            share = entry['growing_windows'] / entry['windows']
+            if (entry['windows'] >= MIN_WINDOWS and entry['attributed'] > 0 and
+                    share >= MIN_GROWTH_SHARE and mean_with > mean_without):
+                suspects.append({
+                    'generator': name,
+                    'growth_per_request': entry['attributed'] /
+                                          entry['requests'],
+                    'attributed_growth': entry['attributed'],
+                    'growing_window_share': share,
+                    'mean_growth_with': mean_with,
+                    'mean_growth_without': mean_without,
+                    'requests': entry['requests'],
+                    'windows': entry['windows'],
+                })
+        suspects.sort(key=lambda entry: entry['growth_per_request'],
+                      reverse=True)
+        growing = sum(delta > 0 for delta, _ in deltas)
+        result[metric] = {
+            'growth': sum(delta for delta, _ in deltas),
+            'growing_window_share': growing / len(deltas) if deltas else 0.0,
+            'suspects': suspects[:MAX_SUSPECTS],
+        }
+    return result
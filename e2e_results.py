@@ -0,0 +1,166 @@
+"""On-disk store for the results of every request sent during a campaign."""
+
+import json
+import os
+import sqlite3
+import time
+
+RESULTS_DB = 'results.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    worker INTEGER NOT NULL DEFAULT 0,
+    name TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    seed INTEGER,
+    finished REAL NOT NULL,
+    latency REAL NOT NULL,
+    status TEXT NOT NULL,
+    response_size INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS calls_name_status ON calls (name, status);
+CREATE INDEX IF NOT EXISTS calls_endpoint ON calls (endpoint);
+CREATE INDEX IF NOT EXISTS calls_latency ON calls (latency);
+CREATE TABLE IF NOT EXISTS campaign (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_COLUMNS = ('worker', 'name', 'endpoint', 'seed', 'finished', 'latency',
+            'status', 'response_size')
+
+
+def remove_store(path):
+    """Deletes a results database left over from an earlier campaign."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class ResultsStore:
+    """SQLite database with one row per request.
+
+    Rows are buffered and written in batches of `batch_size`, or once
+    `flush_interval` seconds have passed since the last write, so a
+    campaign that dies keeps everything but its last few requests."""
+
+    def __init__(self, path, worker=0, batch_size=500, flush_interval=5.0):
+        self.path = path
+        self.worker = worker
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+
+    def set_info(self, key, value):
+        """Records a campaign setting, such as the scheduler, that replays
+        need to know."""
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO campaign (key, value) VALUES (?, ?)',
+                (key, value))
+
+    def info(self, key):
+        """Returns a campaign setting recorded by set_info, or None."""
+        row = self.conn.execute('SELECT value FROM campaign WHERE key = ?',
+                                (key,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, name, endpoint, success, latency, response_size=0,
+            seed=None, status=None):
+        """Queues one request result. `status` defaults to 'success' or
+        'fail' depending on `success`."""
+        if status is None:
+            status = 'success' if success else 'fail'
+        self._pending.append((self.worker, name, endpoint, seed, time.time(),
+                              latency, status, response_size))
+        if (len(self._pending) >= self.batch_size or
+                time.monotonic() - self._last_flush > self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany(
+                    f'INSERT INTO calls ({", ".join(_COLUMNS)}) '
+                    f'VALUES ({", ".join("?" * len(_COLUMNS))})',
+                    self._pending)
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def __len__(self):
+        self.flush()
+        return self.conn.execute('SELECT COUNT(*) FROM calls').fetchone()[0]
+
+    def call_stats(self, names=()) -> dict[str, tuple[int, int]]:
+        """Returns {name: (success_count, fail_count)}, with an entry for
+        every name in `names` even if it was never called."""
+        self.flush()
+        stats = {name: (0, 0) for name in names}
+        rows = self.conn.execute(
+            "SELECT name, SUM(status = 'success'), SUM(status != 'success') "
+            'FROM calls GROUP BY name')
+        for name, success, fail in rows:
+            stats[name] = (success, fail)
+        return stats
+
+    def slowest(self, limit=100) -> list[dict]:
+        """Returns the `limit` slowest requests, slowest first."""
+        self.flush()
+        rows = self.conn.execute(
+            f'SELECT {", ".join(_COLUMNS)} FROM calls '
+            'ORDER BY latency DESC LIMIT ?', (limit,))
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def last(self, limit=50) -> list[dict]:
+        """Returns the `limit` most recent requests, oldest first."""
+        self.flush()
+        rows = self.conn.execute(
+            f'SELECT {", ".join(_COLUMNS)} FROM calls '
+            'ORDER BY id DESC LIMIT ?', (limit,))
+        return [dict(zip(_COLUMNS, row)) for row in rows][::-1]
+
+    def names(self, seeds) -> dict[int, str]:
+        """Returns {seed: generator name} for the requests in `seeds` that
+        were recorded."""
+        self.flush()
+        names = {}
+        seeds = list(seeds)
+        for i in range(0, len(seeds), 500):
+            chunk = seeds[i:i + 500]
+            rows = self.conn.execute(
+                'SELECT seed, name FROM calls '
+                f'WHERE seed IN ({", ".join("?" * len(chunk))})', chunk)
+            names.update(rows)
+        return names
+
+    def dump_slowest(self, path, limit=100):
+        """Writes the slowest requests to a JSON file."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.slowest(limit), f, indent=2)
+
+    def merge(self, source_path, worker):
+        """Copies every row of another results database into this one,
+        tagged with `worker`."""
+        self.flush()
+        columns = ', '.join(_COLUMNS[1:])
+        self.conn.execute('ATTACH DATABASE ? AS source', (source_path,))
+        try:
+            with self.conn:
+                self.conn.execute(
+                    f'INSERT INTO calls (worker, {columns}) '
+                    f'SELECT ?, {columns} FROM source.calls', (worker,))
+                self.conn.execute('INSERT OR REPLACE INTO campaign '
+                                  'SELECT key, value FROM source.campaign')
+        finally:
+            self.conn.execute('DETACH DATABASE source')
+
+    def close(self):
+        self.flush()
+        self.conn.close()
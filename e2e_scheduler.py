@@ -0,0 +1,155 @@
+"""Schedulers picking the request generator of every fuzzing iteration."""
+
+import json
+import math
+import random
+
+SCHEDULERS = ('uniform', 'bandit')
+# Schedulers whose picks follow from the iteration seed alone, so a plain
+# seed replays the request it was sent with.
+SEED_PICKED_SCHEDULERS = ('uniform',)
+
+# Weight of the newest value in the per-generator moving averages.
+EMA_ALPHA = 0.05
+# Exploration bonus, relative to the reward of the best generator.
+EXPLORATION = 0.5
+# A failed request is worth as many new coverage counters as this.
+ERROR_REWARD = 50.0
+# Bounds of a generator's latency cost, relative to the median latency.
+MIN_COST = 0.1
+MAX_COST = 10.0
+# Weight bounds of generators without their own in the limits file.
+DEFAULT_FLOOR = 0.05
+DEFAULT_CEILING = 5.0
+
+
+def load_limits(path, names) -> dict[str, tuple[float, float]]:
+    """Reads per-generator weight limits from a JSON file mapping
+    generator names to [floor, ceiling]. Raises ValueError for a name not
+    in `names`, the generators the fuzzer picks from."""
+    with open(path, encoding='utf-8') as f:
+        limits = {name: tuple(bounds) for name, bounds in json.load(f).items()}
+    unknown = sorted(set(limits) - set(names))
+    if unknown:
+        raise ValueError(f'unknown generators in {path}: '
+                         f'{", ".join(unknown)}')
+    return limits
+
+
+class UniformScheduler:
+    """Leaves the pick to generate_iteration, which draws it from the
+    iteration seed, so every generator is equally likely and plain seeds
+    replay the campaign."""
+    name = 'uniform'
+
+    def __init__(self):
+        self.picks = {}
+
+    def choose(self, rpc_calls):
+        """Returns the generator of the next iteration, None to pick it
+        from the iteration seed."""
+        return None
+
+    def record(self, name, success, latency):
+        """Feeds back a finished request."""
+        self.picks[name] = self.picks.get(name, 0) + 1
+
+    def reward_coverage(self, name, new_counters):
+        """Feeds back the new coverage counters credited to a request."""
+
+    def weights(self, names) -> list[float]:
+        return [1.0] * len(names)
+
+    def report(self) -> dict[str, dict]:
+        """Returns the picks and current weight of every generator."""
+        names = sorted(self.picks)
+        return {
+            name: {
+                'picks': self.picks[name],
+                'weight': weight
+            } for name, weight in zip(names, self.weights(names))
+        }
+
+
+class BanditScheduler(UniformScheduler):
+    """Weights every generator by a UCB-style score: its recent reward
+    (coverage yield plus failures found) relative to the best generator's,
+    plus an exploration bonus for rarely picked generators, divided by its
+    latency relative to the median one. Weights are clamped to the
+    generator's [floor, ceiling] from `limits`. The picks come from the
+    scheduler's own RNG and state, not from the iteration seed."""
+    name = 'bandit'
+
+    def __init__(self, seed=None, limits=None):
+        super().__init__()
+        self.rng = random.Random(seed)
+        self.limits = limits or {}
+        self.total = 0
+        self.coverage_yield = {}
+        self.error_rate = {}
+        self.latency = {}
+
+    @staticmethod
+    def _update(averages, name, value):
+        if name in averages:
+            averages[name] += EMA_ALPHA * (value - averages[name])
+        else:
+            averages[name] = value
+
+    def record(self, name, success, latency):
+        super().record(name, success, latency)
+        self.total += 1
+        self._update(self.error_rate, name, 0.0 if success else 1.0)
+        self._update(self.latency, name, latency)
+
+    def reward_coverage(self, name, new_counters):
+        self._update(self.coverage_yield, name, new_counters)
+
+    def _reward(self, name) -> float:
+        return (self.coverage_yield.get(name, 0.0) +
+                ERROR_REWARD * self.error_rate.get(name, 0.0))
+
+    def weights(self, names) -> list[float]:
+        best = max((self._reward(name) for name in self.picks), default=0.0)
+        latencies = sorted(self.latency.values())
+        median = latencies[len(latencies) // 2] if latencies else 0.0
+        log_total = math.log(self.total + 1)
+        weights = []
+        for name in names:
+            score = EXPLORATION * math.sqrt(log_total /
+                                            (self.picks.get(name, 0) + 1))
+            if best > 0:
+                score += self._reward(name) / best
+            if median > 0 and name in self.latency:
+                score /= min(MAX_COST,
+                             max(MIN_COST, self.latency[name] / median))
+            floor, ceiling = self.limits.get(name,
+                                             (DEFAULT_FLOOR, DEFAULT_CEILING))
+            weights.append(min(ceiling, max(floor, score)))
+        return weights
+
+    def choose(self, rpc_calls):
+        weights = self.weights([call.__name__ for call in rpc_calls])
+        return self.rng.choices(rpc_calls, weights)[0]
+
+
+def create(name, seed=None, limits=None) -> UniformScheduler:
+    """Returns a new scheduler of kind `name`, one of SCHEDULERS."""
+    if name == 'bandit':
+        return BanditScheduler(seed, limits)
+    return UniformScheduler()
+
+
+def merge_reports(reports) -> dict[str, dict]:
+    """Merges the reports of several schedulers, summing the picks and
+    averaging the weights."""
+    merged = {}
+    for report in reports:
+        for name, entry in report.items():
+            merged.setdefault(name, []).append(entry)
+    return {
+        name: {
+            'picks': sum(entry['picks'] for entry in entries),
+            'weight': sum(entry['weight'] for entry in entries) / len(entries)
+        } for name, entries in merged.items()
+    }
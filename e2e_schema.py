@@ -0,0 +1,530 @@
+"""Declarative schemas of the fuzzed monerod endpoints, compiled into
+request generators.
+
+ENDPOINTS lists every generator with its transport, endpoint (or JSON-RPC
+method) and fields. A field is a (name, kind, *args) tuple, kinds and
+their arguments being:
+
+    BOOL                          random bool
+    INT, low, high                integer in [low, high], see bounds below
+    HEX, max_length               even number of hex digits, 2 to max_length
+    HASH                          64 hex digits
+    STRING, max_length            '' or printable characters, 1 to max_length
+    BLOB, max_bytes               hex of 1 to max_bytes random bytes
+    CONST, value                  always `value`
+    BLOCK_IDS                     raw bytes of the known block hashes
+    LIST, item, low, high         low to high items, `item` a field without
+                                  its name
+    STRUCT, fields                dict of `fields`
+
+INT bounds are integers, HEIGHT and TOP_HEIGHT (the chain height and the
+height of the top block, resolved once per request) or field() for an
+earlier field of the same struct. Fields without names make a positional
+JSON-RPC params list.
+
+compile_endpoints() turns the table into one closure per generator, with
+the dispatch on kinds done once up front. Fields draw from the entropy
+pool in the order of the table, exactly as the former hand-written send_*
+functions did, so seeds logged by earlier campaigns replay the same."""
+
+# Transports
+JSON = 'json'
+JSON_RPC = 'json_rpc'
+BIN = 'bin'
+
+# Field kinds
+BOOL = 'bool'
+INT = 'int'
+HEX = 'hex'
+HASH = 'hash'
+STRING = 'string'
+BLOB = 'blob'
+CONST = 'const'
+BLOCK_IDS = 'block_ids'
+LIST = 'list'
+STRUCT = 'struct'
+
+# Default INT bounds.
+INT_MAX = 99999999999
+# INT bounds taken from the chain state.
+HEIGHT = ('height', 0)
+TOP_HEIGHT = ('height', -1)
+
+
+def field(name):
+    """INT bound set to the value of field `name`, drawn before it."""
+    return ('field', name)
+
+
+_OUTPUT = (STRUCT, [('amount', INT), ('index', INT)])
+_HASHES = (LIST, (HASH,), 1, 8)
+_AMOUNTS = (LIST, (INT,), 1, 8)
+
+# (generator name, transport, endpoint or method, fields)
+ENDPOINTS = [
+    ('send_get_blocks', BIN, 'get_blocks.bin', [
+        ('block_ids', BLOCK_IDS),
+        ('prune', BOOL),
+        ('start_height', INT, 0, HEIGHT),
+        ('no_miner_tx', BOOL),
+        ('high_height_ok', BOOL),
+        ('pool_info_since', INT, 0, HEIGHT),
+        ('max_block_count', INT, 0, HEIGHT),
+        ('requested_info', INT, 0, 2),
+    ]),
+    ('send_get_blocks_by_height', BIN, 'get_blocks_by_height.bin', [
+        ('heights', LIST, (INT, 0, HEIGHT), 1, 8),
+    ]),
+    ('send_get_hashes', BIN, 'get_hashes.bin', [
+        ('block_ids', BLOCK_IDS),
+        ('start_height', INT, 0, HEIGHT),
+    ]),
+    ('send_get_indexes', BIN, 'get_o_indexes.bin', [
+        ('txs_hashes', *_HASHES),
+    ]),
+    ('send_get_outs_bin', BIN, 'get_outs.bin', [
+        ('outputs', LIST, _OUTPUT, 1, 8),
+        ('get_txid', BOOL),
+    ]),
+    ('send_get_transactions', JSON, 'gettransactions', [
+        ('txs_hashes', *_HASHES),
+        ('decode_as_json', BOOL),
+        ('prune', BOOL),
+    ]),
+    ('send_get_alt_blocks_hashes', JSON, 'get_alt_blocks_hashes', []),
+    ('send_is_key_image_spent', JSON, 'is_key_image_spent', [
+        ('key_images', *_HASHES),
+    ]),
+    ('send_send_raw_tx', JSON, 'send_raw_transaction', [
+        ('tx_as_hex', HEX, 128),
+        ('do_not_relay', BOOL),
+        ('do_sanity_checks', BOOL),
+    ]),
+    ('send_start_mining', JSON, 'start_mining', [
+        ('miner_address', STRING, 128),
+        ('threads_count', INT),
+        ('do_background_mining', BOOL),
+        ('ignore_battery', BOOL),
+    ]),
+    ('send_stop_mining', JSON, 'stop_mining', []),
+    ('send_mining_status', JSON, 'mining_status', []),
+    ('send_save_bc', JSON, 'save_bc', []),
+    ('send_get_peer_list', JSON, 'get_peer_list', []),
+    ('send_get_public_nodes', JSON, 'get_public_nodes', []),
+    ('send_set_log_hash_rate', JSON, 'set_log_hash_rate', [
+        ('visible', BOOL),
+    ]),
+    ('send_set_log_level', JSON, 'set_log_level', [
+        ('level', INT),
+    ]),
+    ('send_set_log_categories', JSON, 'set_log_categories', [
+        ('categories', STRING, 64),
+    ]),
+    ('send_get_transaction_pool', JSON, 'get_transaction_pool', []),
+    # Sent as JSON on purpose, the endpoint expects portable storage.
+    ('send_get_transaction_pool_hashes_bin', JSON,
+     'get_transaction_pool_hashes.bin', []),
+    ('send_get_transaction_pool_hashes', JSON, 'get_transaction_pool_hashes',
+     []),
+    ('send_get_transaction_pool_stats', JSON, 'get_transaction_pool_stats',
+     []),
+    ('send_set_bootstrap_daemon', JSON, 'set_bootstrap_daemon', [
+        ('address', CONST, 'auto'),
+        ('username', STRING, 64),
+        ('password', STRING, 64),
+        ('proxy', STRING, 32),
+    ]),
+    ('clear_boostrap_daemon', JSON, 'set_bootstrap_daemon', [
+        ('address', CONST, ''),
+        ('username', CONST, ''),
+        ('password', CONST, ''),
+        ('proxy', CONST, ''),
+    ]),
+    ('send_stop_daemon', JSON, 'stop_daemon', []),
+    ('send_get_info', JSON, 'get_info', []),
+    ('send_get_net_stats', JSON, 'get_net_stats', []),
+    ('send_get_limit', JSON, 'get_limit', []),
+    ('send_set_limit', JSON, 'set_limit', [
+        ('limit_down', INT),
+        ('limit_up', INT),
+    ]),
+    ('send_out_peers', JSON, 'out_peers', [
+        ('white', BOOL),
+        ('gray', BOOL),
+    ]),
+    ('send_in_peers', JSON, 'in_peers', [
+        ('white', BOOL),
+        ('gray', BOOL),
+    ]),
+    ('send_get_outs', JSON, 'get_outs', [
+        ('outputs', LIST, _OUTPUT, 1, 8),
+    ]),
+    ('send_update', JSON, 'update', [
+        ('command', STRING, 128),
+    ]),
+    ('send_get_output_distribution_bin', BIN, 'get_output_distribution.bin', [
+        ('amounts', *_AMOUNTS),
+        ('cumulative', BOOL),
+        ('from_height', INT, 0, HEIGHT),
+        ('to_height', INT, 0, HEIGHT),
+    ]),
+    ('send_pop_blocks', JSON, 'pop_blocks', [
+        ('nblocks', INT),
+    ]),
+    ('send_getblockcount', JSON_RPC, 'getblockcount', []),
+    ('send_getblockhash', JSON_RPC, 'on_get_block_hash', [
+        (None, INT),
+    ]),
+    ('send_getblocktemplate', JSON_RPC, 'getblocktemplate', [
+        ('wallet_address', HEX, 128),
+        ('reserve_size', INT, 0, 512),
+    ]),
+    ('send_getminerdata', JSON_RPC, 'get_miner_data', []),
+    ('send_calc_pow', JSON_RPC, 'calc_pow', [
+        ('major_version', INT, 0, 255),
+        ('height', INT, 0, HEIGHT),
+        ('block_blob', BLOB, 1024),
+        ('seed_hash', HEX, 64),
+    ]),
+    ('send_add_aux_pow', JSON_RPC, 'add_aux_pow', [
+        ('blocktemplate_blob', STRING, 128),
+        ('aux_pow', LIST, (STRUCT, [('id', HASH), ('hash', HASH)]), 1, 1),
+    ]),
+    ('send_submitblock', JSON_RPC, 'submitblock', [
+        (None, HASH),
+    ]),
+    ('send_generateblocks', JSON_RPC, 'generateblocks', [
+        ('amount_of_blocks', INT, 0, HEIGHT),
+        ('wallet_address', HEX, 64),
+        ('prev_block', HASH),
+        ('starting_nonce', INT, 0, HEIGHT),
+    ]),
+    ('send_get_last_block_header', JSON_RPC, 'get_last_block_header', [
+        ('fill_pow_hash', BOOL),
+    ]),
+    ('send_get_block_header_by_hash', JSON_RPC, 'get_block_header_by_hash', [
+        ('hash', HASH),
+        ('fill_pow_hash', BOOL),
+    ]),
+    ('send_get_block_header_by_height', JSON_RPC,
+     'get_block_header_by_height', [
+         ('height', INT, 0, HEIGHT),
+         ('fill_pow_hash', BOOL),
+     ]),
+    ('send_get_block_headers_range', JSON_RPC, 'get_block_headers_range', [
+        ('start_height', INT, 0, TOP_HEIGHT),
+        ('end_height', INT, field('start_height'), TOP_HEIGHT),
+        ('fill_pow_hash', BOOL),
+    ]),
+    ('send_get_block', JSON_RPC, 'get_block', [
+        ('height', INT, 0, HEIGHT),
+        ('hash', HASH),
+        ('fill_pow_hash', BOOL),
+    ]),
+    ('send_get_connections', JSON_RPC, 'get_connections', []),
+    ('send_get_info_json', JSON_RPC, 'get_info', []),
+    ('send_hard_fork_info', JSON_RPC, 'hard_fork_info', []),
+    ('clear_localhost_ban', JSON_RPC, 'set_bans', [
+        ('bans', LIST, (STRUCT, [
+            ('host', CONST, '127.0.0.1'),
+            ('ip', CONST, 0),
+            ('ban', CONST, False),
+            ('seconds', CONST, 0),
+        ]), 1, 1),
+    ]),
+    ('send_set_bans', JSON_RPC, 'set_bans', [
+        ('bans', LIST, (STRUCT, [
+            ('host', STRING, 128),
+            ('ip', INT, 0, 0xFFFFFFFF),
+            ('ban', BOOL),
+            ('seconds', INT, 0, 72000),
+        ]), 2, 2),
+    ]),
+    ('send_get_bans', JSON_RPC, 'get_bans', []),
+    ('send_banned', JSON_RPC, 'banned', [
+        ('bans', STRING, 128),
+    ]),
+    ('send_flush_txpool', JSON_RPC, 'flush_txpool', [
+        ('txids', *_HASHES),
+    ]),
+    ('send_get_output_histogram', JSON_RPC, 'get_output_histogram', [
+        ('amounts', *_AMOUNTS),
+        ('min_count', INT),
+        ('max_count', INT),
+        ('unlocked', BOOL),
+        ('recent_cutoff', INT),
+    ]),
+    ('send_get_version', JSON_RPC, 'get_version', []),
+    ('send_get_coinbase_tx_sum', JSON_RPC, 'get_coinbase_tx_sum', [
+        ('height', INT, 0, HEIGHT),
+        ('count', INT, 0, HEIGHT),
+    ]),
+    ('send_get_base_fee_estimate', JSON_RPC, 'get_fee_estimate', [
+        ('grace_blocks', INT),
+    ]),
+    ('send_get_alternate_chains', JSON_RPC, 'get_alternate_chains', []),
+    ('send_relay_tx', JSON_RPC, 'relay_tx', [
+        ('txids', *_HASHES),
+    ]),
+    ('send_sync_info', JSON_RPC, 'sync_info', []),
+    ('send_get_txpool_backlog', JSON_RPC, 'get_txpool_backlog', []),
+    ('send_get_output_distribution', JSON_RPC, 'get_output_distribution', [
+        ('amounts', *_AMOUNTS),
+        ('cumulative', BOOL),
+        ('from_height', INT, 0, HEIGHT),
+        ('to_height', INT, 0, HEIGHT),
+    ]),
+    ('send_prune_blockchain', JSON_RPC, 'prune_blockchain', [
+        ('check', BOOL),
+    ]),
+    ('send_flush_cache', JSON_RPC, 'flush_cache', [
+        ('bad_txs', BOOL),
+        ('bad_blocks', BOOL),
+    ]),
+    ('send_get_txids_loose', JSON_RPC, 'get_txids_loose', []),
+    ('send_rpc_access_info', JSON_RPC, 'rpc_access_info', []),
+    ('send_rpc_access_submit_nonce', JSON_RPC, 'rpc_access_submit_nonce', [
+        (None, STRING, 64),
+    ]),
+    ('send_rpc_access_pay', JSON_RPC, 'rpc_access_pay', [
+        ('payment', INT),
+        ('paying_for', STRING, 64),
+    ]),
+    ('send_rpc_access_tracking', JSON_RPC, 'rpc_access_tracking', [
+        ('client', STRING, 64),
+    ]),
+    ('send_rpc_access_data', JSON_RPC, 'rpc_access_data', [
+        ('client', STRING, 64),
+    ]),
+    ('send_rpc_access_account', JSON_RPC, 'rpc_access_account', [
+        ('client', STRING, 64),
+    ]),
+]
+
+
+class _Context:
+    """Chain state shared by the fields of one request, or of one batch.
+    The height is only asked for once a field needs it."""
+    __slots__ = ('_get_height', '_height', '_get_block_ids')
+
+    def __init__(self, get_height, get_block_ids):
+        self._get_height = get_height
+        self._height = None
+        self._get_block_ids = get_block_ids
+
+    def height(self):
+        if self._height is None:
+            self._height = self._get_height()
+        return self._height
+
+    def block_ids(self):
+        return self._get_block_ids()
+
+
+def _compile_bound(bound):
+    """Returns a function of (values, context) giving an INT bound."""
+    if isinstance(bound, int):
+        return lambda values, context: bound
+    source, arg = bound
+    if source == 'height':
+        return lambda values, context: context.height() + arg
+    if source == 'field':
+        return lambda values, context: values[arg]
+    raise ValueError(f'unknown bound {bound!r}')
+
+
+def _compile_value(spec, entropy):
+    """Returns a function of (values, context) generating a value of field
+    `spec`, (kind, *args). `values` holds the fields of the enclosing
+    struct drawn so far."""
+    kind, *args = spec
+    if kind == BOOL:
+        draw_bool = entropy.bool
+        return lambda values, context: draw_bool()
+
+    if kind == INT:
+        low, high = args if args else (0, INT_MAX)
+        randint = entropy.randint
+        if isinstance(low, int) and isinstance(high, int):
+            return lambda values, context: randint(low, high)
+        low = _compile_bound(low)
+        high = _compile_bound(high)
+        return lambda values, context: randint(low(values, context),
+                                               high(values, context))
+
+    if kind == HASH:
+        return lambda values, context: entropy.hex(64)
+
+    if kind == HEX:
+        max_length = max(2, args[0])
+
+        def gen_hex(values, context):
+            length = entropy.randint(2, max_length)
+            return entropy.hex(length + (length & 1))
+
+        return gen_hex
+
+    if kind == STRING:
+        max_length = args[0]
+
+        def gen_string(values, context):
+            if entropy.bool():
+                return entropy.printable(entropy.randint(1, max_length))
+            return ''
+
+        return gen_string
+
+    if kind == BLOB:
+        max_bytes = args[0]
+        return lambda values, context: entropy.take(
+            entropy.randint(1, max_bytes)).hex()
+
+    if kind == CONST:
+        value = args[0]
+        return lambda values, context: value
+
+    if kind == BLOCK_IDS:
+        return lambda values, context: context.block_ids()
+
+    if kind == LIST:
+        item_spec, low, high = args
+        gen_item = _compile_value(item_spec, entropy)
+        randint = entropy.randint
+        # The count is drawn before the items.
+        return lambda values, context: [
+            gen_item(values, context) for _ in range(randint(low, high))
+        ]
+
+    if kind == STRUCT:
+        return _compile_struct(args[0], entropy)
+
+    raise ValueError(f'unknown field kind {kind!r}')
+
+
+def _compile_struct(fields, entropy):
+    """Returns a function of (values, context) generating a dict of
+    `fields`, or a list of them if they have no names."""
+    compiled = [(name, _compile_value(spec, entropy))
+                for name, *spec in fields]
+    if not compiled:
+        return lambda values, context: {}
+    if compiled[0][0] is None:
+        if len(compiled) == 1:
+            gen = compiled[0][1]
+            return lambda values, context: [gen(values, context)]
+        return lambda values, context: [
+            gen(values, context) for _, gen in compiled
+        ]
+
+    def gen_struct(values, context):
+        struct = {}
+        for name, gen in compiled:
+            struct[name] = gen(struct, context)
+        return struct
+
+    return gen_struct
+
+
+def _uses_chain_state(fields) -> bool:
+    """Whether any of `fields` needs the chain height or block ids."""
+    for _, *spec in fields:
+        while spec[0] == LIST:
+            spec = list(spec[1])
+        if spec[0] == STRUCT and _uses_chain_state(spec[1]):
+            return True
+        if spec[0] == BLOCK_IDS or any(
+                isinstance(arg, tuple) and arg[0] == 'height'
+                for arg in spec[1:]):
+            return True
+    return False
+
+
+def _compile_endpoint(name, transport, target, fields, entropy, get_height,
+                      get_block_ids, serialise, serialise_many):
+    gen_params = _compile_struct(fields, entropy)
+    if _uses_chain_state(fields):
+        new_context = lambda: _Context(get_height, get_block_ids)
+    else:
+        new_context = lambda: None
+
+    if transport == JSON:
+
+        def generate():
+            return gen_params(None, new_context()), target
+
+        def wrap_many(params_list):
+            return [(params, target) for params in params_list]
+
+    elif transport == JSON_RPC:
+
+        def generate():
+            return {
+                'jsonrpc': '2.0',
+                'id': '1',
+                'method': target,
+                'params': gen_params(None, new_context())
+            }, 'json_rpc'
+
+        def wrap_many(params_list):
+            return [({
+                'jsonrpc': '2.0',
+                'id': '1',
+                'method': target,
+                'params': params
+            }, 'json_rpc') for params in params_list]
+
+    elif transport == BIN:
+        path = '/' + target
+
+        def generate():
+            return serialise(gen_params(None, new_context()), path), target
+
+        def wrap_many(params_list):
+            payloads = serialise_many([(params, path)
+                                       for params in params_list])
+            return [(payload, target) for payload in payloads]
+
+    else:
+        raise ValueError(f'unknown transport {transport!r} of {name}')
+
+    def generate_batch(seeds, prepare):
+        """Generates the request of every seed in `seeds`, calling
+        prepare(seed) first to reseed the entropy pool. The chain state is
+        read once for the batch and binary requests are serialised
+        together."""
+        context = new_context()
+        params_list = []
+        for seed in seeds:
+            prepare(seed)
+            params_list.append(gen_params(None, context))
+        return wrap_many(params_list)
+
+    generate.__name__ = generate.__qualname__ = name
+    generate.batch = generate_batch
+    generate.transport = transport
+    generate.target = target
+    return generate
+
+
+def compile_endpoints(entropy,
+                      get_height,
+                      get_block_ids,
+                      serialise,
+                      serialise_many,
+                      endpoints=ENDPOINTS) -> dict:
+    """Compiles `endpoints` into request generators drawing from the
+    e2e_entropy pool `entropy`, keyed by name.
+
+    get_height() and get_block_ids() give the chain state. serialise(params,
+    endpoint) and serialise_many([(params, endpoint), ...]) encode binary
+    requests, endpoints being paths such as '/get_blocks.bin'.
+
+    A generator returns a (request, endpoint) pair like the former send_*
+    functions. Its `batch(seeds, prepare)` attribute returns such pairs for
+    many seeds at once."""
+    return {
+        name: _compile_endpoint(name, transport, target, fields, entropy,
+                                get_height, get_block_ids, serialise,
+                                serialise_many)
+        for name, transport, target, fields in endpoints
+    }
@@ -1,12 +1,308 @@
-"""Utility to serialise JSON RPC requests using the monero_rpc_serialiser C++ binary."""
+"""Utility to serialise JSON RPC requests for the binary monerod endpoints.
 
+Requests are encoded by the monero_rpc_serialiser C++ binary, either run
+once per request (the default) or as a pool of long-lived `--server`
+processes, or in-process by e2e_portable_storage. Run this module with
+--differential to compare the native encoder with the binary on random
+inputs and on requests built like the fuzzer's."""
+
+import argparse
+import atexit
+import base64
+import struct
 import subprocess
 import tempfile
+import threading
 import json
 import os
+import random
+import select
+import string
+import time
+
+import e2e_entropy
+import e2e_portable_storage
+import e2e_schema
+import e2e_trace
+
+# How requests are serialised: 'native' encodes in-process, 'server' uses
+# the pool of monero_rpc_serialiser --server processes and 'exec' runs the
+# binary once per request. 'native' is opt-in until the differential check
+# below has passed against the C++ binary.
+BACKENDS = ('native', 'server', 'exec')
+backend = 'exec'
+# Number of --server processes kept alive by the pool.
+POOL_SIZE = 2
+# Seconds a server process gets to answer a request before it is killed
+# and restarted.
+READ_TIMEOUT = 10.0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _json_default(value):
+    # Blob fields given as bytes reach the C++ tool as hex, which it decodes.
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f'{type(value).__name__} is not JSON serialisable')
+
+
+def dumps(json_obj) -> str:
+    """Returns the JSON text of a request for monero_rpc_serialiser."""
+    return json.dumps(json_obj, default=_json_default)
+
+
+class SerialiserError(Exception):
+    """Raised when a serialiser server process fails or rejects a request."""
+
+
+class SerialiserProcess:
+    """A monero_rpc_serialiser process in --server mode. Requests are
+    (endpoint, json) frames and responses (status, payload) frames, with
+    every string prefixed by its little endian uint32 length."""
+
+    def __init__(self, serialiser_path):
+        self.serialiser_path = serialiser_path
+        self.proc = None
+        self.restarts = 0
+        self.requests = 0
+        self._start()
+
+    def _start(self):
+        self.proc = subprocess.Popen([self.serialiser_path, '--server'],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL)
+        # stdout is read through its file descriptor, so that reads can
+        # wait on the pipe with a deadline.
+        self._stdout_fd = self.proc.stdout.fileno()
+        self._poller = select.poll()
+        self._poller.register(self._stdout_fd, select.POLLIN)
+        self._buffer = bytearray()
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def restart(self):
+        self.close()
+        self.restarts += 1
+        self._start()
+
+    @staticmethod
+    def _encode_frame(json_obj, endpoint) -> bytes:
+        raw_endpoint = endpoint.encode('utf-8')
+        raw_json = dumps(json_obj).encode('utf-8')
+        return (struct.pack('<I', len(raw_endpoint)) + raw_endpoint +
+                struct.pack('<I', len(raw_json)) + raw_json)
+
+    def _read_exact(self, size, deadline) -> bytes:
+        """Reads `size` bytes of stdout. Kills the process if they have not
+        arrived by `deadline`, a time.monotonic() value."""
+        while len(self._buffer) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._poller.poll(remaining * 1000):
+                self.proc.kill()
+                raise SerialiserError('serialiser process did not answer '
+                                      f'within {READ_TIMEOUT} sec')
+            chunk = os.read(self._stdout_fd, max(65536, size))
+            if not chunk:
+                raise SerialiserError('serialiser process exited')
+            self._buffer += chunk
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _read_response(self):
+        deadline = time.monotonic() + READ_TIMEOUT
+        status, size = struct.unpack('<BI', self._read_exact(5, deadline))
+        return status, self._read_exact(size, deadline)
+
+    def _write_frames(self, frames):
+        try:
+            for frame in frames:
+                self.proc.stdin.write(frame)
+            self.proc.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            # Noticed by the reader as a short read.
+            pass
+
+    def serialise_many(self, items) -> list:
+        """Serialises a list of (json_obj, endpoint) pairs. Frames are
+        written from a separate thread so large batches cannot deadlock
+        on full pipes. Returns the payload, or None, for every item."""
+        frames = [self._encode_frame(json_obj, endpoint)
+                  for json_obj, endpoint in items]
+        writer = threading.Thread(target=self._write_frames, args=(frames,))
+        writer.start()
+        results = []
+        try:
+            for _ in frames:
+                status, payload = self._read_response()
+                results.append(payload if status == 0 else None)
+                self.requests += 1
+        finally:
+            writer.join()
+        return results
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.proc = None
+
+
+class SerialiserPool:
+    """Keeps `size` SerialiserProcess instances alive and hands them out to
+    callers, restarting any process that died or stopped answering."""
+
+    def __init__(self, serialiser_path, size=POOL_SIZE):
+        self.serialiser_path = serialiser_path
+        self.size = size
+        self._all = [SerialiserProcess(serialiser_path) for _ in range(size)]
+        self._idle = list(self._all)
+        self._available = threading.Semaphore(size)
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> SerialiserProcess:
+        self._available.acquire()
+        with self._lock:
+            process = self._idle.pop()
+        if not process.alive():
+            process.restart()
+        return process
+
+    def _release(self, process):
+        with self._lock:
+            self._idle.append(process)
+        self._available.release()
+
+    def serialise_many(self, items) -> list:
+        """Serialises (json_obj, endpoint) pairs on one process, retrying
+        once on a fresh process if it died or hung mid-batch."""
+        process = self._acquire()
+        try:
+            try:
+                return process.serialise_many(items)
+            except SerialiserError:
+                process.restart()
+                return process.serialise_many(items)
+        finally:
+            self._release(process)
+
+    def serialise_batch(self, items) -> list:
+        """Splits a large batch across all processes in the pool."""
+        if len(items) < 2 * self.size:
+            return self.serialise_many(items)
+        chunk = (len(items) + self.size - 1) // self.size
+        chunks = [items[i:i + chunk] for i in range(0, len(items), chunk)]
+        results = [None] * len(chunks)
+
+        def run(index):
+            try:
+                results[index] = self.serialise_many(chunks[index])
+            except (OSError, SerialiserError) as e:
+                print(f'serialisation failed: {e}')
+                results[index] = [None] * len(chunks[index])
+
+        threads = [
+            threading.Thread(target=run, args=(index,))
+            for index in range(len(chunks))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [
+            payload for chunk_results in results for payload in chunk_results
+        ]
+
+    def stats(self) -> list[dict]:
+        return [{
+            'id': index,
+            'requests': process.requests,
+            'restarts': process.restarts
+        } for index, process in enumerate(self._all)]
+
+    def close(self):
+        for process in self._all:
+            process.close()
+
+
+def get_pool(workdir: str) -> SerialiserPool:
+    """Returns the shared serialiser pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SerialiserPool(
+                os.path.join(workdir, 'monero_rpc_serialiser'))
+            atexit.register(close_pool)
+        return _pool
+
+
+def close_pool():
+    """Stops the serialiser server processes, if any were started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
 
 
 def serialise(json_obj: dict, endpoint: str, workdir: str) -> bytes:
+    with e2e_trace.span('serialise'):
+        return _serialise(json_obj, endpoint, workdir)
+
+
+def _serialise(json_obj: dict, endpoint: str, workdir: str) -> bytes:
+    if backend == 'native':
+        try:
+            return e2e_portable_storage.encode_request(json_obj, endpoint)
+        except KeyError:
+            # Endpoint without a native schema, use the C++ serialiser.
+            pass
+    if backend == 'exec':
+        return serialise_with_binary(json_obj, endpoint, workdir)
+    return serialise_batch([(json_obj, endpoint)], workdir)[0]
+
+
+def serialise_batch(items, workdir: str) -> list[bytes]:
+    """Serialises many (json_obj, endpoint) pairs at once through the
+    serialiser server pool. Failed items come back as b''."""
+    try:
+        results = get_pool(workdir).serialise_batch(items)
+    except (OSError, SerialiserError) as e:
+        print(f'serialisation failed: {e}')
+        return [b''] * len(items)
+    for (_, endpoint), payload in zip(items, results):
+        if payload is None:
+            print(f'serialisation failed for endpoint {endpoint}')
+    return [payload or b'' for payload in results]
+
+
+def serialise_many(items, workdir: str) -> list[bytes]:
+    """Serialises many (json_obj, endpoint) pairs with the current backend,
+    the 'server' one sending them to the pool as a single batch."""
+    with e2e_trace.span('serialise'):
+        if backend == 'server':
+            return serialise_batch(items, workdir)
+        return [
+            _serialise(json_obj, endpoint, workdir)
+            for json_obj, endpoint in items
+        ]
+
+
+def serialise_with_binary(json_obj: dict, endpoint: str, workdir: str) -> bytes:
+    """Serialises by running the monero_rpc_serialiser binary on a temp file."""
     with tempfile.TemporaryDirectory() as tmpdir:
         serialiser_path = os.path.join(workdir, 'monero_rpc_serialiser')
         json_path = os.path.join(tmpdir, "input.json")
@@ -14,7 +310,7 @@ def serialise(json_obj: dict, endpoint: str, workdir: str) -> bytes:
 
         # Write JSON to temp file
         with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(json_obj, f)
+            f.write(dumps(json_obj))
 
         # Call the C++ binary
         try:
@@ -32,3 +328,160 @@ def serialise(json_obj: dict, endpoint: str, workdir: str) -> bytes:
                 return f.read()
         print(f'serialisation failed for endpoint {endpoint}')
         return b''
+
+
+def _random_uint64(max_value=2**64 - 1):
+    # Bias towards the boundaries of the varint and integer widths.
+    return min(
+        max_value,
+        random.choice([
+            0, 1, 63, 64, 16383, 16384, 2**32 - 1, 2**64 - 1,
+            random.randint(0, 99999999999),
+            random.randint(0, 2**64 - 1)
+        ]))
+
+
+def _random_list_uint64():
+    # epee's JSON arrays must hold a single type, so list items stay within
+    # int64 rather than mixing in values only a uint64 can hold.
+    return _random_uint64(2**63 - 1)
+
+
+def _random_raw_hash():
+    # Exactly 32 characters, which the JSON loader accepts as a hash.
+    return ''.join(random.choices(string.ascii_letters, k=32))
+
+
+def _random_hash_blob():
+    # Raw hashes like the fuzzer sends, their hex, base64 text or hashes
+    # as characters.
+    raw = random.randbytes(32 * random.randint(1, 4))
+    choice = random.random()
+    if choice < 0.25:
+        return raw
+    if choice < 0.5:
+        return raw.hex()
+    if choice < 0.75:
+        return base64.b64encode(raw).decode()
+    return ''.join(_random_raw_hash() for _ in range(random.randint(1, 4)))
+
+
+_CONTAINER_KINDS = (e2e_portable_storage.UINT64_LIST,
+                    e2e_portable_storage.HASH_LIST_BLOB,
+                    e2e_portable_storage.OUTPUTS_LIST)
+
+
+def random_request(endpoint: str) -> dict:
+    """Returns a random JSON request for a binary endpoint. Optional fields
+    are dropped at random so defaults are covered too. Fields without a
+    default are always set, the C++ struct leaves them uninitialised."""
+    params = {
+        'client': ''.join(random.choices(string.printable,
+                                         k=random.randint(0, 80))),
+        'requested_info': random.randint(0, 2),
+        'block_ids': _random_hash_blob(),
+        'start_height': _random_uint64(),
+        'prune': random.random() < 0.5,
+        'no_miner_tx': random.random() < 0.5,
+        'high_height_ok': random.random() < 0.5,
+        'pool_info_since': _random_uint64(),
+        'max_block_count': _random_uint64(),
+        'heights':
+        [_random_list_uint64() for _ in range(random.randint(0, 70))],
+        'txid': _random_raw_hash(),
+        'outputs': [{
+            'amount': _random_uint64(),
+            'index': _random_uint64()
+        } for _ in range(random.randint(0, 70))],
+        'get_txid': random.random() < 0.5,
+        'amounts':
+        [_random_list_uint64() for _ in range(random.randint(0, 70))],
+        'from_height': _random_uint64(),
+        'to_height': _random_uint64(),
+        'cumulative': random.random() < 0.5,
+        'binary': random.random() < 0.5,
+        'compress': random.random() < 0.5,
+    }
+    schema = e2e_portable_storage.REQUEST_SCHEMAS[endpoint]
+    return {
+        name: params[name]
+        for name, kind, default in schema
+        if (default is None and kind not in _CONTAINER_KINDS) or
+        random.random() < 0.9
+    }
+
+
+def schema_requests(count: int) -> list[tuple[dict, str]]:
+    """Returns `count` (json_obj, endpoint) requests for the binary
+    endpoints, built by the fuzzer's e2e_schema generators from random
+    seeds and a random chain state."""
+    pool = e2e_entropy.EntropyPool(block_size=4096)
+    generators = list(
+        e2e_schema.compile_endpoints(
+            pool,
+            lambda: random.randint(0, 1 << 22),
+            lambda: random.randbytes(e2e_portable_storage.HASH_SIZE *
+                                     random.randint(1, 10)),
+            lambda json_obj, endpoint: (json_obj, endpoint),
+            lambda items: items, [
+                entry for entry in e2e_schema.ENDPOINTS
+                if entry[1] == e2e_schema.BIN
+            ]).values())
+    requests = []
+    for i in range(count):
+        pool.seed(random.getrandbits(63))
+        request, _ = generators[i % len(generators)]()
+        requests.append(request)
+    return requests
+
+
+def differential_check(workdir: str, count: int) -> int:
+    """Serialises `count` random requests, and `count` requests built like
+    the fuzzer's, natively and with the C++ binary in server mode, and
+    reports every mismatch. Returns the number of mismatches."""
+    endpoints = list(e2e_portable_storage.REQUEST_SCHEMAS)
+    requests = []
+    for i in range(count):
+        endpoint = endpoints[i % len(endpoints)]
+        requests.append((random_request(endpoint), endpoint))
+    requests.extend(schema_requests(count))
+    references = serialise_batch(requests, workdir)
+
+    mismatches = 0
+    for i, (json_obj, endpoint) in enumerate(requests):
+        native = e2e_portable_storage.encode_request(json_obj, endpoint)
+        reference = references[i]
+        if native != reference:
+            mismatches += 1
+            print(f'Mismatch for {endpoint}: {dumps(json_obj)}')
+            print(f'  native:    {native.hex()}')
+            print(f'  reference: {reference.hex()}')
+    print(f'{len(requests)} requests compared, {mismatches} mismatches')
+    return mismatches
+
+
+def parse_args():
+    """CLI interface for the differential check."""
+    parser = argparse.ArgumentParser(
+        description='Compare the native serialiser with monero_rpc_serialiser')
+    parser.add_argument('--workdir',
+                        default='./work',
+                        help='Directory holding monero_rpc_serialiser')
+    parser.add_argument('--differential',
+                        type=int,
+                        default=5000,
+                        help='Number of random requests to compare')
+    parser.add_argument('--seed', type=int, help='Random seed')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    mismatches = differential_check(os.path.abspath(args.workdir),
+                                    args.differential)
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
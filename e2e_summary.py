@@ -0,0 +1,203 @@
+"""Compact per-file and per-function coverage summaries and their diffs.
+
+`llvm-cov export -format=lcov`, restricted to a few source directories,
+runs in seconds where the full HTML report takes a long time. The lcov
+file is condensed into summary.json, and two summaries can be compared
+with --diff to track coverage between campaigns."""
+
+import argparse
+import json
+import os
+
+import e2e_profdata
+import e2e_toolchain
+
+# Source directories, relative to the monero checkout, summarised by
+# default.
+SUMMARY_SOURCES = ('src/rpc', 'src/cryptonote_core')
+
+
+def export_lcov(toolchain, sources=SUMMARY_SOURCES, merged=True) -> str:
+    """Exports the coverage of `sources` in lcov format, using every core.
+    Returns the path of the lcov file. Without `merged`, the profraws are
+    merged into monerod.profdata first."""
+    summary_dir = os.path.join(toolchain.workdir, 'coverage_summary')
+    os.makedirs(summary_dir, exist_ok=True)
+    if not merged:
+        e2e_profdata.merge_all(toolchain)
+
+    lcov_path = os.path.join(summary_dir, 'coverage.lcov')
+    with open(lcov_path, 'w', encoding='utf-8') as f:
+        toolchain.run('llvm-cov', [
+            'export', '-format=lcov', f'-num-threads={os.cpu_count()}',
+            f'-instr-profile={toolchain.path(e2e_profdata.PROFDATA)}',
+            *toolchain.coverage_args(),
+            toolchain.path('monerod'),
+            *[toolchain.source(source) for source in sources]
+        ],
+                      stdout=f)
+    return lcov_path
+
+
+def summarise_lcov(lcov_path,
+                   source_root=e2e_toolchain.IMAGE_SOURCE_ROOT) -> dict:
+    """Condenses an lcov file into line and function totals per file, plus
+    the execution count of every function. File names are made relative
+    to `source_root`."""
+    source_root = source_root.rstrip('/') + '/'
+    files = {}
+    functions = {}
+    path = None
+    with open(lcov_path, encoding='utf-8') as f:
+        for line in f:
+            key, _, value = line.rstrip('\n').partition(':')
+            if key == 'SF':
+                path = value[len(source_root):] if value.startswith(
+                    source_root) else value
+                files[path] = {'lines': [0, 0], 'functions': [0, 0]}
+                functions[path] = {}
+            elif key == 'FNDA':
+                count, _, name = value.partition(',')
+                functions[path][name] = int(count)
+            elif key == 'LH':
+                files[path]['lines'][0] = int(value)
+            elif key == 'LF':
+                files[path]['lines'][1] = int(value)
+            elif key == 'FNH':
+                files[path]['functions'][0] = int(value)
+            elif key == 'FNF':
+                files[path]['functions'][1] = int(value)
+
+    totals = {'lines': [0, 0], 'functions': [0, 0]}
+    for counts in files.values():
+        for kind in totals:
+            totals[kind][0] += counts[kind][0]
+            totals[kind][1] += counts[kind][1]
+    return {'totals': totals, 'files': files, 'functions': functions}
+
+
+def write_summary(toolchain, sources=SUMMARY_SOURCES, merged=True) -> str:
+    """Exports and condenses the coverage of `sources` into
+    workdir/coverage_summary/summary.json. Returns its path."""
+    summary = summarise_lcov(export_lcov(toolchain, sources, merged),
+                             toolchain.source())
+    summary['sources'] = list(sources)
+    path = os.path.join(toolchain.workdir, 'coverage_summary',
+                        'summary.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=1)
+    return path
+
+
+def _percent(hit_found) -> float:
+    hit, found = hit_found
+    return 100.0 * hit / found if found else 0.0
+
+
+def diff_summaries(old, new) -> dict:
+    """Compares two summaries. Returns the change of the totals, the files
+    whose number of hit lines changed, and the functions hit in only one
+    of them."""
+    files = []
+    for path in sorted(set(old['files']) | set(new['files'])):
+        empty = {'lines': [0, 0], 'functions': [0, 0]}
+        before = old['files'].get(path, empty)
+        after = new['files'].get(path, empty)
+        if before['lines'][0] != after['lines'][0]:
+            files.append({
+                'file': path,
+                'lines_hit': after['lines'][0] - before['lines'][0],
+                'old_percent': _percent(before['lines']),
+                'new_percent': _percent(after['lines']),
+            })
+    files.sort(key=lambda entry: entry['lines_hit'], reverse=True)
+
+    def hit(summary):
+        return {(path, name)
+                for path, counts in summary['functions'].items()
+                for name, count in counts.items() if count}
+
+    old_hit = hit(old)
+    new_hit = hit(new)
+    return {
+        'totals': {
+            kind: {
+                'old_percent': _percent(old['totals'][kind]),
+                'new_percent': _percent(new['totals'][kind]),
+                'hit': new['totals'][kind][0] - old['totals'][kind][0],
+            } for kind in ('lines', 'functions')
+        },
+        'files': files,
+        'functions_gained': sorted(new_hit - old_hit),
+        'functions_lost': sorted(old_hit - new_hit),
+    }
+
+
+def print_diff(diff):
+    for kind, totals in diff['totals'].items():
+        print(f'{kind}: {totals["old_percent"]:.2f}% -> '
+              f'{totals["new_percent"]:.2f}% ({totals["hit"]:+d} hit)')
+    for entry in diff['files']:
+        print(f'  {entry["lines_hit"]:+6d} lines  {entry["old_percent"]:6.2f}% '
+              f'-> {entry["new_percent"]:6.2f}%  {entry["file"]}')
+    print(f'{len(diff["functions_gained"])} functions gained, '
+          f'{len(diff["functions_lost"])} functions lost')
+    for path, name in diff['functions_gained']:
+        print(f'  + {name} ({path})')
+    for path, name in diff['functions_lost']:
+        print(f'  - {name} ({path})')
+
+
+def parse_args():
+    """CLI interface for the coverage summary."""
+    parser = argparse.ArgumentParser(
+        description='Summarise the coverage of a campaign, or compare two '
+        'summaries')
+    parser.add_argument('--workdir',
+                        default='./work',
+                        help='Directory holding monerod and monerod.profdata')
+    parser.add_argument('--sources',
+                        nargs='+',
+                        default=list(SUMMARY_SOURCES),
+                        help='Source directories to summarise')
+    parser.add_argument('--llvm-bin',
+                        help='Directory with llvm-cov and llvm-profdata to '
+                        'run natively instead of in the OSS-Fuzz image')
+    parser.add_argument('--source-dir',
+                        help='Local monero checkout to use instead of the one '
+                        'in the OSS-Fuzz image')
+    parser.add_argument('--diff',
+                        nargs=2,
+                        metavar=('OLD', 'NEW'),
+                        help='Compare two summary.json files instead')
+    parser.add_argument('--json',
+                        action='store_true',
+                        help='Print the diff as JSON')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.diff:
+        summaries = []
+        for path in args.diff:
+            with open(path, encoding='utf-8') as f:
+                summaries.append(json.load(f))
+        diff = diff_summaries(*summaries)
+        if args.json:
+            print(json.dumps(diff, indent=2))
+        else:
+            print_diff(diff)
+        return
+
+    # A campaign leaves monerod.profdata behind once everything is merged.
+    merged = os.path.exists(
+        os.path.join(args.workdir, e2e_profdata.PROFDATA))
+    toolchain = e2e_toolchain.Toolchain(args.workdir, args.llvm_bin,
+                                        args.source_dir)
+    print(f'Coverage summary written to '
+          f'{write_summary(toolchain, args.sources, merged)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Per-generator request timeouts derived from the observed latencies.
+
+A generator's timeout is a multiple of its p99 latency, clamped to a floor
+and a ceiling, so a hung handler costs a few seconds instead of stalling
+the campaign. Generators with too few requests yet get DEFAULT_TIMEOUT."""
+
+# Timeout of housekeeping requests and of generators with fewer than
+# MIN_SAMPLES finished requests.
+DEFAULT_TIMEOUT = 30.0
+# Timeout of the prune and stop requests ending a campaign, which can
+# legitimately take minutes.
+TEARDOWN_TIMEOUT = 600.0
+MIN_SAMPLES = 50
+DEFAULT_MULTIPLIER = 10.0
+DEFAULT_FLOOR = 5.0
+DEFAULT_CEILING = 120.0
+# Seconds monerod gets to answer the liveness check after a hang.
+LIVENESS_TIMEOUT = 10.0
+
+
+class TimeoutBudget:
+    """Derives the timeout of a generator's next request from its latency
+    histogram: `multiplier` times its p99, within [`floor`, `ceiling`]."""
+
+    def __init__(self,
+                 multiplier=DEFAULT_MULTIPLIER,
+                 floor=DEFAULT_FLOOR,
+                 ceiling=DEFAULT_CEILING):
+        self.multiplier = multiplier
+        self.floor = floor
+        self.ceiling = ceiling
+
+    def timeout(self, histogram) -> float:
+        """Returns the timeout for a generator with e2e_histogram
+        LatencyHistogram `histogram`, None if it has not been called."""
+        if histogram is None or histogram.count < MIN_SAMPLES:
+            return min(DEFAULT_TIMEOUT, self.ceiling)
+        return min(self.ceiling,
+                   max(self.floor, self.multiplier * histogram.percentile(99)))
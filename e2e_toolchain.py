@@ -0,0 +1,85 @@
+"""Runs the LLVM coverage tools, natively or inside the OSS-Fuzz image.
+
+monerod's coverage mapping refers to its sources by their path in the
+OSS-Fuzz image. With a cached monero checkout (including submodules) on
+the host, the tools are pointed at it with -path-equivalence, so reports
+can be built offline and, given an LLVM install matching the build,
+without Docker."""
+
+import os
+import subprocess
+
+OSS_FUZZ_IMAGE = 'gcr.io/oss-fuzz/monero'
+# Where the monero checkout lives in the OSS-Fuzz image, and where a
+# cached checkout is mounted in it.
+IMAGE_SOURCE_ROOT = '/src/monero/monero'
+IMAGE_CACHED_SOURCE_ROOT = '/cached-src'
+
+
+class Toolchain:
+    """LLVM tools run on the files of `workdir`. With `llvm_bin`, the tools
+    in that directory run natively, otherwise the ones in the OSS-Fuzz
+    image do. `source_dir` is a local monero checkout to read sources
+    from instead of the one at IMAGE_SOURCE_ROOT."""
+
+    def __init__(self, workdir, llvm_bin=None, source_dir=None):
+        self.workdir = os.path.abspath(workdir)
+        self.llvm_bin = llvm_bin
+        self.source_dir = os.path.abspath(source_dir) if source_dir else None
+
+    @property
+    def native(self) -> bool:
+        return self.llvm_bin is not None
+
+    def path(self, name) -> str:
+        """Path of workdir file `name` as seen by the tools."""
+        if self.native:
+            return os.path.join(self.workdir, name)
+        return os.path.join('/data', name)
+
+    def source(self, name='') -> str:
+        """Path of `name`, relative to the monero checkout, as seen by the
+        tools after path remapping."""
+        if self.source_dir is None:
+            root = IMAGE_SOURCE_ROOT
+        elif self.native:
+            root = self.source_dir
+        else:
+            root = IMAGE_CACHED_SOURCE_ROOT
+        return os.path.join(root, name) if name else root
+
+    def needs_submodules(self) -> bool:
+        """Whether the sources are the image's, whose submodules have to
+        be fetched before rendering them."""
+        return not self.native and not self.source_dir
+
+    def coverage_args(self) -> list[str]:
+        """llvm-cov arguments mapping the build paths to the sources."""
+        if self.source_dir is None:
+            return []
+        return [f'-path-equivalence={IMAGE_SOURCE_ROOT},{self.source()}']
+
+    def run(self, tool, args, stdout=None, setup=None, outputs=()):
+        """Runs LLVM tool `tool` with `args`. In Docker, the shell command
+        `setup` runs first, and the workdir files in `outputs` are handed
+        to the current user afterwards. Raises CalledProcessError if the
+        tool fails."""
+        if self.native:
+            subprocess.run([os.path.join(self.llvm_bin, tool), *args],
+                           check=True,
+                           stdout=stdout)
+            return
+
+        script = f'{setup} && ' if setup else ''
+        script += f'cd {self.source()} && {tool} "$@"; status=$?; '
+        for name in outputs:
+            script += (f'chown -R {os.getuid()}:{os.getgid()} '
+                       f'{self.path(name)}; ')
+        script += 'exit $status'
+        command = ['docker', 'run', '--rm', '-v', f'{self.workdir}:/data']
+        if self.source_dir:
+            command += [
+                '-v', f'{self.source_dir}:{IMAGE_CACHED_SOURCE_ROOT}:ro'
+            ]
+        command += [OSS_FUZZ_IMAGE, 'bash', '-c', script, tool, *args]
+        subprocess.run(command, check=True, stdout=stdout)
@@ -0,0 +1,120 @@
+"""Timing spans around the phases of a fuzzing iteration.
+
+Spans are aggregated per phase (calls and total time) and, when recording
+events, kept for export as Chrome trace-event JSON, which chrome://tracing
+and Perfetto open. Spans nest, so a phase's time includes the phases run
+inside it. While disabled, span() returns a shared no-op context manager,
+well under a microsecond per span against about a millisecond per
+request."""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Set by enable(), see e2e.py --trace and --chrome-trace.
+enabled = False
+# {phase: [calls, total nanoseconds, max nanoseconds]}
+phases = {}
+# (phase, start ns, duration ns, thread id) of every span while recording
+# events, None otherwise.
+events = None
+# Spans kept for the Chrome trace at most, later ones are only counted.
+MAX_EVENTS = 500_000
+dropped_events = 0
+
+_DISABLED = contextlib.nullcontext()
+
+
+def enable(record_events=False):
+    """Turns spans on, keeping every span for write_chrome_trace if
+    `record_events`."""
+    global enabled, events
+    enabled = True
+    if record_events and events is None:
+        events = []
+
+
+class Span:
+    """Times one phase between __enter__ and __exit__ on the monotonic
+    perf_counter clock."""
+    __slots__ = ('phase', 'start')
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter_ns() - self.start
+        totals = phases.get(self.phase)
+        if totals is None:
+            phases[self.phase] = [1, duration, duration]
+        else:
+            totals[0] += 1
+            totals[1] += duration
+            if duration > totals[2]:
+                totals[2] = duration
+        if events is not None:
+            if len(events) < MAX_EVENTS:
+                events.append((self.phase, self.start, duration,
+                               threading.get_native_id()))
+            else:
+                global dropped_events
+                dropped_events += 1
+        return False
+
+
+def span(phase):
+    """Returns a context manager timing `phase`, a no-op while disabled."""
+    if enabled:
+        return Span(phase)
+    return _DISABLED
+
+
+def stats() -> dict:
+    """Returns the calls and seconds per phase, to add to the campaign
+    stats. Both sum over --jobs workers."""
+    return {
+        'phase_calls': {phase: totals[0] for phase, totals in phases.items()},
+        'phase_seconds': {
+            phase: totals[1] / 1e9 for phase, totals in phases.items()
+        },
+    }
+
+
+def print_phases():
+    """Prints the calls, mean and max duration and total time per phase,
+    longest total first."""
+    print('Phases:')
+    for phase, (calls, total, longest) in sorted(phases.items(),
+                                                 key=lambda item: -item[1][1]):
+        print('  %-32s %8d calls  mean %9.1f us  max %9.1f us  total %8.3f s' %
+              (phase, calls, total / calls / 1e3, longest / 1e3, total / 1e9))
+
+
+def write_chrome_trace(path):
+    """Writes the recorded spans as Chrome trace-event JSON."""
+    pid = os.getpid()
+    trace_events = [{
+        'name': phase,
+        'ph': 'X',
+        'ts': start / 1e3,
+        'dur': duration / 1e3,
+        'pid': pid,
+        'tid': tid,
+    } for phase, start, duration, tid in events or ()]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(
+            {
+                'traceEvents': trace_events,
+                'displayTimeUnit': 'ms',
+                'otherData': {
+                    'dropped_events': dropped_events
+                },
+            }, f)
+    print(f'Chrome trace with {len(trace_events)} spans written to {path}')
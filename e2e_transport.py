@@ -0,0 +1,303 @@
+"""Keep-alive HTTP transport used for talking to the monerod RPC server."""
+
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import time
+
+# Errors raised when monerod closed a kept-alive socket under us. Requests
+# that hit one of these on a reused connection are retried on a new one.
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+
+class TransportError(Exception):
+    """Raised when a request could not be completed."""
+
+
+class Timeout(TransportError):
+    """Raised when monerod did not answer within the given timeout."""
+
+
+class Response:
+    """Minimal response object returned by the transport."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+
+class _NoDelayHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection with Nagle's algorithm disabled. Kept-alive sockets
+    otherwise stall on delayed ACKs whenever a request is split over
+    several writes."""
+
+    def connect(self):
+        super().connect()
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class PooledConnection:
+    """A single persistent HTTP connection along with its reuse stats."""
+
+    def __init__(self, conn_id, host, port):
+        self.conn_id = conn_id
+        self.conn = _NoDelayHTTPConnection(host, port)
+        self.requests = 0
+        self.reuses = 0
+        self.reconnects = 0
+        self.created = time.monotonic()
+
+    def reconnect(self):
+        self.conn.close()
+        self.reconnects += 1
+
+    def stats(self) -> dict:
+        return {
+            'id': self.conn_id,
+            'requests': self.requests,
+            'reuses': self.reuses,
+            'reconnects': self.reconnects,
+            'age': time.monotonic() - self.created,
+        }
+
+
+class ConnectionPool:
+    """Thread-safe pool of persistent HTTP connections to one host.
+
+    Connections are created lazily, up to `maxsize` of them, and returned
+    to the pool after every request so consecutive requests reuse the same
+    TCP connection instead of paying connect/teardown every time."""
+
+    def __init__(self, host='127.0.0.1', port=38081, maxsize=4):
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self._idle = []
+        self._all = []
+        self._lock = threading.Lock()
+        self._available = threading.Semaphore(maxsize)
+
+    def _acquire(self) -> PooledConnection:
+        self._available.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            pooled = PooledConnection(len(self._all), self.host, self.port)
+            self._all.append(pooled)
+            return pooled
+
+    def _release(self, pooled):
+        with self._lock:
+            self._idle.append(pooled)
+        self._available.release()
+
+    def _do_request(self, pooled, path, body, headers, timeout) -> Response:
+        conn = pooled.conn
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.request('POST', path, body=body, headers=headers)
+        resp = conn.getresponse()
+        content = resp.read()
+        if resp.will_close:
+            conn.close()
+        return Response(resp.status, dict(resp.getheaders()), content)
+
+    def post(self, path, json_body=None, data=None, headers=None,
+             timeout=None) -> Response:
+        """POST to `path` on the pooled host. Either `json_body` or `data`
+        is used as the body. Raises Timeout or TransportError."""
+        if not path.startswith('/'):
+            path = '/' + path
+        headers = dict(headers or {})
+        if json_body is not None:
+            data = json.dumps(json_body).encode('utf-8')
+            headers.setdefault('Content-Type', 'application/json')
+        elif data is None:
+            data = b''
+
+        pooled = self._acquire()
+        try:
+            reused = pooled.conn.sock is not None
+            pooled.requests += 1
+            if reused:
+                pooled.reuses += 1
+            try:
+                return self._do_request(pooled, path, data, headers, timeout)
+            except _STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # Monerod dropped the kept-alive socket, retry once on a
+                # fresh connection.
+                pooled.reconnect()
+                return self._do_request(pooled, path, data, headers, timeout)
+        except socket.timeout as e:
+            # A late response would otherwise be read by the next request.
+            pooled.conn.close()
+            raise Timeout(str(e)) from e
+        except (OSError, http.client.HTTPException) as e:
+            pooled.conn.close()
+            raise TransportError(str(e)) from e
+        finally:
+            self._release(pooled)
+
+    def stats(self) -> list[dict]:
+        """Returns reuse statistics for every connection in the pool."""
+        with self._lock:
+            return [pooled.stats() for pooled in self._all]
+
+    def close(self):
+        """Closes all sockets, they are reopened on the next request."""
+        with self._lock:
+            for pooled in self._all:
+                pooled.conn.close()
+
+
+class _AsyncConnection:
+    """A persistent HTTP/1.1 connection driven by asyncio streams."""
+
+    def __init__(self, conn_id):
+        self.conn_id = conn_id
+        self.reader = None
+        self.writer = None
+        self.requests = 0
+        self.reuses = 0
+        self.reconnects = 0
+        self.created = time.monotonic()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+    def stats(self) -> dict:
+        return {
+            'id': self.conn_id,
+            'requests': self.requests,
+            'reuses': self.reuses,
+            'reconnects': self.reconnects,
+            'age': time.monotonic() - self.created,
+        }
+
+
+class AsyncConnectionPool:
+    """asyncio counterpart of ConnectionPool, allowing up to `maxsize`
+    requests to be in flight on separate kept-alive connections."""
+
+    def __init__(self, host='127.0.0.1', port=38081, maxsize=4):
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self._idle = []
+        self._all = []
+        self._available = asyncio.Semaphore(maxsize)
+
+    async def _do_request(self, pooled, path, body, headers) -> Response:
+        if pooled.writer is None:
+            pooled.reader, pooled.writer = await asyncio.open_connection(
+                self.host, self.port)
+            sock = pooled.writer.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        head = [f'POST {path} HTTP/1.1', f'Host: {self.host}:{self.port}']
+        head.extend(f'{key}: {value}' for key, value in headers.items())
+        head.append(f'Content-Length: {len(body)}')
+        pooled.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') +
+                            body)
+        await pooled.writer.drain()
+
+        status_line = await pooled.reader.readline()
+        if not status_line:
+            raise http.client.RemoteDisconnected(
+                'Remote end closed connection without response')
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise http.client.BadStatusLine(status_line)
+
+        resp_headers = {}
+        while True:
+            line = await pooled.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            resp_headers[key.strip()] = value.strip()
+
+        lowered = {key.lower(): value for key, value in resp_headers.items()}
+        if 'content-length' in lowered:
+            content = await pooled.reader.readexactly(
+                int(lowered['content-length']))
+        else:
+            content = await pooled.reader.read()
+            pooled.close()
+        if lowered.get('connection', '').lower() == 'close':
+            pooled.close()
+        return Response(int(parts[1]), resp_headers, content)
+
+    async def post(self, path, json_body=None, data=None, headers=None,
+                   timeout=None) -> Response:
+        """Same as ConnectionPool.post but awaitable."""
+        if not path.startswith('/'):
+            path = '/' + path
+        headers = dict(headers or {})
+        if json_body is not None:
+            data = json.dumps(json_body).encode('utf-8')
+            headers.setdefault('Content-Type', 'application/json')
+        elif data is None:
+            data = b''
+
+        async with self._available:
+            if self._idle:
+                pooled = self._idle.pop()
+            else:
+                pooled = _AsyncConnection(len(self._all))
+                self._all.append(pooled)
+            try:
+                reused = pooled.writer is not None
+                pooled.requests += 1
+                if reused:
+                    pooled.reuses += 1
+                try:
+                    return await asyncio.wait_for(
+                        self._do_request(pooled, path, data, headers),
+                        timeout)
+                except (_STALE_CONNECTION_ERRORS +
+                        (asyncio.IncompleteReadError,)):
+                    if not reused:
+                        raise
+                    pooled.close()
+                    pooled.reconnects += 1
+                    return await asyncio.wait_for(
+                        self._do_request(pooled, path, data, headers),
+                        timeout)
+            except asyncio.TimeoutError as e:
+                pooled.close()
+                raise Timeout(f'timed out after {timeout} seconds') from e
+            except (OSError, http.client.HTTPException,
+                    asyncio.IncompleteReadError, ValueError) as e:
+                pooled.close()
+                raise TransportError(str(e)) from e
+            finally:
+                self._idle.append(pooled)
+
+    def stats(self) -> list[dict]:
+        """Returns reuse statistics for every connection in the pool."""
+        return [pooled.stats() for pooled in self._all]
+
+    def close(self):
+        for pooled in self._all:
+            pooled.close()
@@ -1,3 +1,5 @@
+#include <cctype>
+#include <cstdint>
 #include <iostream>
 #include <fstream>
 #include <sstream>
@@ -6,19 +8,54 @@
 #include <functional>
 
 #include "storages/portable_storage_template_helper.h"
+#include "string_tools.h"
 #include "rpc/core_rpc_server_commands_defs.h"
 
 using namespace cryptonote;
 
 namespace {
 
-// Generic binary serialiser for a given request structure
+// Blob fields of the request structures. JSON has no byte strings, so
+// these may be given as hex, which is decoded when it holds whole hashes.
+// Any other string is loaded as raw bytes, as epee does.
+const char* const hex_blob_fields[] = {"block_ids", "txid"};
+
+bool is_hash_hex(const std::string& value) {
+    if (value.empty() || value.size() % (2 * sizeof(crypto::hash)) != 0) {
+        return false;
+    }
+    for (const char c : value) {
+        if (!std::isxdigit(static_cast<unsigned char>(c))) {
+            return false;
+        }
+    }
+    return true;
+}
+
+void decode_hex_blobs(epee::serialization::portable_storage& storage) {
+    for (const char* name : hex_blob_fields) {
+        std::string value;
+        std::string blob;
+        if (storage.get_value(name, value, nullptr) && is_hash_hex(value) &&
+            epee::string_tools::parse_hexstr_to_binbuff(value, blob)) {
+            storage.set_value(name, std::move(blob), nullptr);
+        }
+    }
+}
+
+// Generic binary serialiser for a given request structure, loading the
+// JSON like epee::serialization::load_t_from_json after decoding hex blobs
 template <typename T>
 epee::byte_slice generate_binary_from_json(const std::string& json_input_text) {
     T request_object;
-    if (!epee::serialization::load_t_from_json(request_object, json_input_text)) {
+    epee::serialization::portable_storage storage;
+    if (!storage.load_from_json(json_input_text)) {
         throw std::runtime_error("Failed to parse JSON input.");
     }
+    decode_hex_blobs(storage);
+    if (!request_object.load(storage)) {
+        throw std::runtime_error("Failed to load JSON input.");
+    }
     return epee::serialization::store_t_to_binary(request_object);
 }
 
@@ -32,11 +69,88 @@ const std::unordered_map<std::string, std::function<epee::byte_slice(const std::
     {"/get_output_distribution.bin", generate_binary_from_json<COMMAND_RPC_GET_OUTPUT_DISTRIBUTION::request>}
 };
 
+// Frame status codes written in front of every server mode response
+enum frame_status : uint8_t {
+    FRAME_OK = 0,
+    FRAME_UNKNOWN_ENDPOINT = 2,
+    FRAME_SERIALISATION_ERROR = 4
+};
+
+bool read_u32(std::istream& in, uint32_t& value) {
+    unsigned char bytes[4];
+    if (!in.read(reinterpret_cast<char*>(bytes), sizeof(bytes))) {
+        return false;
+    }
+    value = uint32_t(bytes[0]) | (uint32_t(bytes[1]) << 8) |
+            (uint32_t(bytes[2]) << 16) | (uint32_t(bytes[3]) << 24);
+    return true;
+}
+
+bool read_string(std::istream& in, std::string& value) {
+    uint32_t size = 0;
+    if (!read_u32(in, size)) {
+        return false;
+    }
+    value.resize(size);
+    return size == 0 || bool(in.read(&value[0], size));
+}
+
+void write_frame(std::ostream& out, frame_status status, const void* data, uint32_t size) {
+    const unsigned char header[5] = {
+        static_cast<unsigned char>(status),
+        static_cast<unsigned char>(size & 0xff),
+        static_cast<unsigned char>((size >> 8) & 0xff),
+        static_cast<unsigned char>((size >> 16) & 0xff),
+        static_cast<unsigned char>((size >> 24) & 0xff)
+    };
+    out.write(reinterpret_cast<const char*>(header), sizeof(header));
+    out.write(reinterpret_cast<const char*>(data), size);
+}
+
+// Server mode: reads (endpoint, json) frames from stdin until EOF and
+// answers each with a (status, payload) frame on stdout. Every string is
+// prefixed with its little endian uint32 length. On error the payload is
+// the error message.
+int run_server() {
+    std::ios::sync_with_stdio(false);
+    // Reading from std::cin flushes a tied std::cout, which would undo the
+    // batching below.
+    std::cin.tie(nullptr);
+    std::string endpoint;
+    std::string json_input_text;
+    while (read_string(std::cin, endpoint) && read_string(std::cin, json_input_text)) {
+        const auto& handler = binary_serialisers.find(endpoint);
+        if (handler == binary_serialisers.end()) {
+            const std::string error = "Unsupported or unknown endpoint: " + endpoint;
+            write_frame(std::cout, FRAME_UNKNOWN_ENDPOINT, error.data(), error.size());
+        } else {
+            try {
+                epee::byte_slice binary_output = handler->second(json_input_text);
+                write_frame(std::cout, FRAME_OK, binary_output.data(), binary_output.size());
+            } catch (const std::exception& ex) {
+                const std::string error = std::string("Serialisation error: ") + ex.what();
+                write_frame(std::cout, FRAME_SERIALISATION_ERROR, error.data(), error.size());
+            }
+        }
+        // Only flush once all queued requests are answered, so a batch
+        // of requests is answered with few writes.
+        if (std::cin.rdbuf()->in_avail() <= 0) {
+            std::cout.flush();
+        }
+    }
+    return 0;
+}
+
 } // namespace
 
 int main(int argc, char* argv[]) {
+    if (argc == 2 && std::string(argv[1]) == "--server") {
+        return run_server();
+    }
+
     if (argc != 4) {
         std::cerr << "Usage: " << argv[0] << " <input_json_path> <endpoint> <output_bin_path>" << std::endl;
+        std::cerr << "       " << argv[0] << " --server" << std::endl;
         return 1;
     }
 